@@ -22,11 +22,13 @@ import numpy as np
 #import string as st
 
 class BCs():
-    def __init__(self, BC_dict, dx, dy, domain):
+    def __init__(self, BC_dict, dx, dy, domain, metrics, kernels):
         self.BCs=BC_dict
         self.dx,self.dy=dx,dy
-        self.X=np.empty_like(dx)
         self.domain=domain
+        self.metrics=metrics # Geometric stencil coefficients
+        self.kernels=kernels # Compute kernels
+        self.work=kernels.work # Workspace buffers
         
     # Ablation considerations (basic)
     def flux_abl(self, T, E, dt, h, q):
@@ -40,7 +42,7 @@ class BCs():
 #        return E
     
     # Energy BCs
-    def Energy(self, E, T_prev, dt, rhoC, hx, hy):
+    def Energy(self, E, T_prev, dt, rhoC):
         # Left face
         for i in range(len(self.BCs['bc_left_E'])/3):
             st=self.BCs['bc_left_E'][2+3*i][0]
@@ -51,13 +53,13 @@ class BCs():
             elif self.domain!='Axisymmetric':
                 if self.BCs['bc_left_E'][3*i]=='F':
                     q=self.BCs['bc_left_E'][1+3*i]
-                    Bi=0
+                    h=0
                     
                 else:
-                    q=self.BCs['bc_left_E'][1+3*i][0]*self.BCs['bc_left_E'][1+3*i][1] # h*Tinf
-                    Bi=-self.BCs['bc_left_E'][1+3*i][0]*T_prev[st:en,0] # h*Tij
+                    h=self.BCs['bc_left_E'][1+3*i][0]
+                    q=h*self.BCs['bc_left_E'][1+3*i][1] # h*Tinf
                 
-                E[st:en,0]+=(Bi+q)*dt/hx[st:en,0]
+                self.kernels.bc_flux(E[st:en,0], q, h, T_prev[st:en,0], dt, self.metrics.A_left[st:en])
                 
                 
         # Right face
@@ -70,17 +72,13 @@ class BCs():
             else:
                 if self.BCs['bc_right_E'][3*i]=='F':
                     q=self.BCs['bc_right_E'][1+3*i]
-                    Bi=0
+                    h=0
                     
                 else:
-                    q=self.BCs['bc_right_E'][1+3*i][0]*self.BCs['bc_right_E'][1+3*i][1] # h*Tinf
-                    Bi=-self.BCs['bc_right_E'][1+3*i][0]*T_prev[st:en,-1] # h*Tij
+                    h=self.BCs['bc_right_E'][1+3*i][0]
+                    q=h*self.BCs['bc_right_E'][1+3*i][1] # h*Tinf
                 
-                if self.domain=='Axisymmetric':
-                    E[st:en,-1]+=(Bi+q)*dt*self.X[st:en,-1]\
-                        /hx[st:en,-1]/(self.X[st:en,-1]-self.dx[st:en,-2])
-                else:
-                    E[st:en,-1]+=(Bi+q)*dt/hx[st:en,-1]
+                self.kernels.bc_flux(E[st:en,-1], q, h, T_prev[st:en,-1], dt, self.metrics.A_right_flux[st:en])
                 
         # South face
         for i in range(len(self.BCs['bc_south_E'])/3):
@@ -92,13 +90,13 @@ class BCs():
             else:
                 if self.BCs['bc_south_E'][3*i]=='F':
                     q=self.BCs['bc_south_E'][1+3*i]
-                    Bi=0
+                    h=0
                     
                 else:
-                    q=self.BCs['bc_south_E'][1+3*i][0]*self.BCs['bc_south_E'][1+3*i][1] # h*Tinf
-                    Bi=-self.BCs['bc_south_E'][1+3*i][0]*T_prev[0,st:en] # h*Tij
+                    h=self.BCs['bc_south_E'][1+3*i][0]
+                    q=h*self.BCs['bc_south_E'][1+3*i][1] # h*Tinf
                 
-                E[0,st:en]+=(Bi+q)*dt/hy[0,st:en]
+                self.kernels.bc_flux(E[0,st:en], q, h, T_prev[0,st:en], dt, self.metrics.A_south[st:en])
                 
         # North face
         for i in range(len(self.BCs['bc_north_E'])/3):
@@ -110,34 +108,51 @@ class BCs():
             else:
                 if self.BCs['bc_north_E'][3*i]=='F':
                     q=self.BCs['bc_north_E'][1+3*i]
-                    Bi=0
+                    h=0
                     
                 else:
-                    q=self.BCs['bc_north_E'][1+3*i][0]*self.BCs['bc_north_E'][1+3*i][1] # h*Tinf
-                    Bi=-self.BCs['bc_north_E'][1+3*i][0]*T_prev[-1,st:en] # h*Tij
+                    h=self.BCs['bc_north_E'][1+3*i][0]
+                    q=h*self.BCs['bc_north_E'][1+3*i][1] # h*Tinf
                 
-                E[-1,st:en]+=(Bi+q)*dt/hy[-1,st:en]
+                self.kernels.bc_flux(E[-1,st:en], q, h, T_prev[-1,st:en], dt, self.metrics.A_north[st:en])
 #                E[T_prev>800]-=(Bi+q)*dt/hy[T_prev>800]*1.1
 #                E[-1,st:en]=self.flux_abl(T_prev[-1,st:en], E[-1,st:en], dt, hy[-1,st:en], Bi+q)
 #                self.flux_abl(T_prev[-1,st:en], E[-1,st:en], dt, hy[-1,st:en], Bi+q)
                 
         # Apply radiation BCs
         if self.BCs['bc_left_rad']!='None' and self.domain!='Axisymmetric':
-            E[:,0]+=dt/hx[:,0]*\
-                self.BCs['bc_left_rad'][0]*5.67*10**(-8)*\
-                (self.BCs['bc_left_rad'][1]**4-T_prev[:,0]**4)
+            self.kernels.bc_rad(E[:,0], self.BCs['bc_left_rad'][0], self.BCs['bc_left_rad'][1],\
+                                 T_prev[:,0], dt, self.metrics.A_left)
         if self.BCs['bc_right_rad']!='None':
-            E[:,-1]+=dt/hx[:,-1]*\
-                self.BCs['bc_right_rad'][0]*5.67*10**(-8)*\
-                (self.BCs['bc_right_rad'][1]**4-T_prev[:,-1]**4)
+            self.kernels.bc_rad(E[:,-1], self.BCs['bc_right_rad'][0], self.BCs['bc_right_rad'][1],\
+                                 T_prev[:,-1], dt, self.metrics.A_right)
         if self.BCs['bc_south_rad']!='None':
-            E[0,:]+=dt/hy[0,:]*\
-                self.BCs['bc_south_rad'][0]*5.67*10**(-8)*\
-                (self.BCs['bc_south_rad'][1]**4-T_prev[0,:]**4)
+            self.kernels.bc_rad(E[0,:], self.BCs['bc_south_rad'][0], self.BCs['bc_south_rad'][1],\
+                                 T_prev[0,:], dt, self.metrics.A_south)
         if self.BCs['bc_north_rad']!='None':
-            E[-1,:]+=dt/hy[-1,:]*\
-                self.BCs['bc_north_rad'][0]*5.67*10**(-8)*\
-                (self.BCs['bc_north_rad'][1]**4-T_prev[-1,:]**4)
+            self.kernels.bc_rad(E[-1,:], self.BCs['bc_north_rad'][0], self.BCs['bc_north_rad'][1],\
+                                 T_prev[-1,:], dt, self.metrics.A_north)
+    
+    # Nodes held at a temperature by energy BCs ('T'); list of (index, T)
+    def fixed_T(self):
+        nodes=[]
+        faces=[('bc_left_E', lambda st,en: np.s_[st:en,0]),\
+               ('bc_right_E', lambda st,en: np.s_[st:en,-1]),\
+               ('bc_south_E', lambda st,en: np.s_[0,st:en]),\
+               ('bc_north_E', lambda st,en: np.s_[-1,st:en])]
+        for key,face in faces:
+            for i in range(len(self.BCs[key])/3):
+                if self.BCs[key][3*i]=='T':
+                    st,en=self.BCs[key][2+3*i]
+                    nodes.append((face(st,en), self.BCs[key][1+3*i]))
+        return nodes
+    
+    # Energy at nodes held at a temperature (E=T*rhoC)
+    def Energy_fixed(self, E, rhoC, nodes=None):
+        if nodes is None:
+            nodes=self.fixed_T()
+        for index,T in nodes:
+            E[index]=T*rhoC[index]
     
     # Conservation of mass BCs
     def mass(self, m, P, Ax, Ay, vol):
@@ -190,9 +205,12 @@ class BCs():
     
     # Pressure BCs (eventually lead to momentum)
     def P(self, P, R, T):
-        eflx=np.zeros_like(P)
-        efly=np.zeros_like(P)
-        P_0=np.zeros_like(P)
+        eflx=self.work.get('bc_eflx')
+        efly=self.work.get('bc_efly')
+        P_0=self.work.get('bc_P_0')
+        eflx.fill(0)
+        efly.fill(0)
+        P_0.fill(0)
         # Left face
         for i in range(len(self.BCs['bc_left_P'])/3):
             st=self.BCs['bc_left_P'][2+3*i][0]
@@ -259,7 +277,7 @@ class BCs():
         eflx[-1,-1]=0
         
         # Only permit mass to leave
-        eflx[eflx>0]=0
-        efly[efly>0]=0
+        np.minimum(eflx, 0, out=eflx)
+        np.minimum(efly, 0, out=efly)
         
         return eflx, efly
\ No newline at end of file
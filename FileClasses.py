@@ -10,6 +10,8 @@
 This file contains classes for reading and writing files in proper format:
     -write input file with domain and solver settings
     -read input file as input to solver
+    -read variable data saved as .npy files or in one snapshot file per time
+    (Data_[time].npy; written in parallel with MPI-IO)
 
 """
 
@@ -18,16 +20,19 @@ This file contains classes for reading and writing files in proper format:
 keys_Settings=['MPI_Processes','MPI_arrangment','Domain','Length','Width',\
                'Nodes_x','Nodes_y','Model','k_s','k_model','Cv_s','rho_IC',\
                'Darcy_mu', 'Carmen_diam','Kozeny_const','Porosity', 'gas_constant',\
-               'diff_interpolation', 'conv_interpolation','Temperature_IC']
+               'diff_interpolation', 'conv_interpolation','Temperature_IC',\
+               'Kernel_backend','Ghost_width','Threads','Shared_processes',\
+               'Property_tolerance']
 
 keys_mesh=['bias_type_x','bias_size_x','bias_type_y','bias_size_y']
                
-keys_Sources=['Source_Uniform','Source_Kim','Ea','A0','dH', 'Ignition', 'gas_gen']
+keys_Sources=['Source_Uniform','Source_Kim','Ea','A0','dH', 'Ignition', 'gas_gen', 'Kinetics', 'Mechanism']
 
 keys_Species=['Cv_g','Cp_g','k_g']
 
 keys_Time_adv=['Fo','CFL','dt','total_time_steps', 'total_time','Restart',\
-               'Time_Scheme','Convergence','Max_iterations','Number_Data_Output']
+               'Time_Scheme','Convergence','Max_iterations','Number_Data_Output',\
+               'Output_format','Step_reduction','Load_balance']
 
 keys_BCs=     ['bc_left_E','bc_right_E','bc_south_E','bc_north_E',\
               'bc_left_rad','bc_right_rad','bc_south_rad','bc_north_rad',\
@@ -37,6 +42,8 @@ keys_BCs=     ['bc_left_E','bc_right_E','bc_south_E','bc_north_E',\
 newline_check='\n' # This should be \n for Windows, \r for Ubuntu
 
 import string as st
+import numpy as np
+import os
 
 class FileOut():
     def __init__(self, filename, isBin):
@@ -160,7 +167,7 @@ class FileIn():
                 line=st.split(line, ':')
                 # Domain settings
                 if line[0] in keys_Settings:
-                    if line[0]=='Nodes_x' or line[0]=='Nodes_y':
+                    if line[0] in ['Nodes_x','Nodes_y','Ghost_width','Threads','Shared_processes']:
                         settings[line[0]]=int(line[1])
                     else:
                         try:
@@ -190,7 +197,8 @@ class FileIn():
                 # Time advancement details
                 elif line[0] in keys_Time_adv:
                     if line[0]=='Time_Scheme' or st.find(line[1], 'None')>=0\
-                        or line[0]=='Restart':
+                        or line[0]=='Restart' or line[0]=='Output_format'\
+                        or line[0]=='Step_reduction' or line[0]=='Load_balance':
                         settings[line[0]]=st.split(line[1], newline_check)[0]
                     elif line[0]=='total_time_steps' or line[0]=='Max_iterations'\
                         or line[0]=='Number_Data_Output':
@@ -232,4 +240,33 @@ class FileIn():
                         
                         i+=1
                     
-        self.fin.close()
\ No newline at end of file
+        self.fin.close()
+
+# Read variable saved at given time; from its own .npy file if present, 
+# otherwise from snapshot file of that time
+def load_data(name, time):
+    if os.path.exists(name+'_'+time+'.npy'):
+        return np.load(name+'_'+time+'.npy', False)
+    return read_snapshot('Data_'+time+'.npy', name)
+
+# Read one variable from snapshot file; file is a sequence of .npy arrays 
+# (np.load on file gives first, T) with names of variables as last array
+def read_snapshot(filename, name):
+    fin=open(filename, 'rb')
+    size=os.fstat(fin.fileno()).st_size
+    # Skip through arrays reading only headers
+    start=[]
+    while fin.tell()<size:
+        start.append(fin.tell())
+        version=np.lib.format.read_magic(fin)
+        if version==(1,0):
+            shape,fortran_order,dtype=np.lib.format.read_array_header_1_0(fin)
+        else:
+            shape,fortran_order,dtype=np.lib.format.read_array_header_2_0(fin)
+        fin.seek(int(np.prod(shape))*dtype.itemsize, 1)
+    fin.seek(start[-1])
+    names=list(np.load(fin))
+    fin.seek(start[names.index(name)])
+    var=np.load(fin)
+    fin.close()
+    return var
@@ -11,10 +11,13 @@ This file contains the 2D planar and axisymmetric domain classes:
     -holds thermal properties at each node
     -holds x and y coordinate arrays
     -holds dx and dy discretization arrays
-    -calculates thermal properties
+    -calculates thermal properties (constant, extent of reaction or
+     temperature dependent; re-evaluated only where temperature changed)
     -meshing function (biasing feature not functional in solver)
     -function to return temperature given conservative variable (energy)
     -calculate CV 'volume' at each node
+    -geometric stencil coefficients (face area/CV volume ratios)
+    -workspace of persistent scratch arrays for in-place calculations
 
 Requires:
     -length and width of domain
@@ -28,6 +31,13 @@ of using with 2D Compressible Navier-Stokes solver.
 import numpy as np
 import string as st
 from MatClasses import Cp, therm_cond
+import KernelClasses
+
+# Array of this process filled by fill(array)
+def local_array(shape, fill):
+    var=np.empty(shape)
+    fill(var)
+    return var
 
 class TwoDimDomain():
     def __init__(self, settings, Species, solver, rank):
@@ -43,6 +53,8 @@ class TwoDimDomain():
         self.model=settings['Model']
         self.type=solver
         self.porosity_0=settings['Porosity']
+        self.backend=settings.get('Kernel_backend', 'NumPy')
+        self.threads=settings.get('Threads', 1)
         self.rank=rank
         
         # Variables for conservation equations
@@ -84,6 +96,14 @@ class TwoDimDomain():
         # Object declarations for property calculations
         self.Cp_calc=Cp()
         self.k_calc=therm_cond()
+        tol=settings.get('Property_tolerance', 0)
+        self.Cv_s=Property('Cv_s', self.Cv, self.Cp_calc.get_Cv, tol)
+        self.k_s=Property('k_s', self.k, self.k_calc.get_k, tol)
+        if self.model=='Species':
+            self.Cv_gas=Property('Cv_g', self.Cv_g, self.Cp_calc.get_Cv, tol)
+            self.Cp_gas=Property('Cp', self.Cp_g, self.Cp_calc.get_Cp, tol)
+            self.k_gas=Property('k_g', self.k_g, self.k_calc.get_k, tol)
+        self.props_valid=False # Properties evaluated for current state
         
         # Biasing options       
         self.xbias=[settings['bias_type_x'], settings['bias_size_x']]
@@ -97,9 +117,15 @@ class TwoDimDomain():
         self.proc_bottom=-1
         self.proc_arrang=0 # Array holding process arrangment in domain
         self.proc_row=0 # Row number where rank is in proc_arrang
+        self.proc_col=0 # Column number where rank is in proc_arrang
+        self.x_split=0 # Global node where each process column starts (and Nodes_x)
+        self.y_split=0 # Global node where each process row starts (and Nodes_y)
+        self.ghost=1 # Ghost node layers on sides with a neighbouring process
         
     # Discretize domain and save dx and dy
-    def mesh(self):
+    # node_array(shape, fill): allocates 2D global arrays (e.g. once per node, 
+    # mpi_routines); own array per process if not given
+    def mesh(self, node_array=None):
         # Discretize x
         if self.xbias[0]=='OneWayUp':
             smallest=self.xbias[1]
@@ -166,15 +192,23 @@ class TwoDimDomain():
             self.x[i+1]=self.x[i]+self.dx[i]
         for i in range(self.Ny-1):
             self.y[i+1]=self.y[i]+self.dy[i]
-        self.X,self.Y=np.meshgrid(self.x,self.y)
-        self.dX,self.dY=np.meshgrid(self.dx,self.dy)
+        if node_array is None:
+            node_array=local_array
+        shape=(self.Ny, self.Nx)
+        self.X=node_array(shape, lambda a: np.copyto(a, self.x))
+        self.Y=node_array(shape, lambda a: np.copyto(a, self.y[:,None]))
+        self.dX=node_array(shape, lambda a: np.copyto(a, self.dx))
+        self.dY=node_array(shape, lambda a: np.copyto(a, self.dy[:,None]))
         self.isMeshed=True
     
     # Define other variables for calculations after MPI
     def create_var(self, Species):
         self.eta=np.zeros_like(self.E) # extent of reaction
         self.P=np.zeros_like(self.E) # pressure
-        self.T_guess=np.ones_like(self.E)
+        self.work=Workspace(self.E.shape) # Scratch buffers for local subdomain
+        self.kernels=KernelClasses.get_kernels(self.backend, self.work, self.threads)
+        self.T_guess=self.work.get('T_guess')
+        self.T_guess.fill(1)
         self.porosity=np.ones_like(self.E)*self.porosity_0
         
         # Species
@@ -193,73 +227,79 @@ class TwoDimDomain():
                 /(self.kozeny*(1-self.porosity)**2)
         
     # Calculate and return the dimensions of control volumes
-    def CV_dim(self):
-        hx=np.zeros_like(self.E)
-        hy=np.zeros_like(self.E)
-        
+    # (node_array as in mesh)
+    def CV_dim(self, node_array=None):
+        if node_array is None:
+            node_array=local_array
+        hx=node_array(self.E.shape, self.CV_x)
+        hy=node_array(self.E.shape, self.CV_y)
+        return hx,hy
+    
+    def CV_x(self, hx):
         hx[:,1:-1]=0.5*(self.dX[:,1:-1]+self.dX[:,:-2])
         hx[:,0]=0.5*(self.dX[:,0])
         hx[:,-1]=0.5*(self.dX[:,-1])
-        
+    
+    def CV_y(self, hy):
         hy[1:-1,:]=0.5*(self.dY[1:-1,:]+self.dY[:-2,:])
         hy[0,:]=0.5*(self.dY[0,:])
         hy[-1,:]=0.5*(self.dY[-1,:])
-        
-        return hx,hy
+    
+    # Nodes owned by this process in local arrays (ghost node layers on 
+    # sides with a neighbouring process excluded)
+    def owned(self):
+        j0=self.ghost*int(self.proc_bottom>=0)
+        i0=self.ghost*int(self.proc_left>=0)
+        return np.s_[j0:j0+self.Ny, i0:i0+self.Nx]
     
     # Calculate temperature dependent properties
-    def calcProp(self, T_guess=300, init=False):
-        k=np.zeros_like(self.eta)
-        rho=np.zeros_like(self.eta)
-        rhoC=np.zeros_like(self.eta)
-        Cv=np.zeros_like(self.eta)
-        Cp=np.zeros_like(self.eta)
-        
-        ##########################################################################
-        # Specific heat of solid phase
-        ##########################################################################
-        
-        if (type(self.Cv) is list) and (self.Cv[0]=='eta'):
-            Cv=self.eta*float(self.Cv[2])+(1-self.eta)*float(self.Cv[1])
-        # Solid phase (temperature dependent for given element)
-        elif (type(self.Cv) is list) and (self.Cv[1]=='Temp'):
-            # Constant temperature value
-            if len(self.Cv)>2:
-                Cv=self.Cp_calc.get_Cv(np.ones_like(self.E)*float(self.Cv[2]), self.Cv[0])
-            # Temperature dependent
-            else:
-                Cv=self.Cp_calc.get_Cv(T_guess, self.Cv[0])
-        # Solid phase (constant)
-        else:
-            Cv[:,:]=self.Cv
+    # Results are written into workspace buffers (valid until next call)
+    # region: (slice, slice) to evaluate part of subdomain only (e.g. ghost 
+    # nodes once received); buffers outside region are left unchanged
+    # With several threads, whole subdomain is evaluated as row tiles
+    # Each property evaluated as its option depends on (Property); full 
+    # evaluation kept for output until state is advanced (temperature)
+    def calcProp(self, T_guess=300, init=False, region=None):
+        if region is None and self.kernels.threads>1:
+            tiles=self.kernels.row_tiles(self.E.shape)
+            if len(tiles)>1:
+                self.kernels.map_tiles(lambda t: \
+                    self.calcProp(T_guess, init, np.s_[t[0]:t[1],:]), tiles)
+                self.props_valid=not init
+                if init:
+                    return self.work.get('rhoC')
+                else:
+                    return self.work.get('T'), self.work.get('k'),\
+                        self.work.get('rhoC'), self.work.get('Cp')
+        r=Ellipsis
+        if region is not None:
+            r=region
+        work=self.work
+        k=work.get('k')[r]
+        rho=work.get('rho')[r]
+        rhoC=work.get('rhoC')[r]
+        T=work.get('T')[r]
+        tmp=work.get('prop_tmp')[r]
+        E=self.E[r]
+        eta=self.eta[r]
+        por=self.porosity[r]
+        if np.ndim(T_guess)>0:
+            T_guess=T_guess[r]
         
         ##########################################################################
-        # Thermal conductivity of solid phase (either model)
+        # Specific heat and thermal conductivity of solid phase (either model)
         ##########################################################################
         
-        # Solid phase (eta dependent)
-        if (type(self.k) is list) and (self.k[0]=='eta'):
-            k=self.eta*float(self.k[2])+(1-self.eta)*float(self.k[1])
-        
-        # Solid phase (temperature dependent for given element)
-        elif (type(self.k) is list) and (self.k[1]=='Temp'):
-            # Constant temperature value
-            if len(self.k)>2:
-                k=self.k_calc.get_k(np.ones_like(self.E)*float(self.k[2]), self.k[0])
-            # Temperature dependent
-            else:
-                k=self.k_calc.get_k(T_guess, self.k[0])
-        
-        # Solid phase (constant)
-        else:
-            k[:,:]=self.k
+        Cv=self.Cv_s.get(work, self.kernels, eta, T_guess, r)
+        np.copyto(k, self.k_s.get(work, self.kernels, eta, T_guess, r))
         
         ##########################################################################
         #  When species model is active
         ##########################################################################
         
         if self.model=='Species':
-            k_g=np.zeros_like(self.eta)
+            rho_g=self.rho_species[self.species_keys[0]][r]
+            rho_s=self.rho_species[self.species_keys[1]][r]
             # Changing porosity/permeability
 #            self.porosity=self.porosity_0+\
 #                (1-self.rho_species[self.species_keys[1]]/self.rho_0)*(1-self.porosity_0)
@@ -267,112 +307,219 @@ class TwoDimDomain():
 #                /(self.kozeny*(1-self.porosity)**2)
             
             # Heat capacity of Solid phase
-            rhoC=self.rho_species[self.species_keys[1]]*Cv
+            np.multiply(rho_s, Cv, out=rhoC)
 #            rhoC=self.rho*(1-self.porosity)*Cv # REPLICATE CASE 10 (CASE 10d,e)
             
             ##########################################################################
             #####  Heat capacity of Gas phase
             ##########################################################################
             
-            if (type(self.Cv_g) is list) and (self.Cv_g[0]=='eta'):
-                Cv=self.eta*float(self.Cv_g[2])+(1-self.eta)*float(self.Cv_g[1])
-            
-            # Gas phase (temperature dependent for given element)
-            elif (type(self.Cv_g) is list) and (self.Cv_g[1]=='Temp'):
-                # Constant temperature value
-                if len(self.Cv_g)>2:
-                    Cv=self.Cp_calc.get_Cv(np.ones_like(self.E)*float(self.Cv_g[2]), self.Cv_g[0])
-                # Temperature dependent
-                else:
-                    T_0=np.ones_like(self.eta)
-                    rhoc=rhoC.copy()
-                    T=np.ones_like(self.eta)*T_guess # Initial guess for temperature
-                    i=0
-                    while np.amax(np.abs(T_0-T)/T)>self.conv and i<self.max_iter:
-                        T_0=T.copy()
-                        Cv=self.Cp_calc.get_Cv(T, self.Cv_g[0])
-                        rhoc=rhoC+self.rho_species[self.species_keys[0]]*Cv
-                        T=self.E/rhoc
-                        i+=1
-                        if init:
-                            break
-                    if i>=self.max_iter:
-                        Cv=-10**9
-                        print('***** Unable to get converging temperature')
-            
-            # Gas phase (constant)
+            # Temperature dependent; iterated with temperature of mixture
+            if self.Cv_gas.depends=='T':
+                T_0=work.get('T_0')[r]
+                rhoc=work.get('rhoc')[r]
+                T_0.fill(1)
+                T[:,:]=T_guess # Initial guess for temperature
+                i=0
+                while self.rel_change(T_0, T, tmp)>self.conv and i<self.max_iter:
+                    np.copyto(T_0, T)
+                    Cv=self.Cv_gas.get(work, self.kernels, eta, T, r)
+                    np.multiply(rho_g, Cv, out=rhoc)
+                    rhoc+=rhoC
+                    np.divide(E, rhoc, out=T)
+                    i+=1
+                    if init:
+                        break
+                if i>=self.max_iter:
+                    Cv.fill(-10**9)
+                    self.Cv_gas.reset(work, r)
+                    print('***** Unable to get converging temperature')
             else:
-                Cv[:,:]=self.Cv_g
+                Cv=self.Cv_gas.get(work, self.kernels, eta, T_guess, r)
             
             # Temperature calculation
-            rhoC+=self.rho_species[self.species_keys[0]]*Cv
-            T=self.E/rhoC
-            self.T_guess=T
-            
-            ##########################################################################
-            #####  Specific heat (Cp) of Gas phase
-            ##########################################################################
-            # eta dependent
-            if (type(self.Cp_g) is list) and (self.Cp_g[0]=='eta'):
-                Cp=self.eta*float(self.Cp_g[2])+(1-self.eta)*float(self.Cp_g[1])
-            
-            # temperature dependent for given element
-            elif (type(self.Cp_g) is list) and (self.Cp_g[1]=='Temp'):
-                # Constant temperature value
-                if len(self.Cp_g)>2:
-                    Cp=self.Cp_calc.get_Cp(np.ones_like(self.E)*float(self.Cp_g[2]), self.Cp_g[0])
-                # Temperature dependent
-                else:
-                    Cp=self.Cp_calc.get_Cp(T_guess, self.Cp_g[0])
-            
-            # constant
-            else:
-                Cp[:,:]=self.Cp_g
+            np.multiply(rho_g, Cv, out=tmp)
+            rhoC+=tmp
+            np.divide(E, rhoC, out=T)
             
             ##########################################################################
-            ##### Thermal conductivity of gas phase
+            #####  Specific heat (Cp) and thermal conductivity of Gas phase
             ##########################################################################
-            # eta dependent
-            if (type(self.k_g) is list) and (self.k_g[0]=='eta'):
-                k_g=self.eta*float(self.k_g[2])+(1-self.eta)*float(self.k_g[1])
             
-            # temperature dependent for given element
-            elif (type(self.k_g) is list) and (self.k_g[1]=='Temp'):
-                # Constant temperature value
-                if len(self.k_g)>2:
-                    k_g=self.k_calc.get_k(np.ones_like(self.E)*float(self.k_g[2]), self.k_g[0])
-                # Temperature dependent
-                else:
-                    k_g=self.k_calc.get_k(T_guess, self.k_g[0])
-            
-            # constant
-            else:
-                k_g[:,:]=self.k_g
+            self.Cp_gas.array(work, self.kernels, eta, T_guess, r)
+            k_g=self.k_gas.array(work, self.kernels, eta, T_guess, r)
             
             ##########################################################################
             ##### Thermal conductivity models
             ##########################################################################
             
-            if self.k_mode=='Parallel':
-                k=self.porosity*k_g+(1-self.porosity)*k
-            elif self.k_mode=='Geometric':
-                k=k*(k_g/k)**(self.porosity)
-            elif self.k_mode=='Series':
-                k=(self.porosity/k_g+(1-self.porosity)/k)**(-1)
+            self.kernels.k_model(self.k_mode, por, k, k_g)
         
         ##########################################################################
         #  Plain heat transfer model
         ##########################################################################
         
         else:
-            rho[:,:]=self.rho*(1-self.porosity)
+            np.subtract(1, por, out=rho)
+            rho*=self.rho
             
-            rhoC=rho*Cv
-            T=self.E/rhoC
-            self.T_guess=T
+            np.multiply(rho, Cv, out=rhoC)
+            np.divide(E, rhoC, out=T)
+        
+        # Update temperature guess once all properties are evaluated
+        self.T_guess=work.get('T_guess')
+        np.copyto(self.T_guess[r], T)
+        if region is None:
+            self.props_valid=not init
         
         if init:
             return rhoC
         else:
-            return T, k, rhoC, Cp
-    
\ No newline at end of file
+            return T, k, rhoC, work.get('Cp')[r]
+    
+    # Temperature of current state (e.g. for output); properties evaluated
+    # for this time step are reused rather than evaluated again
+    def temperature(self):
+        if not self.props_valid:
+            self.calcProp(self.T_guess)
+        return self.work.get('T')
+    
+    # Maximum relative change between two temperature fields
+    def rel_change(self, T_0, T, tmp):
+        np.subtract(T_0, T, out=tmp)
+        np.abs(tmp, out=tmp)
+        tmp/=T
+        return np.amax(tmp)
+    
+# Thermal property at each node from its input file option, by what it
+# depends on:
+#   -constant: held as a scalar
+#   -'eta,[value at eta=0],[value at eta=1]': linear in extent of reaction
+#   -'[Element],Temp': temperature dependent (MatClasses); with a tolerance,
+#    re-evaluated only at nodes where temperature changed by more than tol 
+#    (relative) since last evaluated there
+#   -'[Element],Temp,[T]': constant, at given temperature
+# Values at nodes held in workspace buffer of same name
+class Property():
+    def __init__(self, name, option, func, tol):
+        self.name=name
+        self.func=func
+        self.tol=tol
+        self.depends='const'
+        self.value=option
+        if (type(option) is list) and (option[0]=='eta'):
+            self.depends='eta'
+            self.value=[float(option[1]), float(option[2])]
+        elif (type(option) is list) and (option[1]=='Temp'):
+            self.element=option[0]
+            if len(option)>2:
+                self.value=func(np.array([float(option[2])]), option[0])[0]
+            else:
+                self.depends='T'
+    
+    # Values in region r (scalar if constant); eta and T are arrays of region
+    def get(self, work, kernels, eta, T, r):
+        if self.depends=='const':
+            return self.value
+        out=work.get(self.name)[r]
+        if self.depends=='eta':
+            kernels.eta_lin(eta, self.value[0], self.value[1], out)
+        elif self.tol==0:
+            out[:,:]=self.func(T, self.element)
+        else:
+            # Temperature at last evaluation and change allowed at each node
+            # (zero until evaluated, so all nodes evaluated first time)
+            T_0=work.get(self.name+'_T')[r]
+            lim=work.get(self.name+'_lim')[r]
+            dT=work.get(self.name+'_dT')[r]
+            np.subtract(T, T_0, out=dT)
+            np.abs(dT, out=dT)
+            changed=dT>lim
+            if changed.all():
+                out[:,:]=self.func(T, self.element)
+                np.copyto(T_0, T)
+                np.multiply(T, self.tol, out=lim)
+            elif changed.any():
+                T_c=T[changed]
+                out[changed]=self.func(T_c, self.element)
+                T_0[changed]=T_c
+                lim[changed]=self.tol*T_c
+        return out
+    
+    # Values in region r as an array (constant filled into buffer)
+    def array(self, work, kernels, eta, T, r):
+        value=self.get(work, kernels, eta, T, r)
+        if self.depends=='const':
+            out=work.get(self.name)[r]
+            out.fill(value)
+            return out
+        return value
+    
+    # Values in region r evaluated again at next call
+    def reset(self, work, r):
+        if self.depends=='T' and self.tol>0:
+            work.get(self.name+'_lim')[r].fill(0)
+            work.get(self.name+'_T')[r].fill(0)
+    
+# Geometric stencil coefficients for planar and axisymmetric meshes
+# Built once after MPI discretization (local arrays with ghost nodes); holds
+# the face area/CV volume ratios so the time step only multiplies by dt and flux
+class StencilMetrics():
+    def __init__(self, domain, hx, hy):
+        X=domain.X
+        dx=domain.dX
+        self.hx,self.hy=hx,hy
+        
+        # x faces (between columns i and i+1)
+        # Ax_w- face is the west face of CV i+1; Ax_e- face is the east face of CV i
+        self.Ax_w=np.zeros_like(hx[:,1:])
+        self.Ax_e=np.zeros_like(hx[:,:-1])
+        if domain.type=='Axisymmetric':
+            self.Ax_w[:,:-1]=(X[:,1:-1]-dx[:,:-2]/2)/X[:,1:-1]/hx[:,1:-1]
+            self.Ax_w[:,-1] =1/hx[:,-1]
+            self.Ax_e[:,1:] =(X[:,1:-1]+dx[:,1:-1]/2)/X[:,1:-1]/hx[:,1:-1]
+            self.Ax_e[:,0]  =(X[:,0]+dx[:,0]/2)/(dx[:,0]/2)/hx[:,0]
+        else:
+            self.Ax_w[:,:]=1/hx[:,1:]
+            self.Ax_e[:,:]=1/hx[:,:-1]
+        
+        # y faces (between rows j and j+1)
+        # Ay_s- face is the south face of CV j+1; Ay_n- face is the north face of CV j
+        self.Ay_s=1/hy[1:,:]
+        self.Ay_n=1/hy[:-1,:]
+        
+        # Length scale squared for Fourier number time step
+        self.Fo_len=(dx**2*domain.dY**2)/(dx**2+domain.dY**2)
+        
+        # Boundary faces (flux and radiation BCs)
+        self.A_left=1/hx[:,0]
+        self.A_right=1/hx[:,-1]
+        self.A_south=1/hy[0,:]
+        self.A_north=1/hy[-1,:]
+        if domain.type=='Axisymmetric':
+            self.A_right_flux=X[:,-1]/hx[:,-1]/(X[:,-1]-dx[:,-2])
+        else:
+            self.A_right_flux=self.A_right
+
+# Persistent scratch buffers tied to the local subdomain shape
+# Buffers are allocated (zeroed) on first request and reused every time step
+class Workspace():
+    def __init__(self, shape):
+        self.shape=shape
+        self.buffers={}
+    
+    # Return named buffer; default shape is the local subdomain
+    # (same name can be held at several shapes, e.g. x and y faces)
+    def get(self, name, shape=None):
+        if shape is None:
+            shape=self.shape
+        try:
+            return self.buffers[(name, shape)]
+        except KeyError:
+            # Threads asking for same new buffer all get the one stored
+            return self.buffers.setdefault((name, shape), np.zeros(shape))
+    
+    # New local subdomain shape (load balancing); buffers released
+    def resize(self, shape):
+        self.shape=shape
+        self.buffers={}
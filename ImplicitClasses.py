@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+######################################################
+#             2D Heat Conduction Solver              #
+#              Created by J. Mark Epps               #
+#          Part of Masters Thesis at UW 2018-2020    #
+######################################################
+
+This file contains the implicit solver classes for heat conduction:
+    -Tridiagonal line solver distributed across MPI processes
+    -ADI (alternating-direction implicit) conduction operator
+    -IMEX conduction operator (implicit conduction, preconditioned Krylov 
+    solve); sources and Darcy advection remain explicit in the solver
+    
+Features:
+    -Lines crossing process boundaries are solved with a partition
+    method: each process eliminates its segment locally, the interface
+    unknowns are shared in a small reduced system along the line of
+    processes, then local solutions are corrected
+    -All lines in a process are solved together (vectorized Thomas)
+    -Line factorizations are stored and reused until refactored
+    -ADI is Douglas form with theta=0.5 (Crank-Nicolson in time)
+    -IMEX is backward Euler in conduction, BiCGSTAB preconditioned by ADI
+    line sweeps; preconditioner is kept across time steps
+    -Properties are lagged at the start of the step; boundary fluxes 
+    are explicit (BCClasses) and part of the right hand side
+    -Nodes held at a temperature ('T' BCs) have identity rows; their
+    increment is the change to the boundary temperature
+
+"""
+
+import numpy as np
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI=None # Serial only (lines not split over processes)
+
+# Tridiagonal solves along lines of nodes; lines are split across the
+# processes in comm (ordered by rank of comm along the line)
+class LineSolver():
+    def __init__(self, comm, work, name):
+        self.comm=comm
+        self.work=work
+        self.name=name
+        self.rank=comm.Get_rank()
+        self.size=comm.Get_size()
+    
+    # Factorize lines (along last axis); a, b, c: sub, main and super diagonals
+    # a[...,0] and c[...,-1] couple to nodes on neighbouring processes
+    def factor(self, a, b, c):
+        n=b.shape[-1]
+        self.a=a.copy()
+        self.cp=np.empty(b.shape)
+        self.inv=np.empty(b.shape)
+        self.inv[...,0]=1.0/b[...,0]
+        self.cp[...,0]=c[...,0]*self.inv[...,0]
+        for i in range(1,n):
+            self.inv[...,i]=1.0/(b[...,i]-a[...,i]*self.cp[...,i-1])
+            self.cp[...,i]=c[...,i]*self.inv[...,i]
+        
+        # Local responses to unit values at neighbouring nodes
+        e=np.zeros((2,)+b.shape)
+        e[0,...,0]=-a[...,0]
+        e[1,...,-1]=-c[...,-1]
+        z=self.substitute(e).copy()
+        self.zL,self.zR=z[0],z[1]
+        if self.size==1:
+            return
+        
+        # Reduced system for first (F) and last (L) node of each process
+        # Unknowns ordered [F_0, L_0, F_1, L_1, ...]
+        ends=np.array([self.zL[...,0], self.zR[...,0], self.zL[...,-1], self.zR[...,-1]])
+        ends_all=np.empty((self.size,)+ends.shape)
+        self.comm.Allgather(ends, ends_all)
+        P=self.size
+        M=np.zeros(ends.shape[1:]+(2*P,2*P))
+        for q in range(P):
+            for s in range(2):
+                row=2*q+s
+                M[...,row,row]=1
+                if q>0:
+                    M[...,row,2*q-1]=-ends_all[q,2*s]
+                if q<P-1:
+                    M[...,row,2*q+2]=-ends_all[q,2*s+1]
+        self.Minv=np.linalg.inv(M)
+    
+    # Forward elimination and back substitution with stored factors
+    # d: right hand sides (leading axes for multiple systems allowed)
+    def substitute(self, d):
+        n=d.shape[-1]
+        x=self.work.get('tri_'+self.name, d.shape)
+        np.multiply(d[...,0], self.inv[...,0], out=x[...,0])
+        for i in range(1,n):
+            np.multiply(self.a[...,i], x[...,i-1], out=x[...,i])
+            np.subtract(d[...,i], x[...,i], out=x[...,i])
+            x[...,i]*=self.inv[...,i]
+        for i in range(n-2,-1,-1):
+            x[...,i]-=self.cp[...,i]*x[...,i+1]
+        return x
+    
+    # Solve factored lines; returns workspace buffer (valid until next solve)
+    def solve(self, d):
+        y=self.substitute(d)
+        if self.size==1:
+            return y
+        ends=np.array([y[...,0], y[...,-1]])
+        ends_all=np.empty((self.size,)+ends.shape)
+        self.comm.Allgather(ends, ends_all)
+        r=np.rollaxis(ends_all.reshape((2*self.size,)+ends.shape[1:]), 0, ends.ndim)
+        u=np.einsum('...ij,...j->...i', self.Minv, r)
+        if self.rank>0:
+            y+=self.zL*u[...,2*self.rank-1][...,None]
+        if self.rank<self.size-1:
+            y+=self.zR*u[...,2*self.rank+2][...,None]
+        return y
+
+# Conduction operator shared by implicit schemes
+# A*dT=rhoC*dT-theta*dt*(Lx+Ly)dT on nodes owned by this process
+class ImplicitConduction():
+    def __init__(self, domain, metrics, kernels, comm, theta):
+        self.Domain=domain
+        self.metrics=metrics
+        self.kernels=kernels
+        self.work=kernels.work
+        self.comm=comm
+        self.theta=theta
+        self.parallel=(comm.Get_size()>1)
+        
+        # Nodes owned by this process (ghost nodes excluded)
+        self.own=domain.owned()
+        
+        # Communicators for lines in x (process row) and y (process column)
+        if self.parallel:
+            comm_x=comm.Split(domain.proc_row, domain.proc_col)
+            comm_y=comm.Split(domain.proc_col, domain.proc_row)
+        else:
+            comm_x,comm_y=comm,comm
+        self.line_x=LineSolver(comm_x, self.work, 'x')
+        self.line_y=LineSolver(comm_y, self.work, 'y')
+    
+    # Free line communicators (operator replaced after load balancing)
+    def free(self):
+        if self.parallel:
+            self.line_x.comm.Free()
+            self.line_y.comm.Free()
+    
+    # Face conductances for this step; fixed: indices of nodes held at a
+    # temperature (BCClasses.fixed_T)
+    def coefficients(self, rhoC, k, dt, harmonic, fixed):
+        self.Gx=self.work.get('imp_Gx', self.metrics.Ax_w.shape)
+        self.Gy=self.work.get('imp_Gy', self.metrics.Ay_s.shape)
+        self.kernels.interpolate(k[:,:-1], k[:,1:], harmonic, self.Gx)
+        self.Gx/=self.Domain.dX[:,:-1]
+        self.kernels.interpolate(k[:-1,:], k[1:,:], harmonic, self.Gy)
+        self.Gy/=self.Domain.dY[:-1,:]
+        self.rhoC=rhoC
+        self.dt=dt
+        self.fixed=fixed
+    
+    # Diagonals for lines in one direction (owned nodes only); G face conductances,
+    # A_m/A_p face area/volume ratios of CVs on either side of face, axis of lines
+    def diagonals(self, G, A_m, A_p, axis):
+        a=self.work.get('imp_a')
+        c=self.work.get('imp_c')
+        b=self.work.get('imp_b')
+        a.fill(0)
+        c.fill(0)
+        if axis==1:
+            np.multiply(A_m, G, out=a[:,1:])
+            np.multiply(A_p, G, out=c[:,:-1])
+        else:
+            np.multiply(A_m, G, out=a[1:,:])
+            np.multiply(A_p, G, out=c[:-1,:])
+        a*=-self.theta*self.dt
+        c*=-self.theta*self.dt
+        for index in self.fixed:
+            a[index]=0
+            c[index]=0
+        np.subtract(self.rhoC, a, out=b)
+        b-=c
+        return a[self.own], b[self.own], c[self.own]
+    
+    # Factorize ADI line sweeps with current coefficients
+    def factor(self):
+        a,b,c=self.diagonals(self.Gx, self.metrics.Ax_w, self.metrics.Ax_e, 1)
+        self.line_x.factor(a, b, c)
+        a,b,c=self.diagonals(self.Gy, self.metrics.Ay_s, self.metrics.Ay_n, 0)
+        self.line_y.factor(a.T, b.T, c.T)
+        self.rhoC_f=self.rhoC[self.own].copy()
+    
+    # ADI line sweeps in x then y with stored factors
+    # (rhoC-theta*dt*Lx)dT*=R; (rhoC-theta*dt*Ly)dT=rhoC*dT*
+    def sweep(self, R, out):
+        dT=self.line_x.solve(R)
+        rhs=self.work.get('imp_rhs')[self.own]
+        np.multiply(self.rhoC_f, dT, out=rhs)
+        np.copyto(out, self.line_y.solve(rhs.T).T)
+    
+    # Exchange ghost nodes of var with neighbouring processes
+    def exchange(self, var):
+        d=self.Domain
+        for send,recv,dest,source in [(var[:,1],var[:,-1],d.proc_left,d.proc_right),\
+                                      (var[:,-2],var[:,0],d.proc_right,d.proc_left),\
+                                      (var[1,:],var[-1,:],d.proc_bottom,d.proc_top),\
+                                      (var[-2,:],var[0,:],d.proc_top,d.proc_bottom)]:
+            buf=np.empty(len(recv))
+            self.comm.Sendrecv(send.copy(), dest=dest, recvbuf=buf, source=source)
+            if source>=0:
+                recv[:]=buf
+    
+    # out=A*var (valid on owned nodes); ghost nodes of var updated
+    def apply(self, var, out):
+        fx=self.work.get('imp_fx', self.Gx.shape)
+        fy=self.work.get('imp_fy', self.Gy.shape)
+        if self.parallel:
+            self.exchange(var)
+        np.subtract(var[:,:-1], var[:,1:], out=fx)
+        fx*=self.Gx
+        np.subtract(var[:-1,:], var[1:,:], out=fy)
+        fy*=self.Gy
+        np.multiply(self.rhoC, var, out=out)
+        out*=-1
+        self.kernels.divergence(out, fx, fy, self.metrics.Ax_w, self.metrics.Ax_e,\
+                                self.metrics.Ay_s, self.metrics.Ay_n, self.theta*self.dt)
+        out*=-1
+        for index in self.fixed:
+            np.multiply(self.rhoC[index], var[index], out=out[index])
+    
+    # Global reductions over owned nodes
+    def dot(self, x, y):
+        val=np.array([np.vdot(x[self.own], y[self.own])])
+        if self.parallel:
+            self.comm.Allreduce(val.copy(), val, op=MPI.SUM)
+        return val[0]
+    
+    def amax(self, *args):
+        val=np.array([np.amax(np.abs(x[self.own])) for x in args])
+        if self.parallel:
+            self.comm.Allreduce(val.copy(), val, op=MPI.MAX)
+        return val
+
+# ADI conduction operator (Douglas form, theta=0.5)
+# Sweeps are repeated on the residual of the unsplit system
+# (rhoC-theta*dt*(Lx+Ly))dT=dE until correction is below Convergence
+class ADI(ImplicitConduction):
+    def __init__(self, domain, metrics, kernels, comm):
+        ImplicitConduction.__init__(self, domain, metrics, kernels, comm, 0.5)
+    
+    # Replace explicit energy increment dE (owned nodes) with implicit increment
+    def solve(self, dE, rhoC, k, dt, harmonic, conv, countmax, fixed=[]):
+        self.coefficients(rhoC, k, dt, harmonic, fixed)
+        self.factor()
+        
+        dT=self.work.get('imp_dT')
+        R=self.work.get('imp_R')
+        corr=self.work.get('imp_corr')[self.own]
+        dT.fill(0)
+        np.copyto(R, dE)
+        for i in range(max(countmax,1)):
+            self.sweep(R[self.own], corr)
+            dT[self.own]+=corr
+            if i==max(countmax,1)-1:
+                break
+            if i>0:
+                err=self.amax(corr, dT)
+                if err[0]<=conv*err[1]:
+                    break
+            
+            # Residual of unsplit system
+            self.apply(dT, R)
+            np.subtract(dE, R, out=R)
+        
+        np.multiply(rhoC[self.own], dT[self.own], out=dE[self.own])
+
+# IMEX conduction operator (backward Euler, theta=1)
+# (rhoC-dt*(Lx+Ly))dT=dE solved with right preconditioned BiCGSTAB until
+# residual is below Convergence (relative); ADI line factorization is the 
+# preconditioner and is only refactored when dt changes by more than 
+# dt_tol, the iteration count doubles since the last factorization or
+# nodes held at a temperature change (BCs switched at ignition)
+class IMEX(ImplicitConduction):
+    def __init__(self, domain, metrics, kernels, comm):
+        ImplicitConduction.__init__(self, domain, metrics, kernels, comm, 1.0)
+        self.dt_f=0 # Time step of stored factorization
+        self.fixed_f=[] # Nodes held at a temperature in stored factorization
+        self.dt_tol=0.2
+        self.its_f=1 # Iterations needed right after factorization
+        self.its=0 # Iterations of last solve
+        
+    # Replace explicit energy increment dE (owned nodes) with implicit increment
+    def solve(self, dE, rhoC, k, dt, harmonic, conv, countmax, fixed=[]):
+        self.coefficients(rhoC, k, dt, harmonic, fixed)
+        refactor=(abs(dt-self.dt_f)>self.dt_tol*self.dt_f) or (self.its>2*self.its_f)\
+            or fixed!=self.fixed_f
+        if refactor:
+            self.factor()
+            self.dt_f=dt
+            self.fixed_f=fixed
+        
+        # Krylov vectors (ghost nodes used by apply)
+        x,r,r0,p,v,s,t,y,z=[self.work.get('imp_'+name) for name in\
+                            ['x','r','r0','p','v','s','t','y','z']]
+        x.fill(0)
+        np.copyto(r, dE)
+        np.copyto(r0, r)
+        p.fill(0)
+        v.fill(0)
+        b_norm=np.sqrt(self.dot(dE, dE))
+        rho,alpha,omega=1.0,1.0,1.0
+        self.its=0
+        while b_norm>0 and self.its<max(countmax,1):
+            self.its+=1
+            rho_1=self.dot(r0, r)
+            beta=(rho_1/rho)*(alpha/omega)
+            rho=rho_1
+            p-=omega*v
+            p*=beta
+            p+=r
+            self.sweep(p[self.own], y[self.own])
+            self.apply(y, v)
+            alpha=rho/self.dot(r0, v)
+            np.subtract(r, alpha*v, out=s)
+            x+=alpha*y
+            if np.sqrt(self.dot(s, s))<=conv*b_norm:
+                break
+            self.sweep(s[self.own], z[self.own])
+            self.apply(z, t)
+            omega=self.dot(t, s)/self.dot(t, t)
+            x+=omega*z
+            np.subtract(s, omega*t, out=r)
+            if np.sqrt(self.dot(r, r))<=conv*b_norm:
+                break
+        if refactor:
+            self.its_f=max(self.its,1)
+        
+        np.multiply(rhoC[self.own], x[self.own], out=dE[self.own])
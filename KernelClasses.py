@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+######################################################
+#             2D Heat Conduction Solver              #
+#              Created by J. Mark Epps               #
+#          Part of Masters Thesis at UW 2018-2020    #
+######################################################
+
+This file contains the compute kernel backends for the time step:
+    -face fluxes (diffusion, Darcy velocity, advection) and their divergence
+    -Arrhenius source term (Kim)
+    -property evaluation (reaction progress dependence, conductivity models)
+    -flux/convective and radiation boundary conditions
+    -ignition criterion (count of nodes, one pass)
+    
+Features:
+    -NumPy backend is the reference; all kernels write to given arrays
+    -Numba backend (JIT compiled loops) if numba is installed
+    -numexpr backend (fused expressions) if numexpr is installed
+    -Backend selected by 'Kernel_backend' in input file; reverts to NumPy
+    if the requested package is not available
+    -Any backend can be run on row tiles of the local arrays by a pool of 
+    threads ('Threads' in input file); NumPy ufuncs, numexpr and the Numba 
+    loops (nogil) release the GIL so tiles run concurrently
+
+"""
+
+import numpy as np
+import copy
+import threading
+from multiprocessing.pool import ThreadPool
+
+sigma=5.67*10**(-8) # Stefan-Boltzmann constant
+
+tile_size=16384 # Nodes per row tile (128 kB per array; several fit in L2 cache)
+
+# Return kernel object for requested backend (tiled over threads if threads>1)
+def get_kernels(name, work, threads=1):
+    kernels=None
+    if name=='Numba':
+        try:
+            kernels=Numba_kernels(work)
+        except ImportError:
+            print '***** numba not available, using NumPy kernels'
+    elif name=='numexpr':
+        try:
+            kernels=Numexpr_kernels(work)
+        except ImportError:
+            print '***** numexpr not available, using NumPy kernels'
+    if kernels is None:
+        kernels=NumPy_kernels(work)
+    if threads>1:
+        return Tiled_kernels(kernels, threads)
+    return kernels
+
+# Reference backend; in-place NumPy operations with workspace scratch arrays
+class NumPy_kernels():
+    def __init__(self, work):
+        self.name='NumPy'
+        self.work=work
+        self.threads=1
+    
+    # Interpolation at control surface (harmonic or linear)
+    def interpolate(self, k1, k2, harmonic, out):
+        np.add(k1, k2, out=out)
+        if harmonic:
+            np.divide(k1, out, out=out)
+            out*=k2
+            out*=2
+        else:
+            out*=0.5
+        return out
+    
+    # Diffusive flux at faces; out=-k_f*(T2-T1)/d
+    def diff_flux(self, k1, k2, T1, T2, d, harmonic, out):
+        tmp=self.work.get('kern_tmp', out.shape)
+        self.interpolate(k1, k2, harmonic, out)
+        np.subtract(T2, T1, out=tmp)
+        tmp/=d
+        out*=tmp
+        np.negative(out, out=out)
+        return out
+    
+    # Darcy velocity at faces; out=-perm_f/mu*(P2-P1)/d
+    def darcy_vel(self, perm1, perm2, P1, P2, d, mu, harmonic, out):
+        tmp=self.work.get('kern_tmp', out.shape)
+        self.interpolate(perm1, perm2, harmonic, out)
+        out*=-1.0/mu
+        np.subtract(P2, P1, out=tmp)
+        tmp/=d
+        out*=tmp
+        return out
+    
+    # Mass flux and enthalpy advection at faces
+    # mflx=rho_f*vel; eflx+=mflx*Cp_f*T_f
+    def adv_flux(self, rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx):
+        tmp=self.work.get('kern_tmp', mflx.shape)
+        tmp2=self.work.get('kern_tmp2', mflx.shape)
+        self.interpolate(rho1, rho2, harmonic, mflx)
+        mflx*=vel
+        self.interpolate(Cp1, Cp2, harmonic, tmp)
+        tmp*=self.interpolate(T1, T2, harmonic, tmp2)
+        tmp*=mflx
+        eflx+=tmp
+    
+    # Add divergence of face fluxes (with area/volume ratios) to var
+    def divergence(self, var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt):
+        wx=self.work.get('kern_tmp', flx.shape)
+        wy=self.work.get('kern_tmp', fly.shape)
+        np.multiply(Ax_w, flx, out=wx)
+        wx*=dt
+        var[:,1:] +=wx
+        np.multiply(Ax_e, flx, out=wx)
+        wx*=dt
+        var[:,:-1]-=wx
+        np.multiply(Ay_s, fly, out=wy)
+        wy*=dt
+        var[1:,:] +=wy
+        np.multiply(Ay_n, fly, out=wy)
+        wy*=dt
+        var[:-1,:]-=wy
+    
+    # Arrhenius rate (Kim); detadt=A0*(1-eta)*exp(-Ea_R/T), eta+=dt*detadt
+    def arrhenius(self, A0, Ea_R, eta, T, dt, detadt):
+        tmp=self.work.get('kern_tmp', eta.shape)
+        np.divide(-Ea_R, T, out=detadt)
+        np.exp(detadt, out=detadt)
+        np.subtract(1, eta, out=tmp)
+        tmp*=A0
+        detadt*=tmp
+        np.multiply(detadt, dt, out=tmp)
+        eta+=tmp
+        return detadt
+    
+    # Exact update with T frozen over dt; eta=1-(1-eta)*exp(-k(T)*dt),
+    # detadt is the mean rate (eta_new-eta)/dt
+    def arrhenius_exp(self, A0, Ea_R, eta, T, dt, detadt):
+        tmp=self.work.get('kern_tmp', eta.shape)
+        np.divide(-Ea_R, T, out=detadt)
+        np.exp(detadt, out=detadt)
+        detadt*=-A0*dt
+        np.expm1(detadt, out=detadt)
+        np.subtract(eta, 1, out=tmp)
+        detadt*=tmp
+        eta+=detadt
+        detadt/=dt
+        return detadt
+    
+    # Linear variation with reaction progress
+    def eta_lin(self, eta, val_0, val_1, out):
+        np.multiply(eta, val_1-val_0, out=out)
+        out+=val_0
+        return out
+    
+    # Effective thermal conductivity of porous medium (written to k)
+    def k_model(self, mode, por, k, k_g):
+        tmp=self.work.get('kern_tmp', k.shape)
+        tmp2=self.work.get('kern_tmp2', k.shape)
+        if mode=='Parallel':
+            np.multiply(por, k_g, out=tmp)
+            np.subtract(1, por, out=tmp2)
+            k*=tmp2
+            k+=tmp
+        elif mode=='Geometric':
+            np.divide(k_g, k, out=tmp)
+            tmp**=por
+            k*=tmp
+        elif mode=='Series':
+            np.divide(por, k_g, out=tmp)
+            np.subtract(1, por, out=tmp2)
+            np.divide(tmp2, k, out=k)
+            k+=tmp
+            np.reciprocal(k, out=k)
+        return k
+    
+    # Number of nodes where source exceeds ratio*|flux| and T>=T_ign
+    def ignition_count(self, src, fl, T, ratio, T_ign):
+        tmp=self.work.get('kern_tmp', fl.shape)
+        tmp2=self.work.get('kern_tmp2', fl.shape)
+        np.abs(fl, out=tmp)
+        tmp*=ratio
+        np.greater(src, tmp, out=tmp)
+        np.greater_equal(T, T_ign, out=tmp2)
+        tmp*=tmp2
+        return np.count_nonzero(tmp)
+    
+    # Flux (h=0) or convective BC; E+=(q-h*T)*dt*A
+    def bc_flux(self, E, q, h, T, dt, A):
+        if h==0:
+            E+=q*dt*A
+        else:
+            E+=(q-h*T)*dt*A
+    
+    # Radiation BC; E+=dt*A*eps*sigma*(T_inf^4-T^4)
+    def bc_rad(self, E, eps, T_inf, T, dt, A):
+        E+=dt*A*eps*sigma*(T_inf**4-T**4)
+
+# numexpr backend; each kernel is a single fused pass over memory
+class Numexpr_kernels(NumPy_kernels):
+    def __init__(self, work):
+        import numexpr
+        NumPy_kernels.__init__(self, work)
+        self.name='numexpr'
+        self.ne=numexpr
+    
+    def interp_str(self, a, b, harmonic):
+        if harmonic:
+            return '(2*%s*%s/(%s+%s))'%(a,b,a,b)
+        else:
+            return '(0.5*%s+0.5*%s)'%(a,b)
+    
+    def interpolate(self, k1, k2, harmonic, out):
+        return self.ne.evaluate(self.interp_str('k1','k2',harmonic), out=out)
+    
+    def diff_flux(self, k1, k2, T1, T2, d, harmonic, out):
+        return self.ne.evaluate('-'+self.interp_str('k1','k2',harmonic)+'*(T2-T1)/d', out=out)
+    
+    def darcy_vel(self, perm1, perm2, P1, P2, d, mu, harmonic, out):
+        return self.ne.evaluate('-'+self.interp_str('perm1','perm2',harmonic)+'/mu*(P2-P1)/d', out=out)
+    
+    def adv_flux(self, rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx):
+        self.ne.evaluate(self.interp_str('rho1','rho2',harmonic)+'*vel', out=mflx)
+        self.ne.evaluate('eflx+mflx*'+self.interp_str('Cp1','Cp2',harmonic)\
+                         +'*'+self.interp_str('T1','T2',harmonic), out=eflx)
+    
+    def divergence(self, var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt):
+        # Each face contributes to both neighbours; views overlap so use
+        # one pass per face orientation
+        v=var[:,1:]
+        self.ne.evaluate('v+dt*Ax_w*flx', out=v)
+        v=var[:,:-1]
+        self.ne.evaluate('v-dt*Ax_e*flx', out=v)
+        v=var[1:,:]
+        self.ne.evaluate('v+dt*Ay_s*fly', out=v)
+        v=var[:-1,:]
+        self.ne.evaluate('v-dt*Ay_n*fly', out=v)
+    
+    def arrhenius(self, A0, Ea_R, eta, T, dt, detadt):
+        self.ne.evaluate('A0*(1-eta)*exp(-Ea_R/T)', out=detadt)
+        self.ne.evaluate('eta+dt*detadt', out=eta)
+        return detadt
+    
+    def arrhenius_exp(self, A0, Ea_R, eta, T, dt, detadt):
+        self.ne.evaluate('(eta-1)*expm1(-A0*dt*exp(-Ea_R/T))/dt', out=detadt)
+        self.ne.evaluate('eta+dt*detadt', out=eta)
+        return detadt
+    
+    def eta_lin(self, eta, val_0, val_1, out):
+        return self.ne.evaluate('eta*val_1+(1-eta)*val_0', out=out)
+    
+    def ignition_count(self, src, fl, T, ratio, T_ign):
+        return int(self.ne.evaluate('sum(where((src>ratio*abs(fl)) & (T>=T_ign), 1, 0))'))
+    
+    def k_model(self, mode, por, k, k_g):
+        if mode=='Parallel':
+            self.ne.evaluate('por*k_g+(1-por)*k', out=k)
+        elif mode=='Geometric':
+            self.ne.evaluate('k*(k_g/k)**por', out=k)
+        elif mode=='Series':
+            self.ne.evaluate('1/(por/k_g+(1-por)/k)', out=k)
+        return k
+
+# Numba backend; JIT compiled loops fuse each kernel into one pass
+class Numba_kernels(NumPy_kernels):
+    def __init__(self, work):
+        import numba
+        NumPy_kernels.__init__(self, work)
+        self.name='Numba'
+        jit=numba.njit(cache=True, nogil=True)
+        self.nb_interp=jit(nb_interp)
+        self.nb_diff_flux=jit(nb_diff_flux)
+        self.nb_darcy_vel=jit(nb_darcy_vel)
+        self.nb_adv_flux=jit(nb_adv_flux)
+        self.nb_divergence=jit(nb_divergence)
+        self.nb_arrhenius=jit(nb_arrhenius)
+        self.nb_arrhenius_exp=jit(nb_arrhenius_exp)
+        self.nb_eta_lin=jit(nb_eta_lin)
+        self.nb_k_model=jit(nb_k_model)
+        self.nb_ignition_count=jit(nb_ignition_count)
+    
+    def interpolate(self, k1, k2, harmonic, out):
+        self.nb_interp(k1, k2, harmonic, out)
+        return out
+    
+    def diff_flux(self, k1, k2, T1, T2, d, harmonic, out):
+        self.nb_diff_flux(k1, k2, T1, T2, d, harmonic, out)
+        return out
+    
+    def darcy_vel(self, perm1, perm2, P1, P2, d, mu, harmonic, out):
+        self.nb_darcy_vel(perm1, perm2, P1, P2, d, mu, harmonic, out)
+        return out
+    
+    def adv_flux(self, rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx):
+        self.nb_adv_flux(rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx)
+    
+    def divergence(self, var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt):
+        self.nb_divergence(var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt)
+    
+    def arrhenius(self, A0, Ea_R, eta, T, dt, detadt):
+        self.nb_arrhenius(A0, Ea_R, eta, T, dt, detadt)
+        return detadt
+    
+    def arrhenius_exp(self, A0, Ea_R, eta, T, dt, detadt):
+        self.nb_arrhenius_exp(A0, Ea_R, eta, T, dt, detadt)
+        return detadt
+    
+    def eta_lin(self, eta, val_0, val_1, out):
+        self.nb_eta_lin(eta, val_0, val_1, out)
+        return out
+    
+    def ignition_count(self, src, fl, T, ratio, T_ign):
+        return self.nb_ignition_count(src, fl, T, ratio, T_ign)
+    
+    def k_model(self, mode, por, k, k_g):
+        modes={'Parallel': 0, 'Geometric': 1, 'Series': 2}
+        if mode in modes:
+            self.nb_k_model(modes[mode], por, k, k_g)
+        return k
+
+# Row tiles of the local arrays processed by a pool of threads; each thread 
+# runs a copy of the backend kernels with its own scratch buffers. Element-wise 
+# kernels are split directly; divergence is done on each tile extended by a 
+# row of neighbouring faces so every node is summed as by the backend alone 
+# (results identical to 1 thread). Calls from pool threads (e.g. calcProp 
+# tiles) and small arrays are run by the calling thread.
+class Tiled_kernels():
+    def __init__(self, kernels, threads):
+        self.kernels=kernels
+        self.name=kernels.name
+        self.work=kernels.work
+        self.threads=threads
+        self.pool=ThreadPool(threads)
+        self.main=threading.current_thread()
+        self.local=threading.local()
+        # Tiles already run concurrently; numexpr threads not nested
+        if self.name=='numexpr':
+            kernels.ne.set_num_threads(1)
+    
+    # Kernels for calling thread (own scratch buffers)
+    def thread_kernels(self):
+        try:
+            return self.local.kernels
+        except AttributeError:
+            k=copy.copy(self.kernels)
+            k.work=copy.copy(self.work)
+            k.work.buffers={}
+            self.local.kernels=k
+            return k
+    
+    # Row ranges [j0,j1) of cache sized tiles (at least one per thread)
+    def row_tiles(self, shape):
+        rows=max(1, min(tile_size/max(shape[1],1), -(-shape[0]/self.threads)))
+        return [(j, min(j+rows, shape[0])) for j in range(0, shape[0], rows)]
+    
+    # Run func on each tile with thread pool; list of results
+    def map_tiles(self, func, tiles):
+        return self.pool.map(func, tiles)
+    
+    # True if call is to be split into tiles
+    def tiled(self, shape):
+        return threading.current_thread() is self.main and shape[0]>1\
+            and shape[0]*shape[1]>tile_size
+    
+    # Call kernel on row tiles of all 2D array arguments
+    def call(self, name, shape, args):
+        if not self.tiled(shape):
+            return [getattr(self.thread_kernels(), name)(*args)]
+        def run(t):
+            a=[x[t[0]:t[1]] if np.ndim(x)==2 else x for x in args]
+            return getattr(self.thread_kernels(), name)(*a)
+        return self.map_tiles(run, self.row_tiles(shape))
+    
+    def interpolate(self, k1, k2, harmonic, out):
+        self.call('interpolate', out.shape, [k1, k2, harmonic, out])
+        return out
+    
+    def diff_flux(self, k1, k2, T1, T2, d, harmonic, out):
+        self.call('diff_flux', out.shape, [k1, k2, T1, T2, d, harmonic, out])
+        return out
+    
+    def darcy_vel(self, perm1, perm2, P1, P2, d, mu, harmonic, out):
+        self.call('darcy_vel', out.shape, [perm1, perm2, P1, P2, d, mu, harmonic, out])
+        return out
+    
+    def adv_flux(self, rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx):
+        self.call('adv_flux', mflx.shape, [rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx])
+    
+    # Each tile updates its own rows only; faces to neighbouring tiles are 
+    # included on a copy of the tile extended by a row each side
+    def divergence(self, var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt):
+        if not self.tiled(var.shape):
+            return self.thread_kernels().divergence(var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt)
+        def run(t):
+            j0=max(t[0]-1, 0)
+            j1=min(t[1]+1, var.shape[0])
+            k=self.thread_kernels()
+            v=k.work.get('kern_div', (j1-j0, var.shape[1]))
+            np.copyto(v, var[j0:j1])
+            k.divergence(v, flx[j0:j1], fly[j0:j1-1], Ax_w[j0:j1], Ax_e[j0:j1],\
+                         Ay_s[j0:j1-1], Ay_n[j0:j1-1], dt)
+            var[t[0]:t[1]]=v[t[0]-j0:t[1]-j0]
+        self.map_tiles(run, self.row_tiles(var.shape))
+    
+    def arrhenius(self, A0, Ea_R, eta, T, dt, detadt):
+        self.call('arrhenius', eta.shape, [A0, Ea_R, eta, T, dt, detadt])
+        return detadt
+    
+    def arrhenius_exp(self, A0, Ea_R, eta, T, dt, detadt):
+        self.call('arrhenius_exp', eta.shape, [A0, Ea_R, eta, T, dt, detadt])
+        return detadt
+    
+    def eta_lin(self, eta, val_0, val_1, out):
+        self.call('eta_lin', out.shape, [eta, val_0, val_1, out])
+        return out
+    
+    def k_model(self, mode, por, k, k_g):
+        self.call('k_model', k.shape, [mode, por, k, k_g])
+        return k
+    
+    def ignition_count(self, src, fl, T, ratio, T_ign):
+        return sum(self.call('ignition_count', fl.shape, [src, fl, T, ratio, T_ign]))
+    
+    # Boundary conditions (1D arrays) not tiled
+    def bc_flux(self, E, q, h, T, dt, A):
+        self.thread_kernels().bc_flux(E, q, h, T, dt, A)
+    
+    def bc_rad(self, E, eps, T_inf, T, dt, A):
+        self.thread_kernels().bc_rad(E, eps, T_inf, T, dt, A)
+
+##########################################################################
+# Loops compiled by Numba backend (2D arrays)
+##########################################################################
+
+def nb_interp(k1, k2, harmonic, out):
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            a=k1[j,i]
+            b=k2[j,i]
+            if harmonic:
+                out[j,i]=2*a*b/(a+b)
+            else:
+                out[j,i]=0.5*a+0.5*b
+
+def nb_diff_flux(k1, k2, T1, T2, d, harmonic, out):
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            a=k1[j,i]
+            b=k2[j,i]
+            if harmonic:
+                kf=2*a*b/(a+b)
+            else:
+                kf=0.5*a+0.5*b
+            out[j,i]=-kf*(T2[j,i]-T1[j,i])/d[j,i]
+
+def nb_darcy_vel(perm1, perm2, P1, P2, d, mu, harmonic, out):
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            a=perm1[j,i]
+            b=perm2[j,i]
+            if harmonic:
+                kf=2*a*b/(a+b)
+            else:
+                kf=0.5*a+0.5*b
+            out[j,i]=-kf/mu*(P2[j,i]-P1[j,i])/d[j,i]
+
+def nb_adv_flux(rho1, rho2, vel, Cp1, Cp2, T1, T2, harmonic, mflx, eflx):
+    for j in range(mflx.shape[0]):
+        for i in range(mflx.shape[1]):
+            if harmonic:
+                r=2*rho1[j,i]*rho2[j,i]/(rho1[j,i]+rho2[j,i])
+                c=2*Cp1[j,i]*Cp2[j,i]/(Cp1[j,i]+Cp2[j,i])
+                t=2*T1[j,i]*T2[j,i]/(T1[j,i]+T2[j,i])
+            else:
+                r=0.5*rho1[j,i]+0.5*rho2[j,i]
+                c=0.5*Cp1[j,i]+0.5*Cp2[j,i]
+                t=0.5*T1[j,i]+0.5*T2[j,i]
+            m=r*vel[j,i]
+            mflx[j,i]=m
+            eflx[j,i]+=m*c*t
+
+def nb_divergence(var, flx, fly, Ax_w, Ax_e, Ay_s, Ay_n, dt):
+    for j in range(flx.shape[0]):
+        for i in range(flx.shape[1]):
+            var[j,i+1]+=dt*Ax_w[j,i]*flx[j,i]
+            var[j,i]  -=dt*Ax_e[j,i]*flx[j,i]
+    for j in range(fly.shape[0]):
+        for i in range(fly.shape[1]):
+            var[j+1,i]+=dt*Ay_s[j,i]*fly[j,i]
+            var[j,i]  -=dt*Ay_n[j,i]*fly[j,i]
+
+def nb_arrhenius(A0, Ea_R, eta, T, dt, detadt):
+    for j in range(eta.shape[0]):
+        for i in range(eta.shape[1]):
+            r=A0*(1-eta[j,i])*np.exp(-Ea_R/T[j,i])
+            detadt[j,i]=r
+            eta[j,i]+=dt*r
+
+def nb_arrhenius_exp(A0, Ea_R, eta, T, dt, detadt):
+    for j in range(eta.shape[0]):
+        for i in range(eta.shape[1]):
+            d=(eta[j,i]-1)*np.expm1(-A0*dt*np.exp(-Ea_R/T[j,i]))
+            detadt[j,i]=d/dt
+            eta[j,i]+=d
+
+def nb_eta_lin(eta, val_0, val_1, out):
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            out[j,i]=eta[j,i]*val_1+(1-eta[j,i])*val_0
+
+def nb_k_model(mode, por, k, k_g):
+    for j in range(k.shape[0]):
+        for i in range(k.shape[1]):
+            p=por[j,i]
+            if mode==0:
+                k[j,i]=p*k_g[j,i]+(1-p)*k[j,i]
+            elif mode==1:
+                k[j,i]=k[j,i]*(k_g[j,i]/k[j,i])**p
+            else:
+                k[j,i]=1/(p/k_g[j,i]+(1-p)/k[j,i])
+
+def nb_ignition_count(src, fl, T, ratio, T_ign):
+    n=0
+    for j in range(fl.shape[0]):
+        for i in range(fl.shape[1]):
+            if src[j,i]>ratio*abs(fl[j,i]) and T[j,i]>=T_ign:
+                n+=1
+    return n
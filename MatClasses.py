@@ -5,12 +5,43 @@ Created on Sat Sep 29 12:58:39 2018
 @author: Joseph
 
 Class for calculating temperature dependent properties
+Polynomial fits of each species tabulated at start (Property_table); 
+properties returned by interpolation in table
 
 """
 
 import numpy as np
 #from CoolProp.CoolProp import PropsSI
 
+# Property tabulated on a uniform temperature grid (0 to T_max, spacing dT) 
+# from its fit func(T); returned by linear interpolation in one pass however
+# many phases the fit has
+# Phase change temperatures (whole K) are grid nodes, so each interval lies
+# in one phase; value exactly at one is that of phase above
+# Differs from fits by less than 5e-7 of largest value of property (0 to 
+# 6000 K); linear extrapolation of end intervals outside grid
+class Property_table():
+    def __init__(self, func, T_max=6000.0, dT=0.5):
+        self.n=int(round(T_max/dT))
+        self.inv_dT=1/dT
+        # Line through two points just inside each interval
+        T=np.arange(self.n)*dT
+        d=1e-6*dT
+        lo=func(T+d)
+        hi=func(T+dT-d)
+        self.slope=(hi-lo)/(dT-2*d)
+        self.const=lo-self.slope*(T+d)
+    
+    # T: array or scalar
+    def __call__(self, T):
+        T=np.asarray(T, dtype=float)
+        i=np.array(T*self.inv_dT, dtype=int)
+        np.clip(i, 0, self.n-1, out=i)
+        prop=self.slope.take(i)
+        prop*=T
+        prop+=self.const.take(i)
+        return prop
+
 # Class for calculating diffusion coefficients
 class Diff_Coef():
     def __init__(self):
@@ -55,6 +86,13 @@ class Cp():
         self.Ar_mol_mass=39.948
         # Density dictionary for gases
         self.rho={'Air': 1.2, 'Ar': 1.8}
+        # Tables of each species (Ar for any other)
+        self.species=['Al','Cu','Al2O3','CuO','Air','O2','Ar']
+        self.tables={}
+        for i in self.species:
+            for typ in ['Cp','Cv']:
+                self.tables[(i,typ)]=Property_table(\
+                    lambda T, fit=getattr(self, i), typ=typ: fit(T, typ))
         
     def Al(self, T, typ):
         molar_mass=26.982
@@ -211,45 +249,24 @@ class Cp():
             return Cp-8.314*1000/molar_mass
         
     # Main function to calculate specific heat at constant pressure
-    # Points to correct function based on specie
+    # Interpolated in table of specie
     def get_Cp(self,T,species):
-        if species=='Al':
-            return self.Al(T,'Cp')
-        elif species=='Cu':
-            return self.Cu(T,'Cp')
-        elif species=='Al2O3':
-            return self.Al2O3(T,'Cp')
-        elif species=='CuO':
-            return self.CuO(T,'Cp')
-        elif species=='Air':
-            return self.Air(T,'Cp')
-        elif species=='O2':
-            return self.O2(T,'Cp')
-        else:
-            return self.Ar(T,'Cp')
+        return self.tables.get((species,'Cp'), self.tables[('Ar','Cp')])(T)
         
     # Main function to calculate specific heat at constant volume
-    # Points to correct function based on specie
+    # Interpolated in table of specie
     def get_Cv(self,T,species):
-        if species=='Al':
-            return self.Al(T,'Cv')
-        elif species=='Cu':
-            return self.Cu(T,'Cv')
-        elif species=='Al2O3':
-            return self.Al2O3(T,'Cv')
-        elif species=='CuO':
-            return self.CuO(T,'Cv')
-        elif species=='Air':
-            return self.Air(T,'Cv')
-        elif species=='O2':
-            return self.O2(T,'Cv')
-        else:
-            return self.Ar(T,'Cv')
+        return self.tables.get((species,'Cv'), self.tables[('Ar','Cv')])(T)
 
 # Return thermal conductivity
 class therm_cond():
     def __init__(self):
         self.num='dummy'
+        # Tables of each species (Ar for any other)
+        self.species=['Air','Ar']
+        self.tables={}
+        for i in self.species:
+            self.tables[i]=Property_table(getattr(self, i))
         
     def Ar(self, T):
         k=np.zeros_like(T)
@@ -279,10 +296,7 @@ class therm_cond():
         
         return k
     
-    # Main function to calculate specific heat at constant pressure
-    # Points to correct function based on specie
+    # Main function to calculate thermal conductivity
+    # Interpolated in table of specie
     def get_k(self,T,species):
-        if species=='Air':
-            return self.Air(T)
-        else:
-            return self.Ar(T)
\ No newline at end of file
+        return self.tables.get(species, self.tables['Ar'])(T)
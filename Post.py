@@ -29,7 +29,7 @@ import sys
 import string as st
 import matplotlib as mtplt
 from matplotlib import pyplot as plt
-from FileClasses import FileIn
+from FileClasses import FileIn, load_data
 from GeomClasses import TwoDimDomain
 from Source_Comb import Source_terms
 from myFigs import set_size
@@ -156,7 +156,7 @@ if type(times) is str:
     i=len(times)
     j=0
     while i>j:
-        if st.find(times[j],'T')==0 and st.find(times[j],'.npy')>0:
+        if (st.find(times[j],'T')==0 or st.find(times[j],'Data')==0) and st.find(times[j],'.npy')>0:
             times[j]=st.split(st.split(times[j],'_')[1],'.npy')[0]
             j+=1
         else:
@@ -219,9 +219,9 @@ for time in times:
     ##############################################################
     #               Generate graphs
     ##############################################################
-    T=np.load('T_'+time+'.npy', False)
+    T=load_data('T', time)
     if st.find(sources['Source_Kim'],'True')>=0:
-        eta=np.load('eta_'+time+'.npy', False)
+        eta=load_data('eta', time)
         Y_tot=np.zeros_like(eta)
     
     # Temperature contour
@@ -300,7 +300,7 @@ for time in times:
         Y_0=[]
             # Mass fraction contours
         for i in range(len(titles)):
-            Y_0.append(np.load('rho_'+titles[i]+'_'+time+'.npy', False))
+            Y_0.append(load_data('rho_'+titles[i], time))
             if st.find(contours,'True')>=0:
                 fig=plt.figure(figsize=fig_size)
                 plt.contourf(X*1000, Y*1000, Y_0[i], alpha=0.5, cmap=cmap_choice)#, vmin=0.0, vmax=1.0)  
@@ -319,7 +319,7 @@ for time in times:
         continue
     
     # Darcy velocities and pressure contours
-    P=np.load('P_'+time+'.npy', False)
+    P=load_data('P', time)
     p_max=max(np.amax(P),p_max)
     u=np.zeros_like(P)
     v=np.zeros_like(P)
@@ -468,7 +468,7 @@ if st.find(OneD_graphs,'True')>=0:
     print 'Creating 1D plots'
     fig=plt.figure(figsize=fig_size)
     for time in times:
-        T=np.load('T_'+time+'.npy', False)
+        T=load_data('T', time)
         # 1D temperature profile at centreline
         plt.plot(Y[:,1]*1000, T[:,int(len(T[0,:])/2)], label='t='+time)
     plt.xlabel(x_axis_labels[settings['Domain']])
@@ -483,8 +483,8 @@ if st.find(OneD_graphs,'True')>=0:
     if st.find(sources['Source_Kim'],'True')>=0:
         fig=plt.figure(figsize=fig_size)
         for time in times:
-            eta=np.load('eta_'+time+'.npy', False)
-            T=np.load('T_'+time+'.npy', False)
+            eta=load_data('eta', time)
+            T=load_data('T', time)
             phi=sources['A0']*(1-eta)*np.exp(-sources['Ea']/8.314/T)
             # 1D Reaction rate profile at centreline
             plt.plot(Y[:,1]*1000, phi[:,int(len(T[0,:])/2)], label='t='+time)
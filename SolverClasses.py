@@ -19,20 +19,56 @@ Features/assumptions:
     -equal node spacing in x or y
     -thermal properties can vary in space (call from geometry object)
     -Radiation boundary conditions
+    -Time schemes: Explicit, ADI or IMEX (implicit conduction; time step 
+    limited by CFL and reaction rate, not by Fo number if dt specified),
+    Runge-Kutta schemes in temporal_schemes.py (RK2, RK3, RK4, etc.) or 
+    RKL2 (super-time-stepping for conduction, same time step limits as ADI)
+    -Kinetics: Euler (explicit), Exponential (exact update of eta with 
+    T frozen) or Implicit (backward Euler, Newton iteration); latter two
+    Strang split with transport, no reaction rate time step limit
+    -Reaction mechanism: Kim (single step) or Umbrajkar (multi-step, stiff)
+    -Time step in two parts: Time_step (properties, time step; one reduction
+    over processes with last step's error code, ignition and combustion
+    front) then Advance_Soln_Cond
+    -Ignition: nodes meeting criterion counted on each process (owned nodes,
+    one kernel pass, only at 600 K or above) and summed over processes;
+    same ignition for any number of processes
+    -Ghost node layers (Ghost_width): explicit updates (Explicit time steps
+    or Runge-Kutta stages) each use up one ghost node layer, so w layers 
+    give w updates between exchanges (see ghost_width)
 
 """
 
 import numpy as np
 import copy
+import time
 import string as st
 import Source_Comb
 import BCClasses
-from mpi4py import MPI
+import ImplicitClasses
+import temporal_schemes
+
+# Ghost node layers for settings (Ghost_width); more than one layer only for
+# explicit schemes as implicit line solves (ADI/IMEX) and super-time-stepping
+# (RKL2) stages need all ghost nodes current; Runge-Kutta needs a layer per 
+# stage (exchange once per time step) or is left at one layer (exchange 
+# before every stage)
+def ghost_width(settings):
+    w=settings.get('Ghost_width', 1)
+    scheme=settings['Time_Scheme']
+    if scheme in ['ADI','IMEX','RKL2']:
+        return 1
+    elif st.upper(scheme) in temporal_schemes.scheme_data.keys():
+        Nk=temporal_schemes.scheme_data[st.upper(scheme)]['rk_substep_fraction'].size
+        if w<Nk:
+            return 1
+    return w
 
 # 2D solver (Cartesian coordinates)
 class TwoDimSolver():
-    def __init__(self, geom_obj, settings, Sources, BCs, comm):
+    def __init__(self, geom_obj, settings, Sources, BCs, comm, metrics, mpi=None):
         self.Domain=geom_obj # Geometry object
+        self.metrics=metrics # Geometric stencil coefficients
         self.time_scheme=settings['Time_Scheme']
         self.dx,self.dy=geom_obj.dX,geom_obj.dY
         self.Fo=settings['Fo']
@@ -41,26 +77,75 @@ class TwoDimSolver():
         self.conv=settings['Convergence']
         self.countmax=settings['Max_iterations']
         self.comm=comm
+        self.mpi=mpi # Ghost node updates (finished here if posted before time step)
+        # Per time step reduction; Overlap to post last step's scalars 
+        # non-blocking, combined while next step's properties are calculated
+        self.overlap=(settings.get('Step_reduction', 'Fused')=='Overlap')
+        self.pending=None # Non-blocking reduction in flight
+        self.props=None # Properties for next time step (Time_step)
+        self.front=0,np.inf # Burned length, front location after last step
+        self.cost=0 # Compute time since last load balancing check
         self.diff_inter=settings['diff_interpolation']
         self.conv_inter=settings['conv_interpolation']
+        self.diff_harm=(self.diff_inter!='Linear')
+        self.conv_harm=(self.conv_inter!='Linear')
+        self.work=geom_obj.work # Workspace buffers
+        self.kernels=geom_obj.kernels # Compute kernels
+        self.shape_x=self.dx[:,:-1].shape # x faces
+        self.shape_y=self.dx[:-1,:].shape # y faces
+        self.ghost_regions=[]
+        if mpi is not None:
+            self.ghost_regions=mpi.ghost_regions(geom_obj)
         
         # Define source terms and pointer to source object here
-        self.get_source=Source_Comb.Source_terms(Sources['Ea'], Sources['A0'], Sources['dH'], Sources['gas_gen'])
+        self.kinetics=Sources.get('Kinetics', 'Euler')
+        self.get_source=Source_Comb.Source_terms(Sources['Ea'], Sources['A0'], Sources['dH'], Sources['gas_gen'],\
+                                                 geom_obj.kernels, self.kinetics, Sources.get('Mechanism', 'Kim'))
         self.source_unif=Sources['Source_Uniform']
         self.source_Kim=Sources['Source_Kim']
         self.ign=st.split(Sources['Ignition'], ',')
         self.ign[0]=int(self.ign[0])
         self.ign[1]=int(self.ign[1])
+        self.ign_count=0 # Nodes meeting ignition criterion in last step
+        # Owned nodes (ignition criterion counted once over processes)
+        self.own=geom_obj.owned()
+        
+        # Implicit conduction operator
+        self.implicit=None
+        if self.time_scheme=='ADI':
+            self.implicit=ImplicitClasses.ADI(geom_obj, metrics, geom_obj.kernels, comm)
+        elif self.time_scheme=='IMEX':
+            self.implicit=ImplicitClasses.IMEX(geom_obj, metrics, geom_obj.kernels, comm)
+        
+        # Super-time-stepping for conduction (RKL2)
+        self.sts=(self.time_scheme=='RKL2')
+        # Conduction limits time step through Fo only for explicit schemes
+        self.Fo_limit=(self.implicit is None and not self.sts)
+        
+        # Runge-Kutta scheme (multistage explicit)
+        self.rk=None
+        if self.Fo_limit and self.time_scheme!='Explicit':
+            self.rk=temporal_schemes.runge_kutta(self.time_scheme)
+            if self.rk.Nk<0:
+                self.rk=None
+                if self.Domain.rank==0:
+                    print 'Using Explicit time advancement'
+        # Ghost node layers used per time step (exchange before each one
+        # once ghost node layers are used up)
+        self.ghost_layers=1
+        if self.rk is not None and geom_obj.ghost>=self.rk.Nk:
+            self.ghost_layers=self.rk.Nk
         
         # BC class
-        self.BCs=BCClasses.BCs(BCs, self.dx, self.dy, settings['Domain'])
-        self.BCs.X=geom_obj.X
+        self.BCs=BCClasses.BCs(BCs, self.dx, self.dy, settings['Domain'], metrics, geom_obj.kernels)
         # Ensure proper BCs for this process
         self.mult_BCs(BCs)
     
     # Modify BCs based on processes next to current one AND if multiple
     # BCs are specified on a given boundary
     def mult_BCs(self, BC_global):
+        x0=self.Domain.x_split[self.Domain.proc_col]
+        y0=self.Domain.y_split[self.Domain.proc_row]
         # Left boundary
         if self.Domain.proc_left>=0:
             self.BCs.BCs['bc_left_E']=['F', 0.0, (0, -1)]
@@ -68,51 +153,9 @@ class TwoDimSolver():
             self.BCs.BCs['bc_left_P']=['none', 0.0, (0, -1)]
         # Global boundary with multiple BCs
         elif len(BC_global['bc_left_E'])>3:
-            i=len(BC_global['bc_left_E'])/3
-            j=0
-            while i>j:
-                # Lower bound of BC in this process
-                if BC_global['bc_left_E'][2+3*j][0]>=self.Domain.proc_row*self.Domain.Ny\
-                    and BC_global['bc_left_E'][2+3*j][0]<(self.Domain.proc_row+1)*self.Domain.Ny:
-                    st=BC_global['bc_left_E'][2+3*j][0]-self.Domain.proc_row*self.Domain.Ny
-                    # upper bound of BC in this process
-                    if BC_global['bc_left_E'][2+3*j][1]<=(self.Domain.proc_row+1)*self.Domain.Ny:
-                        en=BC_global['bc_left_E'][2+3*j][1]-self.Domain.proc_row*self.Domain.Ny
-                    # upper bound outside this process
-                    else:
-                        en=self.Domain.Ny
-                    # Ghost node on bottom
-                    if self.Domain.proc_bottom>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_top<0:
-                        en+=1
-                    self.BCs.BCs['bc_left_E'][2+3*j]=(st,en)
-                    j+=1
-                # Lower bound of BC not in this process, but upper bound is
-                elif BC_global['bc_left_E'][2+3*j][1]<=(self.Domain.proc_row+1)*self.Domain.Ny\
-                    and BC_global['bc_left_E'][2+3*j][1]>self.Domain.proc_row*self.Domain.Ny:
-                    st=0
-                    en=BC_global['bc_left_E'][2+3*j][1]-self.Domain.proc_row*self.Domain.Ny
-                    # Ghost node on bottom
-                    if self.Domain.proc_bottom>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_top<0:
-                        en+=1
-                    self.BCs.BCs['bc_left_E'][2+3*j]=(st,en)
-                    j+=1
-                    
-                # Process lies inside the upper and lower bounds (are outside process)
-                elif BC_global['bc_left_E'][2+3*j][0]<self.Domain.proc_row*self.Domain.Ny\
-                    and BC_global['bc_left_E'][2+3*j][1]>(self.Domain.proc_row+1)*self.Domain.Ny:
-                    self.BCs.BCs['bc_left_E'][2+3*j]=(0,-1)
-                    j+=1
-                # BC has no effect on this process
-                else:
-                    del self.BCs.BCs['bc_left_E'][3*j:3+3*j]
-                    i-=1
-
+            self.local_BCs(self.BCs.BCs['bc_left_E'], y0, self.Domain.Ny,\
+                           self.Domain.proc_bottom, self.Domain.proc_top)
+        
         # Right boundary
         if self.Domain.proc_right>=0:
             self.BCs.BCs['bc_right_E']=['F', 0.0, (0, -1)]
@@ -120,58 +163,8 @@ class TwoDimSolver():
             self.BCs.BCs['bc_right_P']=['none', 0.0, (0, -1)]
         # Global boundary with multiple BCs
         elif len(BC_global['bc_right_E'])>3:
-            i=len(BC_global['bc_right_E'])/3
-            j=0
-            while i>j:
-                # Lower bound of BC in this process
-                if BC_global['bc_right_E'][2+3*j][0]>=self.Domain.proc_row*self.Domain.Ny\
-                    and BC_global['bc_right_E'][2+3*j][0]<(self.Domain.proc_row+1)*self.Domain.Ny:
-                    st=BC_global['bc_right_E'][2+3*j][0]-self.Domain.proc_row*self.Domain.Ny
-                    # upper bound of BC in this process
-                    if BC_global['bc_right_E'][2+3*j][1]<=(self.Domain.proc_row+1)*self.Domain.Ny:
-                        en=BC_global['bc_right_E'][2+3*j][1]-self.Domain.proc_row*self.Domain.Ny
-                    # upper bound outside this process
-                    else:
-                        en=self.Domain.Ny
-                    # Ghost node on bottom
-                    if self.Domain.proc_bottom>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_top<0:
-                        en+=1
-                    self.BCs.BCs['bc_right_E'][2+3*j]=(st,en)
-                    j+=1
-                # Lower bound of BC not in this process, but upper bound is
-                elif BC_global['bc_right_E'][2+3*j][1]<=(self.Domain.proc_row+1)*self.Domain.Ny\
-                    and BC_global['bc_right_E'][2+3*j][1]>self.Domain.proc_row*self.Domain.Ny:
-                    st=0
-                    en=BC_global['bc_right_E'][2+3*j][1]-self.Domain.proc_row*self.Domain.Ny
-                    # Ghost node on bottom
-                    if self.Domain.proc_bottom>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_top<0:
-                        en+=1
-                    self.BCs.BCs['bc_right_E'][2+3*j]=(st,en)
-                    j+=1
-                
-                # Process lies inside the upper and lower bounds (are outside process)
-                elif BC_global['bc_right_E'][2+3*j][0]<self.Domain.proc_row*self.Domain.Ny\
-                    and BC_global['bc_right_E'][2+3*j][1]>(self.Domain.proc_row+1)*self.Domain.Ny:
-                    self.BCs.BCs['bc_right_E'][2+3*j]=(0,-1)
-                    j+=1
-                # BC has no effect on this process
-                else:
-                    del self.BCs.BCs['bc_right_E'][3*j:3+3*j]
-                    i-=1
-        
-        # Locate column of current process
-        for i in range(len(self.Domain.proc_arrang[0,:])):
-            if self.Domain.rank in self.Domain.proc_arrang[:,i]:
-                coln=i
-                break
-            else:
-                continue
+            self.local_BCs(self.BCs.BCs['bc_right_E'], y0, self.Domain.Ny,\
+                           self.Domain.proc_bottom, self.Domain.proc_top)
         
         # Top boundary
         if self.Domain.proc_top>=0:
@@ -180,50 +173,8 @@ class TwoDimSolver():
             self.BCs.BCs['bc_north_P']=['none', 0.0, (0, -1)]
         # Global boundary with multiple BCs
         elif len(BC_global['bc_north_E'])>3:
-            i=len(BC_global['bc_north_E'])/3
-            j=0
-            while i>j:
-                # Lower bound of BC in this process
-                if BC_global['bc_north_E'][2+3*j][0]>=coln*self.Domain.Nx\
-                    and BC_global['bc_north_E'][2+3*j][0]<(coln+1)*self.Domain.Nx:
-                    st=BC_global['bc_north_E'][2+3*j][0]-coln*self.Domain.Nx
-                    # upper bound of BC in this process
-                    if BC_global['bc_north_E'][2+3*j][1]<=(coln+1)*self.Domain.Nx:
-                        en=BC_global['bc_north_E'][2+3*j][1]-coln*self.Domain.Nx
-                    # upper bound outside this process
-                    else:
-                        en=self.Domain.Nx
-                    # Ghost node on left
-                    if self.Domain.proc_left>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_right<0:
-                        en+=1
-                    self.BCs.BCs['bc_north_E'][2+3*j]=(st,en)
-                    j+=1
-                # Lower bound of BC not in this process, but upper bound is
-                elif BC_global['bc_north_E'][2+3*j][1]<=(coln+1)*self.Domain.Nx\
-                    and BC_global['bc_north_E'][2+3*j][1]>coln*self.Domain.Nx:
-                    st=0
-                    en=BC_global['bc_north_E'][2+3*j][1]-coln*self.Domain.Nx
-                    # Ghost node on left
-                    if self.Domain.proc_left>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_right<0:
-                        en+=1
-                    self.BCs.BCs['bc_north_E'][2+3*j]=(st,en)
-                    j+=1
-                
-                # Process lies inside the upper and lower bounds (are outside process)
-                elif BC_global['bc_north_E'][2+3*j][0]<coln*self.Domain.Nx\
-                    and BC_global['bc_north_E'][2+3*j][1]>(coln+1)*self.Domain.Nx:
-                    self.BCs.BCs['bc_north_E'][2+3*j]=(0,-1)
-                    j+=1
-                # BC has no effect on this process
-                else:
-                    del self.BCs.BCs['bc_north_E'][3*j:3+3*j]
-                    i-=1
+            self.local_BCs(self.BCs.BCs['bc_north_E'], x0, self.Domain.Nx,\
+                           self.Domain.proc_left, self.Domain.proc_right)
         
         # Bottom boundary
         if self.Domain.proc_bottom>=0:
@@ -232,63 +183,60 @@ class TwoDimSolver():
             self.BCs.BCs['bc_south_P']=['none', 0.0, (0, -1)]
         # Global boundary with multiple BCs
         elif len(BC_global['bc_south_E'])>3:
-            i=len(BC_global['bc_south_E'])/3
-            j=0
-            while i>j:
-                # Lower bound of BC in this process
-                if BC_global['bc_south_E'][2+3*j][0]>=coln*self.Domain.Nx\
-                    and BC_global['bc_south_E'][2+3*j][0]<(coln+1)*self.Domain.Nx:
-                    st=BC_global['bc_south_E'][2+3*j][0]-coln*self.Domain.Nx
-                    # upper bound of BC in this process
-                    if BC_global['bc_south_E'][2+3*j][1]<=(coln+1)*self.Domain.Nx:
-                        en=BC_global['bc_south_E'][2+3*j][1]-coln*self.Domain.Nx
-                    # upper bound outside this process
-                    else:
-                        en=self.Domain.Nx
-                    # Ghost node on left
-                    if self.Domain.proc_left>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_right<0:
-                        en+=1
-                    self.BCs.BCs['bc_south_E'][2+3*j]=(st,en)
-                    j+=1
-                # Lower bound of BC not in this process, but upper bound is
-                elif BC_global['bc_south_E'][2+3*j][1]<=(coln+1)*self.Domain.Nx\
-                    and BC_global['bc_south_E'][2+3*j][1]>coln*self.Domain.Nx:
-                    st=0
-                    en=BC_global['bc_south_E'][2+3*j][1]-coln*self.Domain.Nx
-                    # Ghost node on left
-                    if self.Domain.proc_left>=0:
-                        st+=1
-                        en+=1
-                    elif self.Domain.proc_right<0:
-                        en+=1
-                    self.BCs.BCs['bc_south_E'][2+3*j]=(st,en)
-                    j+=1
-                
-                # Process lies inside the upper and lower bounds (are outside process)
-                elif BC_global['bc_south_E'][2+3*j][0]<coln*self.Domain.Nx\
-                    and BC_global['bc_south_E'][2+3*j][1]>(coln+1)*self.Domain.Nx:
-                    self.BCs.BCs['bc_south_E'][2+3*j]=(0,-1)
-                    j+=1
-                # BC has no effect on this process
-                else:
-                    del self.BCs.BCs['bc_south_E'][3*j:3+3*j]
-                    i-=1
+            self.local_BCs(self.BCs.BCs['bc_south_E'], x0, self.Domain.Nx,\
+                           self.Domain.proc_left, self.Domain.proc_right)
+    
+    # Convert global node ranges of BCs along a boundary to local nodes of
+    # this process (owning N nodes from global node start, ghost node layers
+    # on either side included); BCs not on this process are removed
+    def local_BCs(self, BC, start, N, proc_before, proc_after):
+        lo=start-self.Domain.ghost*int(proc_before>=0)
+        hi=start+N+self.Domain.ghost*int(proc_after>=0)
+        i=0
+        while i<len(BC)/3:
+            st,en=BC[2+3*i]
+            # BC has no effect on this process
+            if st>=hi or en<=lo:
+                del BC[3*i:3+3*i]
+                continue
+            st=max(st, lo)-lo
+            en=min(en, hi)-lo
+            if proc_before<0 and proc_after<0:
+                en+=1
+            BC[2+3*i]=(st,en)
+            i+=1
         
-    # Time step check with dx, dy, Fo number
-    def getdt(self, k, rhoC, u, v):
-        # Time steps depending on Fo
-        dt_1=np.amin(self.Fo*rhoC/k*((self.dx)**2*(self.dy)**2)/\
-                     ((self.dx)**2+(self.dy)**2))
+    # Time step check with dx, dy, Fo number (owned nodes; ghost nodes may
+    # be out of date with several ghost node layers)
+    def getdt(self, k, rhoC, u, v, T):
+        own=self.own
+        w=self.work.get('dt_tmp')
+        w2=self.work.get('dt_tmp2')
+        # Time steps depending on Fo (implicit/super-time-stepping conduction
+        # only if dt not specified)
+        np.divide(rhoC, k, out=w)
+        w*=self.metrics.Fo_len
+        self.dt_Fo=self.Fo*np.amin(w[own])
+        dt_1=self.dt_Fo
+        if not self.Fo_limit and self.dt!='None':
+            dt_1=np.inf
         
         # Time steps depending on CFL (if flow model used)
-        u[u==0]=10**(-9)
-        v[v==0]=10**(-9)
-        dt_2=np.amin(self.CFL*(self.dx/np.abs(u)+self.dy/np.abs(v)))
+        np.abs(u, out=w)
+        np.maximum(w, 10**(-9), out=w)
+        np.divide(self.dx, w, out=w)
+        np.abs(v, out=w2)
+        np.maximum(w2, 10**(-9), out=w2)
+        np.divide(self.dy, w2, out=w2)
+        w+=w2
+        dt_2=self.CFL*np.amin(w[own])
+        
+        # Time step depending on reaction rate (implicit/super-time-stepping conduction)
+        dt_3=np.inf
+        if not self.Fo_limit and self.kinetics=='Euler' and (self.source_Kim=='True' or self.Domain.model=='Species'):
+            dt_3=self.CFL/(self.get_source.A0*np.exp(-self.get_source.Ea/self.get_source.R/np.amax(T[own])))
         
-        return min(dt_1,dt_2)
+        return min(dt_1,dt_2,dt_3)
     
     # Interpolation function
     def interpolate(self, k1, k2, func):
@@ -296,124 +244,239 @@ class TwoDimSolver():
             return 0.5*k1+0.5*k2
         else:
             return 2*k1*k2/(k1+k2)
+    
+    # Add divergence of face fluxes to a nodal variable
+    # flx: fluxes at x faces (between columns i and i+1), positive in +x
+    # fly: fluxes at y faces (between rows j and j+1), positive in +y
+    # Each face flux is computed once; what leaves one CV enters its neighbour
+    def flux_divergence(self, var, flx, fly, dt):
+        self.kernels.divergence(var, flx, fly, self.metrics.Ax_w, self.metrics.Ax_e,\
+                                self.metrics.Ay_s, self.metrics.Ay_n, dt)
         
-    # Main solver (1 time step)
-    def Advance_Soln_Cond(self, nt, t, hx, hy, ign):
-        max_Y,min_Y=0,1
-        u=np.zeros_like(hx)# Darcy velocity u for time step calculations
-        v=np.zeros_like(hx)# Darcy velocity v for time step calculations
-        # Calculate properties
-        T_c, k, rhoC, Cp=self.Domain.calcProp(self.Domain.T_guess)
+    # Properties, pressure and Darcy velocities from current state
+    # (buffers valid until next call)
+    def properties(self):
+        u=self.work.get('u')# Darcy velocity u for time step calculations
+        v=self.work.get('v')# Darcy velocity v for time step calculations
+        u_f,v_f=None,None
+        # Calculate properties; if ghost node exchange is in flight, ghost 
+        # node properties are recalculated once received (from same guess)
+        # Temperature guess is exchanged with several ghost node layers, so
+        # exchange finished first
+        if self.mpi is not None and self.Domain.ghost>1:
+            self.mpi.finish_ghosts(self.Domain)
+        if self.mpi is not None and self.mpi.ghosts_pending():
+            T_lag=self.work.get('T_lag')
+            np.copyto(T_lag, self.Domain.T_guess)
+            T_c, k, rhoC, Cp=self.Domain.calcProp(T_lag)
+            self.mpi.finish_ghosts(self.Domain)
+            for r in self.ghost_regions:
+                self.Domain.calcProp(T_lag, region=r)
+        else:
+            T_c, k, rhoC, Cp=self.Domain.calcProp(self.Domain.T_guess)
         
-        # Copy needed variables and set pointers to other variables
+        # Set pointers to needed variables
         if self.Domain.model=='Species':
-            rho_spec=copy.deepcopy(self.Domain.rho_species)
             species=self.Domain.species_keys
+            rho_g=self.Domain.rho_species[species[0]]
             mu=self.Domain.mu
             perm=self.Domain.perm
             # Calculate pressure
-            self.Domain.P=rho_spec[species[0]]/self.Domain.porosity*self.Domain.R*T_c
-            # Darcy velocities right/north faces
-            u[:,:-1]=(-self.interpolate(perm[:,1:],perm[:,:-1], self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:]-self.Domain.P[:,:-1])/self.dx[:,:-1])
-            v[:-1,:]=(-self.interpolate(perm[1:,:], perm[:-1,:], self.diff_inter)/mu\
-                    *(self.Domain.P[1:,:]-self.Domain.P[:-1,:])/self.dy[:-1,:])
+            np.divide(rho_g, self.Domain.porosity, out=self.Domain.P)
+            self.Domain.P*=self.Domain.R
+            self.Domain.P*=T_c
+            # Darcy velocities at x (right) and y (north) faces
+            u_f=self.work.get('u_f', self.shape_x)
+            v_f=self.work.get('v_f', self.shape_y)
+            self.kernels.darcy_vel(perm[:,:-1], perm[:,1:], self.Domain.P[:,:-1], self.Domain.P[:,1:],\
+                                   self.dx[:,:-1], mu, self.diff_harm, u_f)
+            self.kernels.darcy_vel(perm[:-1,:], perm[1:,:], self.Domain.P[:-1,:], self.Domain.P[1:,:],\
+                                   self.dy[:-1,:], mu, self.diff_harm, v_f)
+            u[:,:-1]=u_f
+            v[:-1,:]=v_f
+        
+        return T_c, k, rhoC, Cp, u, v, u_f, v_f
+    
+    # Compute time of this process since last call (load balancing); time
+    # waiting for ghost nodes excluded
+    def compute_time(self):
+        cost=self.cost
+        self.cost=0
+        if self.mpi is not None:
+            cost-=self.mpi.ghost_wait
+            self.mpi.ghost_wait=0
+        return cost
+    
+    # Free communicators of implicit operator (solver replaced after load
+    # balancing)
+    def free(self):
+        if self.implicit is not None:
+            self.implicit.free()
+    
+    # State of last time step from solver this one replaces (load balancing);
+    # reduction in flight, nodes meeting ignition criterion, combustion front
+    def take_state(self, old):
+        self.pending=old.pending
+        self.ign_count=old.ign_count
+        self.front=old.front
+    
+    # Scalars of a time step combined over processes: error code (maximum),
+    # nodes meeting ignition criterion (sum) and combustion front (if tracked)
+    def step_values(self, err):
+        values=[err, self.ign_count]
+        kinds=['max', 'sum']
+        if self.mpi.front_col is not None:
+            values+=list(self.mpi.front_values(self.Domain))
+            kinds+=self.mpi.front_kinds
+        return values, kinds
+    
+    # Properties and time step for next time step; time step combined over
+    # processes with error code, ignition and combustion front of last time
+    # step in one reduction (Overlap: last step's scalars reduced 
+    # non-blocking since end of last step, time step reduced separately)
+    # Returns error code, time step, ignition before and after last step
+    # (ignited once nodes meeting criterion over all processes exceed limit)
+    def Time_step(self, nt, t, err, ign):
+        t0=time.time()
+        self.props=self.properties()
+        T_c, k, rhoC, Cp, u, v, u_f, v_f=self.props
         
         # Get time step
         if self.dt=='None':
-            dt=self.getdt(k, rhoC, u, v)
-            # Collect all dt from other processes and send minimum
-            dt=self.comm.reduce(dt, op=MPI.MIN, root=0)
-            dt=self.comm.bcast(dt, root=0)
+            dt=self.getdt(k, rhoC, u, v, T_c)
+        else:
+            dt=min(self.dt,self.getdt(k, rhoC, u, v, T_c))
+        self.cost+=time.time()-t0
+        # Collect minimum dt (and Fo limited dt) from all processes
+        if self.mpi is None:
+            scalars=[dt, self.dt_Fo, err, self.ign_count]
+        elif self.pending is None:
+            values,kinds=self.step_values(err)
+            scalars=self.mpi.reduce([dt, self.dt_Fo]+values, ['min', 'min']+kinds)
         else:
-            dt=min(self.dt,self.getdt(k, rhoC, u, v))
-            # Collect all dt from other processes and send minimum
-            dt=self.comm.reduce(dt, op=MPI.MIN, root=0)
-            dt=self.comm.bcast(dt, root=0)
+            values=self.mpi.finish_reduce(self.pending)
+            self.pending=None
+            scalars=np.append(self.mpi.reduce([dt, self.dt_Fo], ['min', 'min']), values)
+        dt,self.dt_Fo=scalars[0],scalars[1]
+        err=int(scalars[2])
+        ign_0=ign
+        if scalars[3]>self.ign[1]:
+            ign=1
+        if self.mpi is not None and self.mpi.front_col is not None:
+            self.front=self.mpi.front_result(scalars[4:])
         if (np.isnan(dt)) or (dt<=0):
-            return 1, dt, ign
+            err=max(err, 1)
+        return err, dt, ign_0, ign
+    
+    # Main solver (1 time step of dt from Time_step); ign is ignition so far
+    # (criterion not checked once ignited)
+    def Advance_Soln_Cond(self, nt, t, dt, ign):
+        t0=time.time()
+        T_c, k, rhoC, Cp, u, v, u_f, v_f=self.props
         if self.Domain.rank==0:
             print 'Time step %i, Step size=%.7fms, Time elapsed=%fs;'%(nt+1,dt*1000, t+dt)
         
+        self.ign_count=0
+        if self.sts:
+            self.Super_time_step(dt, ign)
+        elif self.rk is None:
+            self.Euler(dt, ign, T_c, k, rhoC, Cp, u_f, v_f)
+        else:
+            self.Runge_Kutta(dt, ign, T_c, k, rhoC, Cp, u_f, v_f)
+        
+        # Save previous temp as initial guess for next time step; properties
+        # no longer those of current state
+        np.copyto(self.Domain.T_guess, T_c)
+        self.Domain.props_valid=False
+        ###################################################################
+        # Divergence/Convergence checks
+        ###################################################################
+        own=self.own
+        err=0
+        if (np.isnan(np.amax(T_c[own]))) or (np.amin(T_c[own])<=0):
+            err=2
+        elif (np.amax(self.Domain.eta[own])>1.0) or (np.amin(self.Domain.eta[own])<-10**(-9)):
+            err=3
+#        elif self.Domain.model=='Species' and ((min_Y<-100)\
+#                  or np.isnan(max_Y) or np.isinf(max_Y)):
+#            err=4
+        self.cost+=time.time()-t0
+        
+        if self.overlap:
+            values,kinds=self.step_values(err)
+            self.pending=self.mpi.start_reduce(values, kinds)
+        return err
+
+    # Forward Euler update of conserved variables from current state over dt
+    # (one step of Explicit/ADI/IMEX schemes or one Runge-Kutta stage)
+    # fl_diff: conduction increment if advanced separately (super-time-stepping)
+    def Euler(self, dt, ign, T_c, k, rhoC, Cp, u_f, v_f, fl_diff=None):
+        max_Y,min_Y=0,1
+        if self.Domain.model=='Species':
+            species=self.Domain.species_keys
+            rho_g=self.Domain.rho_species[species[0]]
+        
         ###################################################################
         # Calculate source and Porous medium terms
         ###################################################################
-        # Source terms
+        # Source terms; exponential/implicit kinetics are Strang split 
+        # (reaction over dt/2 at T of step start, transport, reaction over
+        # dt/2 at new T)
         E_unif,E_kim=0,0
+        dt_kin=dt
+        if self.kinetics!='Euler':
+            dt_kin=0.5*dt
         if self.source_unif!='None':
             E_unif      = self.source_unif
         if self.source_Kim=='True' or self.Domain.model=='Species':
-            E_kim, deta =self.get_source.Source_Comb_Kim(self.Domain.rho_0, T_c, self.Domain.eta, dt)
+            E_kim, deta =self.get_source.Source_Comb(self.Domain.rho_0, T_c, self.Domain.eta, dt_kin)
+        
+        ###################################################################
+        # Face fluxes (each control surface evaluated once)
+        ###################################################################
+        # Heat diffusion
+        eflx=self.work.get('eflx', self.shape_x)
+        efly=self.work.get('efly', self.shape_y)
+        if fl_diff is None:
+            self.kernels.diff_flux(k[:,:-1], k[:,1:], T_c[:,:-1], T_c[:,1:],\
+                                   self.dx[:,:-1], self.diff_harm, eflx)
+            self.kernels.diff_flux(k[:-1,:], k[1:,:], T_c[:-1,:], T_c[1:,:],\
+                                   self.dy[:-1,:], self.diff_harm, efly)
+        else:
+            eflx.fill(0)
+            efly.fill(0)
+        if self.Domain.model=='Species':
+            # Mass fluxes via Darcy's law and porous medium advection of enthalpy
+            mflx=self.work.get('mflx', self.shape_x)
+            mfly=self.work.get('mfly', self.shape_y)
+            self.kernels.adv_flux(rho_g[:,1:], rho_g[:,:-1], u_f, Cp[:,1:], Cp[:,:-1],\
+                                  T_c[:,1:], T_c[:,:-1], self.conv_harm, mflx, eflx)
+            self.kernels.adv_flux(rho_g[1:,:], rho_g[:-1,:], v_f, Cp[1:,:], Cp[:-1,:],\
+                                  T_c[1:,:], T_c[:-1,:], self.conv_harm, mfly, efly)
         
         ###################################################################
         # Conservation of Mass
         ###################################################################
-        flex=np.zeros_like(T_c)
-        fley=np.zeros_like(T_c)
+        fl=self.work.get('fl')
         if self.Domain.model=='Species':
-            # Use Darcy's law to directly calculate the velocities at the faces
-            # Axisymmetric domain flux in r
-            if self.Domain.type=='Axisymmetric':
-                # Left faces
-                flex[:,1:-1]+=dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                    *(self.Domain.X[:,1:-1]-self.dx[:,:-2]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,1:-1],rho_spec[species[0]][:,:-2],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:-1],perm[:,:-2],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:-1]-self.Domain.P[:,:-2])/self.dx[:,:-2])
-                flex[:,-1]+=dt/hx[:,-1]/(self.Domain.X[:,-1]-self.dx[:,-1]/2)\
-                    *(self.Domain.X[:,-1]-self.dx[:,-1]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,-1],rho_spec[species[0]][:,-2],self.conv_inter)\
-                    *(-self.interpolate(perm[:,-1],perm[:,-2],self.diff_inter)/mu\
-                    *(self.Domain.P[:,-1]-self.Domain.P[:,-2])/self.dx[:,-2])
-                    
-                # Right faces
-                flex[:,1:-1]-=dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                    *(self.Domain.X[:,1:-1]+self.dx[:,1:-1]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,2:],rho_spec[species[0]][:,1:-1], self.conv_inter)\
-                    *(-self.interpolate(perm[:,2:],perm[:,1:-1], self.diff_inter)/mu\
-                    *(self.Domain.P[:,2:]-self.Domain.P[:,1:-1])/self.dx[:,1:-1])
-                flex[:,0]-=dt/hx[:,0]/(self.dx[:,0]/2)\
-                    *(self.Domain.X[:,0]+self.dx[:,0]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,1],rho_spec[species[0]][:,0], self.conv_inter)\
-                    *(-self.interpolate(perm[:,1],perm[:,0], self.diff_inter)/mu\
-                    *(self.Domain.P[:,1]-self.Domain.P[:,0])/self.dx[:,0])
-            
-            # Planar domain flux in x
-            else:
-                flex[:,1:]+=dt/hx[:,1:]\
-                    *self.interpolate(rho_spec[species[0]][:,1:],rho_spec[species[0]][:,:-1],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:],perm[:,:-1],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:]-self.Domain.P[:,:-1])/self.dx[:,:-1])
-                    
-                # Right face
-                flex[:,:-1]-=dt/hx[:,:-1]\
-                    *self.interpolate(rho_spec[species[0]][:,1:],rho_spec[species[0]][:,:-1], self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:],perm[:,:-1], self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:]-self.Domain.P[:,:-1])/self.dx[:,:-1])
-                    
-            # South face
-            fley[1:,:]+=dt/hy[1:,:]\
-                *self.interpolate(rho_spec[species[0]][1:,:],rho_spec[species[0]][:-1,:],self.conv_inter)\
-                *(-self.interpolate(perm[1:,:],perm[:-1,:],self.diff_inter)/mu\
-                *(self.Domain.P[1:,:]-self.Domain.P[:-1,:])/self.dy[:-1,:])
-                
-            # North face
-            fley[:-1,:]-=dt/hy[:-1,:]\
-                *self.interpolate(rho_spec[species[0]][1:,:], rho_spec[species[0]][:-1,:], self.conv_inter)\
-                *(-self.interpolate(perm[1:,:], perm[:-1,:], self.diff_inter)/mu\
-                *(self.Domain.P[1:,:]-self.Domain.P[:-1,:])/self.dy[:-1,:])
-                
-            self.Domain.rho_species[species[0]]+=flex+fley
+            self.flux_divergence(rho_g, mflx, mfly, dt)
             
             # Source terms
             dm0,dm1=self.get_source.Source_mass(deta, self.Domain.porosity, self.Domain.rho_0)
-            self.Domain.rho_species[species[0]]+=dm0*dt
-            self.Domain.rho_species[species[1]]-=dm1*dt
+            dm0*=dt_kin
+            dm1*=dt_kin
+            self.Domain.rho_species[species[0]]+=dm0
+            self.Domain.rho_species[species[1]]-=dm1
                     
             # Apply pressure BCs (use new pressure given flux and source terms)
-            flex,fley=self.BCs.P(self.Domain.rho_species[species[0]]/self.Domain.porosity*self.Domain.R*T_c,\
-                                 self.Domain.R, T_c)
-            self.Domain.rho_species[species[0]]+=(flex+fley)*self.Domain.porosity
+            P_new=self.work.get('P_new')
+            np.divide(rho_g, self.Domain.porosity, out=P_new)
+            P_new*=self.Domain.R
+            P_new*=T_c
+            flex,fley=self.BCs.P(P_new, self.Domain.R, T_c)
+            np.add(flex, fley, out=fl)
+            np.multiply(fl, self.Domain.porosity, out=P_new)
+            self.Domain.rho_species[species[0]]+=P_new
             
             max_Y=max(np.amax(self.Domain.rho_species[species[0]]),\
                       np.amax(self.Domain.rho_species[species[1]]))
@@ -426,149 +489,229 @@ class TwoDimSolver():
         ###################################################################
         # Conservation of Energy
         ###################################################################
-        # Heat diffusion
-        flex*=Cp*T_c*self.Domain.porosity
-        fley*=Cp*T_c*self.Domain.porosity
-        # Axisymmetric domain flux in r
-        if self.Domain.type=='Axisymmetric':
-            #left faces
-            flex[:,1:-1]   -= dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                        *(self.Domain.X[:,1:-1]-self.dx[:,:-2]/2)\
-                        *self.interpolate(k[:,:-2],k[:,1:-1], self.diff_inter)\
-                        *(T_c[:,1:-1]-T_c[:,:-2])/self.dx[:,:-2]
-            flex[:,-1]   -= dt/hx[:,-1]/(self.Domain.X[:,-1]-self.dx[:,-1]/2)\
-                        *(self.Domain.X[:,-1]-self.dx[:,-1]/2)\
-                        *self.interpolate(k[:,-2],k[:,-1], self.diff_inter)\
-                        *(T_c[:,-1]-T_c[:,-2])/self.dx[:,-1]
-            
-            # Right face
-            flex[:,1:-1] += dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                        *(self.Domain.X[:,1:-1]+self.dx[:,1:-1]/2)\
-                        *self.interpolate(k[:,1:-1],k[:,2:], self.diff_inter)\
-                        *(T_c[:,2:]-T_c[:,1:-1])/self.dx[:,1:-1]
-            flex[:,0] += dt/hx[:,0]/(self.dx[:,0]/2)\
-                        *(self.Domain.X[:,0]+self.dx[:,0]/2)\
-                        *self.interpolate(k[:,0],k[:,1], self.diff_inter)\
-                        *(T_c[:,1]-T_c[:,0])/self.dx[:,0]
-        # Planar domain flux in r
+        # Enthalpy of mass leaving through pressure BCs
+        if self.Domain.model=='Species':
+            fl*=Cp
+            fl*=T_c
+            fl*=self.Domain.porosity
         else:
-            #left faces
-            flex[:,1:]   -= dt/hx[:,1:]\
-                        *self.interpolate(k[:,:-1],k[:,1:], self.diff_inter)\
-                        *(T_c[:,1:]-T_c[:,:-1])/self.dx[:,:-1]
-            # Right face
-            flex[:,:-1] += dt/hx[:,:-1]\
-                        *self.interpolate(k[:,:-1],k[:,1:], self.diff_inter)\
-                        *(T_c[:,1:]-T_c[:,:-1])/self.dx[:,:-1]
-        
-        # South face
-        fley[1:,:]   -= dt/hy[1:,:]\
-                    *self.interpolate(k[1:,:],k[:-1,:], self.diff_inter)\
-                    *(T_c[1:,:]-T_c[:-1,:])/self.dy[:-1,:]
-        # North face
-        fley[:-1,:]  += dt/hy[:-1,:]\
-                    *self.interpolate(k[:-1,:],k[1:,:], self.diff_inter)\
-                    *(T_c[1:,:]-T_c[:-1,:])/self.dy[:-1,:]
+            fl.fill(0)
+        if self.implicit is not None:
+            E_0=self.work.get('E_0')
+            np.copyto(E_0, self.Domain.E)
+        # Heat diffusion and porous medium advection
+        self.flux_divergence(fl, eflx, efly, dt)
         
         # Source terms
         self.Domain.E +=E_unif*dt
-        self.Domain.E +=E_kim *dt
-        
+        E_kim*=dt_kin
+        self.Domain.E +=E_kim
         
-        # Porous medium advection
-        if self.Domain.model=='Species':
-            # Axisymmetric domain flux in r
-            if self.Domain.type=='Axisymmetric':
-                # Left face
-                flex[:,1:-1]+=dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                    *(self.Domain.X[:,1:-1]-self.dx[:,:-2]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,1:-1],rho_spec[species[0]][:,:-2],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:-1],perm[:,:-2],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:-1]-self.Domain.P[:,:-2])/self.dx[:,:-2])\
-                    *self.interpolate(Cp[:,1:-1],Cp[:,:-2],self.conv_inter)\
-                    *self.interpolate(T_c[:,1:-1],T_c[:,:-2],self.conv_inter)
-                flex[:,-1]+=dt/hx[:,-1]/(self.Domain.X[:,-1]-self.dx[:,-1]/2)\
-                    *(self.Domain.X[:,-1]-self.dx[:,-2]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,-1],rho_spec[species[0]][:,-2],self.conv_inter)\
-                    *(-self.interpolate(perm[:,-1],perm[:,-2],self.diff_inter)/mu\
-                    *(self.Domain.P[:,-1]-self.Domain.P[:,-2])/self.dx[:,-2])\
-                    *self.interpolate(Cp[:,-1],Cp[:,-2],self.conv_inter)\
-                    *self.interpolate(T_c[:,-1],T_c[:,-2],self.conv_inter)
-                # Right face
-                flex[:,1:-1]-=dt/hx[:,1:-1]/(self.Domain.X[:,1:-1])\
-                    *(self.Domain.X[:,1:-1]+self.dx[:,1:-1]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,2:],rho_spec[species[0]][:,1:-1],self.conv_inter)\
-                    *(-self.interpolate(perm[:,2:],perm[:,1:-1],self.diff_inter)/mu\
-                    *(self.Domain.P[:,2:]-self.Domain.P[:,1:-1])/self.dx[:,1:-1])\
-                    *self.interpolate(Cp[:,2:],Cp[:,1:-1],self.conv_inter)\
-                    *self.interpolate(T_c[:,2:],T_c[:,1:-1],self.conv_inter)
-                flex[:,0]-=dt/hx[:,0]/(self.dx[:,0]/2)\
-                    *(self.Domain.X[:,0]+self.dx[:,0]/2)\
-                    *self.interpolate(rho_spec[species[0]][:,1],rho_spec[species[0]][:,0],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1],perm[:,0],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1]-self.Domain.P[:,0])/self.dx[:,0])\
-                    *self.interpolate(Cp[:,1],Cp[:,0],self.conv_inter)\
-                    *self.interpolate(T_c[:,1],T_c[:,0],self.conv_inter)
-            # Planar domain flux in r
-            else:
-                # Left face
-                flex[:,1:]+=dt/hx[:,1:]\
-                    *self.interpolate(rho_spec[species[0]][:,1:],rho_spec[species[0]][:,:-1],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:],perm[:,:-1],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:]-self.Domain.P[:,:-1])/self.dx[:,:-1])\
-                    *self.interpolate(Cp[:,1:],Cp[:,:-1],self.conv_inter)\
-                    *self.interpolate(T_c[:,1:],T_c[:,:-1],self.conv_inter)
-                # Right face
-                flex[:,:-1]-=dt/hx[:,:-1]\
-                    *self.interpolate(rho_spec[species[0]][:,1:],rho_spec[species[0]][:,:-1],self.conv_inter)\
-                    *(-self.interpolate(perm[:,1:],perm[:,:-1],self.diff_inter)/mu\
-                    *(self.Domain.P[:,1:]-self.Domain.P[:,:-1])/self.dx[:,:-1])\
-                    *self.interpolate(Cp[:,1:],Cp[:,:-1],self.conv_inter)\
-                    *self.interpolate(T_c[:,1:],T_c[:,:-1],self.conv_inter)
-            
-            # South face
-            fley[1:,:]+=dt/hy[1:,:]\
-                *self.interpolate(rho_spec[species[0]][1:,:],rho_spec[species[0]][:-1,:],self.conv_inter)\
-                *(-self.interpolate(perm[1:,:],perm[:-1,:],self.diff_inter)/mu\
-                *(self.Domain.P[1:,:]-self.Domain.P[:-1,:])/self.dy[:-1,:])\
-                *self.interpolate(Cp[1:,:],Cp[:-1,:],self.conv_inter)\
-                *self.interpolate(T_c[1:,:],T_c[:-1,:],self.conv_inter)
-            # North face
-            fley[:-1,:]-=dt/hy[:-1,:]\
-                *self.interpolate(rho_spec[species[0]][1:,:],rho_spec[species[0]][:-1,:],self.conv_inter)\
-                *(-self.interpolate(perm[1:,:],perm[:-1,:],self.diff_inter)/mu\
-                *(self.Domain.P[1:,:]-self.Domain.P[:-1,:])/self.dy[:-1,:])\
-                *self.interpolate(Cp[1:,:],Cp[:-1,:],self.conv_inter)\
-                *self.interpolate(T_c[1:,:],T_c[:-1,:],self.conv_inter)
-
         # Add diffusion and convective effects to energy
-        self.Domain.E += flex+fley
+        self.Domain.E += fl
         
 #        # Radiation effects
 #        self.Domain.T[1:-1,1:-1]+=0.8*5.67*10**(-8)*(T_c[:-2,1:-1]**4+T_c[2:,1:-1]**4+T_c[1:-1,:-2]**4+T_c[1:-1,2:]**4)
         
         # Apply boundary conditions
-        self.BCs.Energy(self.Domain.E, T_c, dt, rhoC, hx, hy)
-        
-        # Check for ignition
-        if ign==0 and self.source_Kim=='True':
-            fl=flex+fley
-            self.BCs.Energy(fl, T_c, dt, rhoC, hx, hy)
-            mx=len(np.where((E_kim*dt>self.ign[0]*abs(fl)) & (T_c>=600))[0]) #(fl<0) & 
-            if mx>self.ign[1]:
-                ign=1
-                
-        # Save previous temp as initial guess for next time step
-        self.Domain.T_guess=T_c.copy()
-        ###################################################################
-        # Divergence/Convergence checks
-        ###################################################################
-        if (np.isnan(np.amax(T_c))) or (np.amin(T_c)<=0):
-            return 2, dt, ign
-        if (np.amax(self.Domain.eta)>1.0) or (np.amin(self.Domain.eta)<-10**(-9)):
-            return 3, dt, ign
-#        elif self.Domain.model=='Species' and ((min_Y<-100)\
-#                  or np.isnan(max_Y) or np.isinf(max_Y)):
-#            return 4, dt, ign
-        else:
-            return 0, dt, ign
\ No newline at end of file
+        if fl_diff is None:
+            self.BCs.Energy(self.Domain.E, T_c, dt, rhoC)
+        
+        # Implicit conduction; explicit increment (with boundary heat and 
+        # change to fixed temperatures) becomes right hand side
+        if self.implicit is not None:
+            fixed=self.BCs.fixed_T()
+            self.BCs.Energy_fixed(self.Domain.E, rhoC, fixed)
+            dE=self.work.get('dE')
+            np.subtract(self.Domain.E, E_0, out=dE)
+            self.implicit.solve(dE, rhoC, k, dt, self.diff_harm, self.conv,\
+                                self.countmax, [index for index,T in fixed])
+            np.add(E_0, dE, out=self.Domain.E)
+        
+        # Ignition criterion (heat release over dt exceeds Ignition[0] times
+        # net heat transfer, T>=600 K); owned nodes counted in one pass, 
+        # skipped if no owned node at 600 K; heat transfer is the implicit
+        # increment less sources with implicit conduction
+        own=self.own
+        if ign==0 and self.source_Kim=='True' and np.amax(T_c[own])>=600:
+            if self.implicit is not None:
+                np.subtract(dE, E_kim, out=fl)
+                fl-=E_unif*dt
+            elif fl_diff is None:
+                self.BCs.Energy(fl, T_c, dt, rhoC)
+            else:
+                fl+=fl_diff
+            self.ign_count=self.kernels.ignition_count(E_kim[own], fl[own], T_c[own],\
+                                                       self.ign[0]*dt_kin/dt, 600)
+        
+        # Second half of reaction (exponential/implicit kinetics)
+        if self.kinetics!='Euler' and (self.source_Kim=='True' or self.Domain.model=='Species'):
+            self.reaction(dt_kin, T_c, rhoC)
+    
+    # Reaction over dt at current temperature (exponential/implicit kinetics);
+    # heat release and gas generation consistent with change in eta
+    # Temperature of owned nodes from heat capacity of this step (rhoC); 
+    # ghost nodes left at T_c as E there is not exchanged yet (replaced at 
+    # next exchange), so property buffers and T_guess are not changed
+    def reaction(self, dt, T_c, rhoC):
+        own=self.own
+        T=self.work.get('T_kin')
+        np.copyto(T, T_c)
+        np.divide(self.Domain.E[own], rhoC[own], out=T[own])
+        E_kim, deta =self.get_source.Source_Comb(self.Domain.rho_0, T, self.Domain.eta, dt)
+        E_kim*=dt
+        self.Domain.E +=E_kim
+        if self.Domain.model=='Species':
+            species=self.Domain.species_keys
+            dm0,dm1=self.get_source.Source_mass(deta, self.Domain.porosity, self.Domain.rho_0)
+            dm0*=dt
+            dm1*=dt
+            self.Domain.rho_species[species[0]]+=dm0
+            self.Domain.rho_species[species[1]]-=dm1
+    
+    # Conserved variables advanced by Runge-Kutta schemes
+    def state(self):
+        q=[('E',self.Domain.E)]
+        if self.source_Kim=='True' or self.Domain.model=='Species':
+            q.append(('eta',self.Domain.eta))
+        if self.Domain.model=='Species':
+            for key in self.Domain.species_keys:
+                q.append(('rho_'+key,self.Domain.rho_species[key]))
+        return q
+    
+    # Multistage Runge-Kutta update; each stage is an Euler update from the
+    # stage state (gives dt*f), ghost nodes exchanged before every later stage
+    # (unless a ghost node layer for each stage); nodes held at a temperature
+    # are reset in every stage state and the new solution
+    # Butcher: q_0 and dt*f of all stages stored; 2R/2N: two registers per field
+    def Runge_Kutta(self, dt, ign, T_c, k, rhoC, Cp, u_f, v_f):
+        rk=self.rk
+        q=self.state()
+        fixed=self.BCs.fixed_T()
+        r1=[self.work.get('rk_1'+name) for name,var in q]
+        r2=[self.work.get('rk_2'+name) for name,var in q]
+        if rk.storage=='Butcher':
+            A=rk.rk_coeff
+            K=[[self.work.get('rk_k%i'%(j)+name) for name,var in q] for j in range(rk.Nk)]
+            for (name,var),q0 in zip(q,r1):
+                np.copyto(q0, var)
+        
+        for i in range(rk.Nk):
+            if i>0:
+                if self.mpi is not None and self.ghost_layers<rk.Nk:
+                    self.mpi.update_ghosts(self.Domain)
+                T_c, k, rhoC, Cp, u, v, u_f, v_f=self.properties()
+            
+            # Stage increment dt*f(Q_i)
+            if rk.storage=='Butcher':
+                dq=K[i]
+            else:
+                dq=r2
+            for (name,var),reg in zip(q,dq):
+                np.copyto(reg, var)
+            # Ignition checked on first stage only (state at t)
+            if i==0:
+                self.Euler(dt, ign, T_c, k, rhoC, Cp, u_f, v_f)
+            else:
+                self.Euler(dt, 1, T_c, k, rhoC, Cp, u_f, v_f)
+            for (name,var),reg in zip(q,dq):
+                np.subtract(var, reg, out=reg)
+                var-=reg
+            
+            # Next stage state (or new solution)
+            for j in range(len(q)):
+                var=q[j][1]
+                if rk.storage=='Butcher' and i<rk.Nk-1:
+                    np.copyto(var, r1[j])
+                    for l in range(i+1):
+                        if A[i+1][l]!=0:
+                            var+=A[i+1][l]*K[l][j]
+                elif rk.storage=='Butcher':
+                    np.copyto(var, r1[j])
+                    for l in range(rk.Nk):
+                        var+=rk.rk_substep_fraction[l]*K[l][j]
+                elif rk.storage=='2R':
+                    # r2: dt*f_i, r1: dt*f_(i-1)
+                    var+=rk.rk_coeff[i][i]*r2[j]
+                    if i>0:
+                        var+=rk.rk_coeff[i][i-1]*r1[j]
+                else:
+                    # r1: Williamson register, r2: dt*f_i
+                    if i==0:
+                        np.copyto(r1[j], r2[j])
+                    else:
+                        r1[j]*=rk.rk_coeff[0][i]
+                        r1[j]+=r2[j]
+                    var+=rk.rk_coeff[1][i]*r1[j]
+            self.BCs.Energy_fixed(self.Domain.E, rhoC, fixed)
+            if rk.storage=='2R':
+                r1,r2=r2,r1
+    
+    # Conduction increment dt*L(E) with boundary conditions into out;
+    # fixed: nodes held at a temperature given zero increment (BCClasses.fixed_T)
+    def conduction(self, dt, T_c, k, rhoC, out, fixed=[]):
+        eflx=self.work.get('eflx', self.shape_x)
+        efly=self.work.get('efly', self.shape_y)
+        self.kernels.diff_flux(k[:,:-1], k[:,1:], T_c[:,:-1], T_c[:,1:],\
+                               self.dx[:,:-1], self.diff_harm, eflx)
+        self.kernels.diff_flux(k[:-1,:], k[1:,:], T_c[:-1,:], T_c[1:,:],\
+                               self.dy[:-1,:], self.diff_harm, efly)
+        np.copyto(out, self.Domain.E)
+        self.flux_divergence(out, eflx, efly, dt)
+        self.BCs.Energy(out, T_c, dt, rhoC)
+        out-=self.Domain.E
+        for index,T in fixed:
+            out[index]=0
+    
+    # Super-time-stepping: conduction over dt with RKL2 (Meyer, Balsara and 
+    # Aslam, J. Comput. Phys. 257, 2014), s stages chosen so that
+    # dt<=dt_Fo*(s^2+s-2)/4; sources and advection with Euler steps of dt/2
+    # before and after (Strang splitting); nodes held at a temperature are
+    # set before the stages and kept there
+    def Super_time_step(self, dt, ign):
+        dt_exp=self.dt_Fo # Minimum over processes (Time_step)
+        s=max(2, int(np.ceil((np.sqrt(9+16*dt/dt_exp)-1)/2)))
+        w1=4.0/(s*s+s-2)
+        b=[1.0/3]*3+[(j*j+j-2.0)/(2.0*j*(j+1)) for j in range(3,s+1)]
+        
+        E=self.Domain.E
+        Y0=self.work.get('sts_Y0')
+        Y2=self.work.get('sts_Y2') # Stage j-2
+        M0=self.work.get('sts_M0')
+        M=self.work.get('sts_M')
+        fixed=self.BCs.fixed_T()
+        
+        # Sources and advection; conduction increment at t for ignition check
+        T_c, k, rhoC, Cp, u, v, u_f, v_f=self.properties()
+        self.conduction(0.5*dt, T_c, k, rhoC, M)
+        self.Euler(0.5*dt, ign, T_c, k, rhoC, Cp, u_f, v_f, M)
+        self.BCs.Energy_fixed(E, rhoC, fixed)
+        
+        # Conduction
+        for j in range(1,s+1):
+            if self.mpi is not None:
+                self.mpi.update_ghosts(self.Domain)
+            T_c, k, rhoC, Cp, u, v, u_f, v_f=self.properties()
+            if j==1:
+                np.copyto(Y0, E)
+                np.copyto(Y2, E)
+                self.conduction(dt, T_c, k, rhoC, M0, fixed)
+                E+=b[1]*w1*M0
+                continue
+            self.conduction(dt, T_c, k, rhoC, M, fixed)
+            mu=(2*j-1.0)/j*b[j]/b[j-1]
+            nu=-(j-1.0)/j*b[j]/b[j-2]
+            M*=mu*w1
+            M+=mu*E
+            M+=nu*Y2
+            M+=(1-mu-nu)*Y0
+            M+=-(1-b[j-1])*mu*w1*M0
+            np.copyto(Y2, E)
+            np.copyto(E, M)
+        
+        # Sources and advection
+        if self.mpi is not None:
+            self.mpi.update_ghosts(self.Domain)
+        T_c, k, rhoC, Cp, u, v, u_f, v_f=self.properties()
+        self.Euler(0.5*dt, 1, T_c, k, rhoC, Cp, u_f, v_f, M0)
+        self.BCs.Energy_fixed(E, rhoC, fixed)
@@ -13,6 +13,12 @@ This file contains the Combustion source term classes:
 Features of Source_Kim:
     -Activation energy, pre-exponential factor, enthalpy of combustion
     -Enthalpy of combustion can be density or volume based (input file)
+    -Kinetics: 'Euler' (forward Euler), 'Exponential' (exact update with
+    temperature frozen over time step) or 'Implicit' (backward Euler, 
+    Newton iteration over all nodes); returned rate is consistent with 
+    change in eta over dt
+    -Mechanism: 'Kim' (single step) or 'Umbrajkar' (four parallel steps);
+    Umbrajkar kinetics are stiff and need 'Implicit' at practical time steps
 
 Notes on implementing Cantera:
     -sol=ct.Solution('___.cti') -> define solution mechanisms?
@@ -26,7 +32,7 @@ import string as st
 #import cantera as ct
 
 class Source_terms():
-    def __init__(self, Ea, A0, dH, gs_gen):
+    def __init__(self, Ea, A0, dH, gs_gen, kernels=None, kinetics='Euler', mechanism='Kim'):
         self.R=8.314 # J/mol/K
         self.Ea=Ea # J/mol
         self.A0=A0
@@ -34,7 +40,28 @@ class Source_terms():
         self.dH[1]=float(self.dH[1])
         self.n=0.2 # Temperature exponent
         self.gas_gen=gs_gen
+        self.kernels=kernels # Compute kernels; in-place evaluation if given
+        self.kinetics=kinetics
+        self.mechanism=mechanism
+        # Newton iteration (implicit kinetics)
+        self.tol=10**(-10) # Absolute tolerance on eta
+        self.max_iter=60 # Newton steps fall back to bisection if needed
+        self.eta_min=10**(-12) # Limit for singular Avrami-Erofeev rates
         
+        # Umbrajkar steps; [A, n, Ea, form], form 'AE' for Avrami-Erofeev 
+        # type or 'pow' for (1-eta)^n
+        self.steps_Umb=[[10**(6.68), 0.6, 78000, 'AE'],\
+                        [10**(5.15), 3.9, 79000, 'pow'],\
+                        [10**(5.03), 2.6, 102000, 'pow'],\
+                        [10**(13.3), 0.75, 266000, 'AE']]
+        
+    # Combustion source for selected mechanism
+    def Source_Comb(self, rho, T, eta, dt):
+        if self.mechanism=='Umbrajkar':
+            return self.Source_Comb_Umbrajkar(rho, T, eta, dt)
+        else:
+            return self.Source_Comb_Kim(rho, T, eta, dt)
+    
     # Uniform volumetric generation
     def Source_Uniform(self, Q, V):
         
@@ -44,7 +71,31 @@ class Source_terms():
     # K. Kim, "Computational Modeling of Combustion Wave in Nanoscale Thermite Reaction",
     # Int. J of Energy and Power engineering, vol.8, no.7, pp. 612-615, 2014.
     def Source_Comb_Kim(self, rho, T, eta, dt):
-        detadt=self.A0*(1-eta)*np.exp(-self.Ea/self.R/T)
+        if self.kinetics=='Implicit':
+            k=[self.A0*np.exp(-self.Ea/self.R/T)]
+            detadt=self.Newton(self.rate_Kim, k, eta, dt)
+            return self.Source_energy(rho, detadt), detadt
+        
+        # In-place evaluation into workspace buffers
+        if self.kernels is not None:
+            detadt=self.kernels.work.get('detadt')
+            E=self.kernels.work.get('E_source')
+            if self.kinetics=='Exponential':
+                self.kernels.arrhenius_exp(self.A0, self.Ea/self.R, eta, T, dt, detadt)
+            else:
+                self.kernels.arrhenius(self.A0, self.Ea/self.R, eta, T, dt, detadt)
+            
+            if st.find(self.dH[0], 'vol')>=0:
+                np.multiply(detadt, self.dH[1], out=E)
+            else:
+                np.multiply(rho, self.dH[1], out=E)
+                E*=detadt
+            return E, detadt
+        
+        if self.kinetics=='Exponential':
+            detadt=(eta-1)*np.expm1(-self.A0*dt*np.exp(-self.Ea/self.R/T))/dt
+        else:
+            detadt=self.A0*(1-eta)*np.exp(-self.Ea/self.R/T)
         eta+=dt*detadt
         
         # Clipping to 0
@@ -59,46 +110,117 @@ class Source_terms():
     # Umbrajkar, S et al., "Exothermic reactions in Al-CuO nanocomposites",
     # Thermochimica Acta, vol.451, pp. 34-43, 2006.
     def Source_Comb_Umbrajkar(self, rho, T, eta, dt):
-        # First temp range
-        A=10**(6.68)
-        n=0.6
-        Ea=78000
-        deta1=A*n*(eta-1)*np.log((1-eta)**(1-1/n))*np.exp(-Ea/8.314/T)
-        # Second temp range
-        A=10**(5.15)
-        n=3.9
-        Ea=79000
-        deta2=A*(1-eta)**n*np.exp(-Ea/8.314/T)
-        # Third temp range
-        A=10**(5.03)
-        n=2.6
-        Ea=102000
-        deta3=A*(1-eta)**n*np.exp(-Ea/8.314/T)
-        # Fourth temp range
-        A=10**(13.3)
-        n=0.75
-        Ea=266000
-        deta4=A*n*(eta-1)*np.log((1-eta)**(1-1/n))*np.exp(-Ea/8.314/T)
-        
-#        deta4=self.A0*(1-eta)*np.exp(-self.Ea/self.R/T)
+        k=[A*np.exp(-Ea/self.R/T) for A,n,Ea,form in self.steps_Umb]
+        # Implicit kinetics (also used if 'Exponential' specified)
+        if self.kinetics!='Euler':
+            detadt=self.Newton(self.rate_Umbrajkar, k, eta, dt)
+        else:
+            detadt=self.rate_Umbrajkar(eta, k)[0]
+            eta+=dt*detadt
         
-        detadt=deta1+deta2+deta3+deta4
-        eta+=dt*detadt
+        return self.Source_energy(rho, detadt), detadt
+    
+    # Rate of Kim model and its derivative wrt eta; k is rate constant
+    def rate_Kim(self, eta, k):
+        return k[0]*(1-eta), -k[0]
+    
+    # Sum of Umbrajkar rates and derivative wrt eta; k are rate constants 
+    # of each step; Avrami-Erofeev f=n*(1-eta)*(-ln(1-eta))**(1-1/n) is
+    # singular at eta=0 for n<1, so -ln(1-eta) limited to eta_min
+    def rate_Umbrajkar(self, eta, k):
+        u=np.maximum(1-eta, np.finfo(float).tiny)
+        L=-np.log(u)
+        floor=(L<self.eta_min)
+        L[floor]=self.eta_min
+        f=np.zeros_like(u)
+        df=np.zeros_like(u)
+        for i in range(len(k)):
+            A,n,Ea,form=self.steps_Umb[i]
+            if form=='AE':
+                p=1-1.0/n
+                Lp=L**(p-1)
+                f+=n*k[i]*u*L*Lp
+                # df/deta=-n*k*L**(p-1)*(L-p), zero where limited
+                Lp*=n*k[i]*(L-p)
+                Lp[floor]=0
+                df-=Lp
+            else:
+                f+=k[i]*u**n
+                df-=n*k[i]*u**(n-1)
+        return f, df
+    
+    # Backward Euler update of eta with T frozen over dt; 
+    # eta_new-eta-dt*rate(eta_new)=0 solved for all nodes at once with 
+    # Newton iteration (analytic derivative), safeguarded by bisection on
+    # bracket [0,1]; converged nodes are masked from further iterations
+    # Returns mean rate (eta_new-eta)/dt, eta updated in place
+    def Newton(self, rate, k, eta, dt):
+        eta0=eta.ravel()
+        x=eta0.copy()
+        k=[np.ravel(ki) for ki in k]
+        lo=np.zeros_like(x)
+        hi=np.ones_like(x)
+        act=np.arange(x.size) # Unconverged nodes
+        for i in range(self.max_iter):
+            xa=x[act]
+            f,df=rate(xa, [ki[act] for ki in k])
+            g=xa-eta0[act]-dt*f
+            dg=1-dt*df
+            # Update bracket around root
+            neg=(g<0)
+            lo[act[neg]]=xa[neg]
+            hi[act[~neg]]=xa[~neg]
+            # Newton step; bisection where outside bracket
+            bis=(dg<=0)
+            dg[bis]=1
+            xn=xa-g/dg
+            bis|=(xn<lo[act]) | (xn>hi[act])
+            xn[bis]=0.5*(lo[act[bis]]+hi[act[bis]])
+            x[act]=xn
+            act=act[np.abs(xn-xa)>self.tol]
+            if len(act)==0:
+                break
         
-        # Clipping to 0
-        eta[eta<10**(-5)]=0
+        if self.kernels is not None:
+            detadt=self.kernels.work.get('detadt')
+        else:
+            detadt=np.empty_like(eta)
+        np.subtract(x.reshape(eta.shape), eta, out=detadt)
+        eta+=detadt
+        detadt/=dt
+        return detadt
+    
+    # Energy source from reaction rate
+    def Source_energy(self, rho, detadt):
+        if self.kernels is not None:
+            E=self.kernels.work.get('E_source')
+            if st.find(self.dH[0], 'vol')>=0:
+                np.multiply(detadt, self.dH[1], out=E)
+            else:
+                np.multiply(rho, self.dH[1], out=E)
+                E*=detadt
+            return E
         
         if st.find(self.dH[0], 'vol')>=0:
-            return self.dH[1]*detadt, detadt
+            return self.dH[1]*detadt
         else:
-            return rho*self.dH[1]*detadt, detadt
+            return rho*self.dH[1]*detadt
     
     # Calculate mass source term
     def Source_mass(self, deta, por, m_0):
+        # In-place evaluation into workspace buffers
+        if self.kernels is not None:
+            dm0=self.kernels.work.get('dm0')
+            dm1=self.kernels.work.get('dm1')
+            np.multiply(deta, m_0, out=dm0)
+            dm0*=self.gas_gen
+            np.copyto(dm1, dm0)
+            return dm0,dm1
+        
 #        dm0=np.zeros_like(deta)
         dm0=deta*(m_0)*self.gas_gen
         dm1=deta*(m_0)*self.gas_gen
 #        dm0=deta*(m_0)/por
 #        dm1=deta*(m_0)/(1-por)
 #        dm[dm<10**(-9)]=0
-        return dm0,dm1
\ No newline at end of file
+        return dm0,dm1
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+######################################################
+#             2D Heat Conduction Solver              #
+#              Created by J. Mark Epps               #
+#          Part of Masters Thesis at UW 2018-2020    #
+######################################################
+
+This file contains a regression check of boundary conditions with implicit
+conduction and Runge-Kutta schemes:
+    -Called from command line by:
+        python Tests/regression_BCs.py
+    -Planar heat conduction (no source) from Input_File_pl.txt with a wall
+    held at a temperature (left), a heat flux between convective BCs (north)
+    -Implicit time schemes at time steps beyond the explicit stability limit
+    and Runge-Kutta schemes are compared with an explicit run at a fine 
+    time step
+    -Exits with 1 if a difference or the held wall temperature is out of
+    tolerance
+
+"""
+
+import numpy as np
+import os
+import sys
+import copy
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI=None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GeomClasses as Geom
+import SolverClasses as Solvers
+import FileClasses
+import mpi_routines
+import shm_routines
+
+input_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Input_File_pl.txt')
+case={'Nodes_x': 20, 'Nodes_y': 30, 'Model': 'Heat', 'rho_IC': 5109.0, 'Temperature_IC': 600.0}
+BCs_case={'bc_left_E': ['T', 600.0, (0, 30)],\
+          'bc_north_E': ['C', (30.0, 300.0), (0, 8), 'F', 4e8, (8, 12), 'C', (30.0, 300.0), (12, 20)]}
+# Time steps (multiple of explicit time step from Fo in input file),
+# tolerance on temperature difference to explicit run [K] (IMEX first order)
+schemes=[('ADI', 100, 0.5), ('IMEX', 100, 15.0), ('RK4', 1, 0.5), ('RKL2', 100, 0.5)]
+ref_steps=2000
+
+# Domain and solver for a time scheme and time step
+def setup(scheme, dt):
+    if MPI is not None:
+        comm=MPI.COMM_WORLD
+    else:
+        comm=shm_routines.SHM_comm()
+    settings={'MPI_Processes': 1, 'Output_format': 'npy', 'Step_reduction': 'Fused',\
+              'Ghost_width': 1, 'Load_balance': 'None', 'Threads': 1, 'Shared_processes': 1,\
+              'Property_tolerance': 0}
+    BCs={}
+    Sources={}
+    Species={}
+    FileClasses.FileIn(input_file, 0).Read_Input(settings, Sources, Species, BCs)
+    settings.update(case)
+    settings['Time_Scheme']=scheme
+    settings['dt']=dt
+    Sources['Source_Kim']='None'
+    BCs.update(BCs_case)
+
+    if isinstance(comm, shm_routines.SHM_comm):
+        mpi=shm_routines.SHM_comms(comm, 0, 1, Sources, Species, settings['Output_format'])
+    else:
+        mpi=mpi_routines.MPI_comms(comm, 0, 1, Sources, Species, settings['Output_format'])
+    domain=Geom.TwoDimDomain(settings, Species, settings['Domain'], 0)
+    domain.mesh(mpi.node_array)
+    hx,hy=domain.CV_dim(mpi.node_array)
+    mpi.MPI_discretize(domain, Solvers.ghost_width(settings))
+    hx=mpi.split_var(hx, domain)
+    hy=mpi.split_var(hy, domain)
+    mpi.node_free()
+    metrics=Geom.StencilMetrics(domain, hx, hy)
+    domain.create_var(Species)
+    solver=Solvers.TwoDimSolver(domain, settings, Sources, copy.deepcopy(BCs), comm, metrics, mpi)
+    T=settings['Temperature_IC']*np.ones_like(domain.E)
+    rhoC=domain.calcProp(T_guess=T, init=True)
+    domain.E=rhoC*T
+    return domain, solver
+
+# Temperature at t_end
+def run(scheme, dt, t_end):
+    domain,solver=setup(scheme, dt)
+    t,nt,ign=0,0,0
+    while t<t_end*(1-10**(-9)):
+        err,dt,ign_0,ign=solver.Time_step(nt, t, 0, ign)
+        dt=min(dt, t_end-t)
+        if err==0:
+            err=solver.Advance_Soln_Cond(nt, t, dt, ign)
+        if err>0:
+            sys.exit('Solver error %i with %s time scheme'%(err, scheme))
+        t+=dt
+        nt+=1
+    return domain.calcProp(domain.T_guess)[0].copy()
+
+dt_e=setup('Explicit', 'None')[1].Time_step(0, 0, 0, 0)[1]
+t_end=ref_steps*dt_e
+T_ref=run('Explicit', dt_e, t_end)
+print 'Explicit, dt=%.3e: T max %.3f K'%(dt_e, np.amax(T_ref))
+failed=0
+for scheme,factor,tol in schemes:
+    T=run(scheme, factor*dt_e, t_end)
+    diff=np.amax(np.abs(T-T_ref))
+    wall=np.amax(np.abs(T[:,0]-BCs_case['bc_left_E'][1]))
+    print '%s, dt=%.3e: difference %.3e K, held wall %.3e K'%(scheme, factor*dt_e, diff, wall)
+    if diff>tol or wall>10**(-9):
+        print '    FAILED (tolerance %.1e K)'%(tol)
+        failed=1
+sys.exit(failed)
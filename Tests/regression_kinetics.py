@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+######################################################
+#             2D Heat Conduction Solver              #
+#              Created by J. Mark Epps               #
+#          Part of Masters Thesis at UW 2018-2020    #
+######################################################
+
+This file contains a regression check of exponential and implicit kinetics
+on several MPI processes against a serial run:
+    -Called from command line by:
+        mpiexec -n 4 python Tests/regression_kinetics.py
+    -Needs mpi4py; run with one process, serial runs are only compared with
+    themselves
+    -Axisymmetric species case from Input_File_axi.txt (temperature
+    dependent gas properties) through ignition and front propagation
+    -Each kinetics option is run on all processes and on process 0 alone;
+    temperature, reaction progress and species densities must agree
+    -Exits with 1 if a difference is out of tolerance or ignition occurs at
+    a different time step
+
+"""
+
+import numpy as np
+import os
+import sys
+import copy
+from mpi4py import MPI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GeomClasses as Geom
+import SolverClasses as Solvers
+import FileClasses
+import mpi_routines
+
+input_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Input_File_axi.txt')
+case={'Nodes_x': 12, 'Nodes_y': 30, 'dt': 'None'}
+Sources_case={'Ignition': '10,1'}
+kinetics=['Exponential', 'Implicit']
+nsteps=600
+# Tolerance on maximum difference relative to maximum of serial run
+tol=10**(-12)
+
+# Domain, solver and communicator routines on processes of comm
+def setup(comm, kin):
+    rank=comm.Get_rank()
+    size=comm.Get_size()
+    settings={'MPI_Processes': size, 'Output_format': 'npy', 'Step_reduction': 'Fused',\
+              'Ghost_width': 1, 'Load_balance': 'None', 'Threads': 1, 'Shared_processes': 1,\
+              'Property_tolerance': 0}
+    BCs={}
+    Sources={}
+    Species={}
+    FileClasses.FileIn(input_file, 0).Read_Input(settings, Sources, Species, BCs)
+    settings.update(case)
+    Sources.update(Sources_case)
+    Sources['Kinetics']=kin
+
+    mpi=mpi_routines.MPI_comms(comm, rank, size, Sources, Species, settings['Output_format'])
+    domain=Geom.TwoDimDomain(settings, Species, settings['Domain'], rank)
+    domain.mesh(mpi.node_array)
+    hx,hy=domain.CV_dim(mpi.node_array)
+    mpi.MPI_discretize(domain, Solvers.ghost_width(settings))
+    hx=mpi.split_var(hx, domain)
+    hy=mpi.split_var(hy, domain)
+    mpi.node_free()
+    metrics=Geom.StencilMetrics(domain, hx, hy)
+    domain.create_var(Species)
+    solver=Solvers.TwoDimSolver(domain, settings, Sources, copy.deepcopy(BCs), comm, metrics, mpi)
+    T=settings['Temperature_IC']*np.ones_like(domain.E)
+    rhoC=domain.calcProp(T_guess=T, init=True)
+    domain.E=rhoC*T
+    return domain, solver, mpi, BCs
+
+# Fields after nsteps time steps (on process 0 of comm) and time step of
+# ignition
+def run(comm, kin):
+    domain,solver,mpi,BCs=setup(comm, kin)
+    t,err,ign,nt_ign=0,0,0,-1
+    for nt in range(nsteps+1):
+        mpi.start_ghosts(domain, solver.ghost_layers)
+        err,dt,ign_0,ign=solver.Time_step(nt, t, err, ign)
+        if err>0:
+            sys.exit('Solver error %i with %s kinetics'%(err, kin))
+        if ign==1 and ign_0==0:
+            nt_ign=nt
+            if domain.proc_top<0:
+                solver.BCs.BCs['bc_north_E']=BCs['bc_right_E']
+        if nt==nsteps:
+            break
+        err=solver.Advance_Soln_Cond(nt, t, dt, ign)
+        t+=dt
+
+    fields={'T': domain.temperature(), 'eta': domain.eta}
+    for key in domain.species_keys:
+        fields['rho_'+key]=domain.rho_species[key]
+    for key in fields.keys():
+        fields[key]=mpi.gather_var(fields[key], domain)
+    return fields, nt_ign
+
+comm=MPI.COMM_WORLD
+rank=comm.Get_rank()
+failed=0
+for kin in kinetics:
+    fields,nt_ign=run(comm, kin)
+    if rank==0:
+        ref,nt_ref=run(MPI.COMM_SELF, kin)
+        print '%s kinetics, %i processes: ignition at step %i (serial %i)'\
+            %(kin, comm.Get_size(), nt_ign, nt_ref)
+        if nt_ign!=nt_ref:
+            failed=1
+        for key in sorted(ref.keys()):
+            diff=np.amax(np.abs(fields[key]-ref[key]))/np.amax(np.abs(ref[key]))
+            print '    %s: difference %.3e (relative)'%(key, diff)
+            if diff>tol:
+                print '    FAILED (tolerance %.1e)'%(tol)
+                failed=1
+failed=comm.bcast(failed, root=0)
+sys.exit(failed)
@@ -17,6 +17,8 @@ This file contains the main executable script for solving 2D conduction:
     -Changes boundary conditions based on ignition criteria
     -Saves temperature data (.npy) at intervals defined in input file
     -Saves x,y meshgrid arrays (.npy) to output directory
+    -Parallel with MPI (mpiexec) or worker processes sharing memory on one
+    node (Shared_processes in input file; mpi4py not needed)
 
 Features:
     -Ignition condition met, will change north BC to that of right BC
@@ -35,18 +37,27 @@ import os
 import sys
 import time
 import copy
-from mpi4py import MPI
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI=None
 
 import GeomClasses as Geom
 import SolverClasses as Solvers
 import FileClasses
 import mpi_routines
+import shm_routines
 
 ##########################################################################
 # -------------------------------------Beginning
 ##########################################################################
 
-comm = MPI.COMM_WORLD
+# MPI processes (mpiexec) or, without mpi4py, serial until worker processes
+# sharing memory are started (Shared_processes)
+if MPI is not None:
+    comm = MPI.COMM_WORLD
+else:
+    comm = shm_routines.SHM_comm()
 rank = comm.Get_rank()
 size = comm.Get_size()
 
@@ -62,7 +73,9 @@ if rank==0:
     time_begin=time.time()
 
 # Get arguments to script execution
-settings={'MPI_Processes': size}
+settings={'MPI_Processes': size, 'Output_format': 'npy', 'Step_reduction': 'Fused',\
+          'Ghost_width': 1, 'Load_balance': 'None', 'Threads': 1, 'Shared_processes': 1,\
+          'Property_tolerance': 0}
 BCs={}
 Sources={}
 Species={}
@@ -85,6 +98,14 @@ if rank==0:
     print 'Reading input file...'
 fin=FileClasses.FileIn(input_file, 0)
 fin.Read_Input(settings, Sources, Species, BCs)
+# Worker processes on this node sharing memory (in place of MPI processes)
+if settings['Shared_processes']>1 and size==1:
+    if settings['Time_Scheme'] in ['ADI','IMEX']:
+        sys.exit('%s time scheme needs MPI processes; set Shared_processes:1'%(settings['Time_Scheme']))
+    comm = shm_routines.SHM_comm(settings['Shared_processes'])
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    settings['MPI_Processes']=size
 comm.Barrier()
 try:
     os.chdir(settings['Output_directory'])
@@ -101,20 +122,29 @@ except:
 if rank==0:
     print '################################'
     print 'Initializing geometry package...'
+if isinstance(comm, shm_routines.SHM_comm):
+    mpi=shm_routines.SHM_comms(comm, rank, size, Sources, Species, settings['Output_format'])
+else:
+    mpi=mpi_routines.MPI_comms(comm, rank, size, Sources, Species, settings['Output_format'])
+# Global mesh arrays held once per node until split to processes
 domain=Geom.TwoDimDomain(settings, Species, settings['Domain'], rank)
-domain.mesh()
-hx,hy=domain.CV_dim()
+domain.mesh(mpi.node_array)
+hx,hy=domain.CV_dim(mpi.node_array)
 if rank==0:
     print '################################'
     print 'Initializing MPI and solver...'
     np.save('X', domain.X, False)
     np.save('Y', domain.Y, False)
-mpi=mpi_routines.MPI_comms(comm, rank, size, Sources, Species)
-err=mpi.MPI_discretize(domain)
+ghost=Solvers.ghost_width(settings)
+if rank==0 and ghost<settings['Ghost_width']:
+    print 'Ghost_width of %i not used by %s time scheme; using 1'%(settings['Ghost_width'], settings['Time_Scheme'])
+err=mpi.MPI_discretize(domain, ghost)
 if err>0:
     sys.exit('Problem discretizing domain into processes')
 hx=mpi.split_var(hx, domain)
 hy=mpi.split_var(hy, domain)
+mpi.node_free()
+metrics=Geom.StencilMetrics(domain, hx, hy)
 #print '****Rank: %i, X array: %f, %f'%(rank, np.amin(domain.X[0,:]), np.amax(domain.X[0,:]))
 #print '****Rank: %i, X array shape:  '%(rank)+str(np.shape(domain.X))
 #print '****Rank: %i, Y array: %f, %f'%(rank, np.amin(domain.Y[:,0]), np.amax(domain.Y[:,0]))
@@ -122,7 +152,7 @@ hy=mpi.split_var(hy, domain)
 #print '****Rank: %i, vol/Area shapes: '%(rank)+str(vol.shape)+', '+str(Ax_l.shape)+', '+str(Ax_r.shape)
 #print '****Rank: %i, process arrangemtn: '%(rank)+str(domain.proc_arrang)
 domain.create_var(Species)
-solver=Solvers.TwoDimSolver(domain, settings, Sources, copy.deepcopy(BCs), comm)
+solver=Solvers.TwoDimSolver(domain, settings, Sources, copy.deepcopy(BCs), comm, metrics, mpi)
 if rank==0:
     settings['MPI_arrangment']=domain.proc_arrang.copy()
     print '################################'
@@ -136,7 +166,7 @@ if st.find(settings['Restart'], 'None')<0:
     i=len(times)
     j=0
     while i>j:
-        if st.find(times[j],'T')==0 and st.find(times[j],'.npy')>0 \
+        if (st.find(times[j],'T')==0 or st.find(times[j],'Data')==0) and st.find(times[j],'.npy')>0 \
             and st.find(times[j],str(settings['Restart']))>=0:
             times[j]=st.split(st.split(times[j],'_')[1],'.npy')[0]
 #            if st.find(times[j],str(settings['Restart']))>=0:
@@ -149,20 +179,15 @@ if st.find(settings['Restart'], 'None')<0:
     if time_max=='0.000000':
         sys.exit('Cannot find a file to restart a simulation with')
     
-    T=np.load('T_'+time_max+'.npy')
-    T=mpi.split_var(T, domain)
+    # Global arrays read once per node
+    T=mpi.load_var('T', time_max, domain)
     if st.find(Sources['Source_Kim'],'True')>=0:
-        eta=np.load('eta_'+time_max+'.npy')
-        domain.eta=mpi.split_var(eta, domain)
-        del eta
+        domain.eta=mpi.load_var('eta', time_max, domain)
     if domain.model=='Species':
-        P=np.load('P_'+time_max+'.npy')
-        domain.P=mpi.split_var(P, domain)
+        domain.P=mpi.load_var('P', time_max, domain)
         species=['g','s']
         for i in range(len(species)):
-            rho_species=np.load('rho_'+species[i]+'_'+time_max+'.npy')
-            domain.rho_species[species[i]]=mpi.split_var(rho_species, domain)
-        del rho_species, P
+            domain.rho_species[species[i]]=mpi.load_var('rho_'+species[i], time_max, domain)
             
 #if (bool(domain.rho_species)) and (st.find(settings['Restart'], 'None')>=0):
 #    for i in range(len(Species['Species'])):
@@ -198,9 +223,11 @@ mpi.save_data(domain, Sources, Species, time_max)
 ##########################################################################
 # -------------------------------------Solve
 ##########################################################################
-t,nt,tign=float(time_max)/1000,0,0 # time, number steps and ignition time initializations
+t,nt,tign,dt=float(time_max)/1000,0,0,0 # time, number steps, ignition time and time step initializations
 v_0,v_1,v,N=0,0,0,0 # combustion wave speed variables initialization
-dy=mpi.compile_var(domain.dY, domain)
+y_front=np.inf # combustion front location (eta=0.5)
+if st.find(Sources['Source_Kim'],'True')>=0:
+    mpi.front_init(domain, settings['Domain'])
 
 # Setup intervals to save data
 output_data_t,output_data_nt=0,0
@@ -213,36 +240,44 @@ elif settings['total_time']=='None':
     settings['total_time']=settings['total_time_steps']*10**12
     t_inc=0
 
-# Ignition conditions
-ign,ign_0=0,0
+# Ignition conditions and error code
+ign,ign_0,err=0,0,0
+
+# Load balancing interval (time steps) and tolerance (maximum/mean compute
+# time of processes)
+balance=[0,0]
+if st.find(settings['Load_balance'], 'None')<0 and size>1:
+    balance=st.split(settings['Load_balance'], ',')
+    balance=[int(balance[0]), float(balance[1])]
 
 if rank==0:
     print 'Solving:'
-while nt<settings['total_time_steps'] and t<settings['total_time']:
-    # First point in calculating combustion propagation speed
-    if st.find(Sources['Source_Kim'],'True')>=0 and ign==1:
-        eta=mpi.compile_var(domain.eta, domain)
-        if rank==0:
-            if st.find(settings['Domain'], 'Axisymmetric')>=0:
-                v_0=np.sum(eta[:,0]*dy[:,0])
-            else:
-                v_0=np.sum(eta[:,int(len(eta[0,:])/2)]*dy[:,int(len(eta[0,:])/2)])
+while True:
+    # Load balancing; process boundaries moved by compute time of processes
+    # since last check, solver set up again for new local arrays
+    if balance[0]>0 and nt>0 and nt%balance[0]==0:
+        CV=mpi.rebalance(domain, solver.compute_time(), balance[1], [hx, hy])
+        if CV is not None:
+            hx,hy=CV
+            metrics=Geom.StencilMetrics(domain, hx, hy)
+            old=solver
+            solver=Solvers.TwoDimSolver(domain, settings, Sources, copy.deepcopy(BCs), comm, metrics, mpi)
+            solver.take_state(old)
+            old.free()
+            del old
+            if ign==1 and domain.proc_top<0:
+                solver.BCs.BCs['bc_north_E']=BCs['bc_right_E']
+            if rank==0:
+                print 'Load balancing: process columns start at x nodes '+str(domain.x_split[:-1])\
+                    +', rows at y nodes '+str(domain.y_split[:-1])
     
-    # Update ghost nodes
-    mpi.update_ghosts(domain)
-    # Actual solve
-    err,dt,ign=solver.Advance_Soln_Cond(nt, t, hx, hy, ign)
-    t+=dt
-    nt+=1
-    # Check all error codes and send the maximum code to all processes
-    err=comm.reduce(err, op=MPI.MAX, root=0)
-    err=comm.bcast(err, root=0)
-    ign_0=ign
-    # Check all ignition codes and send maximum
-    ign_0=comm.reduce(ign_0, op=MPI.MIN, root=0)
-    ign_0=comm.bcast(ign_0, root=0)
-    ign=comm.reduce(ign, op=MPI.MAX, root=0)
-    ign=comm.bcast(ign, root=0)
+    # Update ghost nodes (non-blocking; finished by solver after properties
+    # of owned nodes are calculated)
+    mpi.start_ghosts(domain, solver.ghost_layers)
+    # Properties and time step; error code, ignition (before and after last
+    # step, from nodes meeting criterion on all processes) and combustion 
+    # front of last step combined with time step in one reduction
+    err,dt_next,ign_0,ign=solver.Time_step(nt, t, err, ign)
     
     if err>0:
         if rank==0:
@@ -258,44 +293,57 @@ while nt<settings['total_time_steps'] and t<settings['total_time']:
         mpi.save_data(domain, Sources, Species, '{:f}'.format(t*1000))
         break
     
-    # Change boundary conditions if ignition occurs
-    if ign==1 and ign_0==0:
-        if domain.proc_top<0:
-            solver.BCs.BCs['bc_north_E']=BCs['bc_right_E']
-        if rank==0:
-	    print 'Ignition occurred at t=%f ms'%(t*1000)
-            input_file=open('Input_file.txt', 'a')
-            input_file.write('##bc_north_E_new:')
-            input_file.write(str(BCs['bc_right_E'])+'\n')
-            input_file.close()
-            tign=t
-        mpi.save_data(domain, Sources, Species, '{:f}'.format(t*1000))
+    # Last step (if any) ignition, propagation speed and output
+    if nt>0:
+        # Change boundary conditions if ignition occurs
+        if ign==1 and ign_0==0:
+            if domain.proc_top<0:
+                solver.BCs.BCs['bc_north_E']=BCs['bc_right_E']
+            if rank==0:
+                print 'Ignition occurred at t=%f ms'%(t*1000)
+                input_file=open('Input_file.txt', 'a')
+                input_file.write('##bc_north_E_new:')
+                input_file.write(str(BCs['bc_right_E'])+'\n')
+                input_file.close()
+                tign=t
+            mpi.save_data(domain, Sources, Species, '{:f}'.format(t*1000))
+            
+        # Second point in calculating combustion propagation speed
+        if st.find(Sources['Source_Kim'],'True')>=0 and ign==1 and ign_0==1:
+            v_1,y_front=solver.front
+            if rank==0:
+                if (v_1-v_0)/dt>0.01:
+                    v+=(v_1-v_0)/dt
+                    N+=1
         
-    # Second point in calculating combustion propagation speed
-    if st.find(Sources['Source_Kim'],'True')>=0 and ign==1 and ign_0==1:
-        eta=mpi.compile_var(domain.eta, domain)
-        if rank==0:
-            if st.find(settings['Domain'], 'Axisymmetric')>=0:
-                v_1=np.sum(eta[:,0]*dy[:,0])
-            else:
-                v_1=np.sum(eta[:,int(len(eta[0,:])/2)]*dy[:,int(len(eta[0,:])/2)])
-            if (v_1-v_0)/dt>0.01:
-                v+=(v_1-v_0)/dt
-                N+=1
+        # Output data to numpy files
+        if (output_data_nt!=0 and nt%output_data_nt==0) or \
+            (output_data_t!=0 and (t>=output_data_t*t_inc and t-dt<output_data_t*t_inc)):
+            if rank==0:
+                print 'Saving data to numpy array files...'
+                input_file=open('Input_file.txt', 'a')
+                try:
+                    input_file.write('Wave speed [m/s] at t=%f ms: inst-%.2f, avg-%.2f\n'%(t*1000, (v_1-v_0)/dt, v/N))
+                except:
+                    input_file.write('Wave speed [m/s] at t=%f ms: 0 m/s\n'%(t*1000))
+                if y_front<np.inf:
+                    input_file.write('Combustion front (eta=0.5) [mm] at t=%f ms: %f\n'%(t*1000, y_front*1000))
+                input_file.close()
+            mpi.save_data(domain, Sources, Species, '{:f}'.format(t*1000))
+            t_inc+=1
     
-    # Output data to numpy files
-    if (output_data_nt!=0 and nt%output_data_nt==0) or \
-        (output_data_t!=0 and (t>=output_data_t*t_inc and t-dt<output_data_t*t_inc)):
-        if rank==0:
-            print 'Saving data to numpy array files...'
-            input_file=open('Input_file.txt', 'a')
-            try:
-                input_file.write('Wave speed [m/s] at t=%f ms: inst-%.2f, avg-%.2f\n'%(t*1000, (v_1-v_0)/dt, v/N))
-            except:
-                input_file.write('Wave speed [m/s] at t=%f ms: 0 m/s\n'%(t*1000))
-            input_file.close()
-        mpi.save_data(domain, Sources, Species, '{:f}'.format(t*1000))
-        t_inc+=1
+    if nt>=settings['total_time_steps'] or t>=settings['total_time']:
+        break
+    
+    # First point in calculating combustion propagation speed
+    if st.find(Sources['Source_Kim'],'True')>=0 and ign==1:
+        v_0,y_front=solver.front
+    
+    # Actual solve
+    dt=dt_next
+    err=solver.Advance_Soln_Cond(nt, t, dt, ign)
+    t+=dt
+    nt+=1
         
 if rank==0:
     time_end=time.time()
@@ -303,8 +351,8 @@ if rank==0:
     input_file.write('Final time step size: %f microseconds\n'%(dt*10**6))
     print 'Ignition time: %f ms'%(tign*1000)
     input_file.write('Ignition time: %f ms\n'%(tign*1000))
-    print 'Solver time per 1000 time steps: %f min'%((time_end-time_begin)/60.0*1000/nt)
-    input_file.write('Solver time per 1000 time steps: %f min\n'%((time_end-time_begin)/60.0*1000/nt))
+    print 'Solver time per 1000 time steps: %f min'%((time_end-time_begin)/60.0*1000/max(nt,1))
+    input_file.write('Solver time per 1000 time steps: %f min\n'%((time_end-time_begin)/60.0*1000/max(nt,1)))
     print 'Number of time steps completed: %i'%(nt)
     input_file.write('Number of time steps completed: %i\n'%(nt))
     try:
@@ -10,130 +10,182 @@ This file contains the MPI routines:
     -
     
 Features:
+    -Cartesian process grid chosen for least ghost nodes; remainder rows and
+    columns of nodes spread over first processes
     -Ignition condition met, will change north BC to that of right BC
     -Saves temperature and reaction data (.npy) depending on input file 
-    settings
+    settings; gathered to process 0 only (subarray datatypes into global
+    array), compile_var is the all-gather for when every process needs it
+    -Combustion front (burned length and eta=0.5 location) along axis or
+    centreline from partial values on each process (combined in per time
+    step reduction)
+    -Scalars combined over processes packed in one buffer, one Allreduce 
+    (each entry minimum, maximum or sum); non-blocking variant
+    -MPI-IO output: all processes write owned nodes into one file per output
+    time (Data_[time].npy; .npy arrays in sequence, read by 
+    FileClasses.load_data)
+    -Non-blocking ghost node exchange with 8 neighbours (one message per 
+    neighbour, persistent requests); started before time step, finished by
+    solver once owned node properties are calculated
+    -Load balancing: process row/column boundaries moved by measured compute
+    time of each process; node arrays migrated with one Alltoallw each 
+    (subarray datatypes from old owned nodes to new local arrays)
+    -Read-mostly global arrays (mesh, CV dimensions, restart fields, 
+    compile_var result) held once per node in shared memory windows 
+    (MPI.Win.Allocate_shared); local arrays copied out, windows freed
+    -Without mpi4py (or with Shared_processes), processes on one node share
+    memory instead (shm_routines.py, same interface)
 
 """
 
 import numpy as np
 import string as st
+import io
+import FileClasses
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI=None # Shared memory processes only (shm_routines.py)
+
+# Reduction combining each entry of a buffer of doubles by minimum, maximum
+# or sum (kinds); entries of one buffer reduced with one op (small buffers,
+# not split by MPI)
+def reduce_op(kinds):
+    kinds=np.array(kinds)
+    mins,maxs,sums=(kinds=='min'),(kinds=='max'),(kinds=='sum')
+    def combine(inbuf, outbuf, datatype):
+        a=np.frombuffer(inbuf, dtype=float)
+        b=np.frombuffer(outbuf, dtype=float)
+        b[mins]=np.minimum(a[mins], b[mins])
+        b[maxs]=np.maximum(a[maxs], b[maxs])
+        b[sums]+=a[sums]
+    return MPI.Op.Create(combine, commute=True)
 
 class MPI_comms():
-    def __init__(self, comm, rank, size, Sources, Species):
+    def __init__(self, comm, rank, size, Sources, Species, output='npy'):
         self.comm=comm
         self.rank=rank
         self.size=size
         self.Sources=Sources
         self.Species=Species
+        self.output=output # Output format; npy or MPI-IO
+        self.front_col=None # Combustion front column (if tracked)
+        self.ghost_wait=0 # Time waiting for ghost nodes (load balancing)
+        self.reduce_ops={} # Reduction ops by buffer layout
+        self.node=None # Processes on this node (shared memory windows)
+        self.windows=[] # Node shared global arrays until node_free
+        self.compile_buf=None # Node shared global array of compile_var
         
     # Function to split global array to processes
-    # Use for MPI_discretize and restart
+    # Use for MPI_discretize and restart; local array is a copy (global
+    # array can be freed)
     def split_var(self, var_global, domain):
-        var_local=np.zeros(2)
-        maxDim=len(domain.proc_arrang[0,:])
-        for i in range(self.size/maxDim):
-            # Only take parts of array if process belongs to this part of arrangment
-            # Unique case where there is only one row of processes
-            if self.rank in domain.proc_arrang[i] and maxDim==1:
-                # Process at y=0
-                if i==0:
-                    var_local=var_global[(i)*domain.Ny:(i+1)*domain.Ny+1,:]
-                    
-                # Process at y=y_max
-                elif i==self.size/maxDim-1:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny,:]
-                    
-                # Interior
-                else:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny+1,:]
-                    
-            # Processes at y=0
-            elif self.rank in domain.proc_arrang[i] and i==0:
-                # Corner x=0
-                if self.rank==domain.proc_arrang[i,0]:
-                    var_local=var_global[(i)*domain.Ny:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-                    
-                    
-                # Corner x=x_max
-                elif self.rank==domain.proc_arrang[i,-1]:
-                    var_local=var_global[(i)*domain.Ny:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx]
-                    
-                    
-                # Interior processes
-                else:
-                    var_local=var_global[(i)*domain.Ny:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-                    
-            # Processes at y=y_max
-            elif self.rank in domain.proc_arrang[i] and i==self.size/maxDim-1:
-                # Edge x=0
-                if self.rank==domain.proc_arrang[i,0]:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-                    
-                # Edge x=x_max
-                elif self.rank==domain.proc_arrang[i,-1]:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx]
-                    
-                # Interior processes
-                else:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-                    
-            
-            # Interior y values
-            elif self.rank in domain.proc_arrang[i]:
-                # Edge x=0
-                if self.rank==domain.proc_arrang[i,0]:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-                    
-                    
-                # Edge x=x_max
-                elif self.rank==domain.proc_arrang[i,-1]:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx]
-                    
-                # Interior processes
-                else:
-                    var_local=var_global[(i)*domain.Ny-1:(i+1)*domain.Ny+1,\
-                          (self.rank-domain.proc_arrang[i,0])*domain.Nx-1:(self.rank-domain.proc_arrang[i,0]+1)*domain.Nx+1]
-        
+        j0,j1,i0,i1=self.local_range(domain, domain.proc_row, domain.proc_col,\
+                                     domain.x_split, domain.y_split)
+        var_local=var_global[j0:j1,i0:i1].copy()
+        return var_local
+    
+    # Shared memory window of processes on this node holding a global array
+    # (memory on first process of node); returns array and window (None if
+    # 1 process)
+    def node_window(self, shape):
+        if self.size==1:
+            return np.empty(shape),None
+        if self.node is None:
+            self.node=self.comm.Split_type(MPI.COMM_TYPE_SHARED)
+            self.node_roots=[i for i,r in enumerate(self.comm.allgather(self.node.Get_rank())) if r==0]
+        size=8*int(np.prod(shape))*int(self.node.Get_rank()==0)
+        win=MPI.Win.Allocate_shared(size, 8, comm=self.node)
+        buf,itemsize=win.Shared_query(0)
+        return np.ndarray(buffer=buf, dtype=float, shape=shape),win
+    
+    # Read-mostly global array (mesh, restart fields) held once per node;
+    # fill(array) called by first process of node, array read by all once
+    # returned; valid until node_free
+    def node_array(self, shape, fill):
+        var,win=self.node_window(shape)
+        if win is None:
+            fill(var)
+            return var
+        if self.node.Get_rank()==0:
+            fill(var)
+        self.node.Barrier()
+        self.windows.append(win)
+        return var
+    
+    # Free node shared global arrays (once split into local arrays)
+    def node_free(self):
+        for win in self.windows:
+            win.Free()
+        self.windows=[]
+    
+    # Local array of variable saved at given time (restart); global array
+    # read once per node
+    def load_var(self, name, time, domain):
+        shape=(domain.y_split[-1], domain.x_split[-1])
+        var=self.node_array(shape, lambda a: np.copyto(a, FileClasses.load_data(name, time)))
+        var_local=self.split_var(var, domain)
+        self.node_free()
         return var_local
     
-    # MPI discretization routine
-    def MPI_discretize(self, domain):
+    # Global nodes [j0, j1, i0, i1] in local arrays of process in row, col of
+    # process grid for given splits; owned nodes plus ghost node layers on 
+    # sides with a neighbour
+    def local_range(self, domain, row, col, x_split, y_split):
+        rows,cols=domain.proc_arrang.shape
+        w=domain.ghost
+        return [y_split[row]-w*int(row>0), y_split[row+1]+w*int(row<rows-1),\
+                x_split[col]-w*int(col>0), x_split[col+1]+w*int(col<cols-1)]
+    
+    # Nodes in each part when N nodes are split into n parts (remainder
+    # nodes go to first parts); returns global node each part starts at
+    def split_nodes(self, N, n):
+        nodes=np.zeros(n+1, dtype=int)
+        nodes[1:]=N/n
+        nodes[1:N%n+1]+=1
+        return np.cumsum(nodes)
+    
+    # Process grid [rows, columns] with least ghost nodes (total length of 
+    # process boundaries) for mesh Nx by Ny; at least 2 nodes per process
+    # in each direction (and as many as ghost node layers)
+    def process_grid(self, Nx, Ny, ghost=1):
+        grid=[]
+        halo=-1
+        n=max(2, ghost)
+        for cols in range(1, self.size+1):
+            rows=self.size/cols
+            if self.size%cols!=0 or Nx<n*cols or Ny<n*rows:
+                continue
+            length=(cols-1)*Ny+(rows-1)*Nx
+            if halo<0 or length<halo:
+                grid=[rows, cols]
+                halo=length
+        return grid
+    
+    # MPI discretization routine; ghost node layers on sides with a
+    # neighbour (more than 1 for several explicit updates per exchange)
+    def MPI_discretize(self, domain, ghost=1):
         # Determine process arrangement
-        ranks=np.linspace(0, self.size-1, self.size).astype(int) # Array of processes
-        maxDim=int(np.sqrt(self.size))+1 # Square root of size (max dimension)
-        
-        while maxDim>=1:
-            if self.size%maxDim==0 and domain.Nx%maxDim==0 and domain.Ny%(self.size/maxDim)==0:
-                ranks=ranks.reshape((self.size/maxDim, maxDim))
-		break
-	    elif self.size%maxDim==0 and domain.Nx%(self.size/maxDim)==0 and domain.Ny%maxDim==0:
-		ranks=ranks.reshape((maxDim, self.size/maxDim))
-		break
-            else:
-		maxDim-=1
-        if maxDim==0:
+        domain.ghost=ghost
+        dims=self.process_grid(domain.Nx, domain.Ny, ghost)
+        if len(dims)==0:
             return 1
-        #ranks=ranks.reshape((self.size/maxDim, maxDim))
-        domain.proc_arrang=ranks # Save process arrangment to each process domain class
-        for i in range(len(domain.proc_arrang[:,0])):
-                if self.rank in domain.proc_arrang[i,:]:
-                    domain.proc_row=i
-                    break
-                else:
-                    continue
+        # Cartesian communicator; rank order not changed so process
+        # arrangement is ranks in row major order (row 0 at y=0)
+        self.cart=self.comm.Create_cart(dims, periods=[False, False], reorder=False)
+        domain.proc_arrang=np.arange(self.size).reshape(dims) # Save process arrangment to each process domain class
+        domain.proc_row,domain.proc_col=self.cart.Get_coords(self.rank)
         
-        # Discretize domain to each process
-        domain.Nx/=len(ranks[0,:])
-        domain.Ny/=len(ranks[:,0])
+        # Designate neighboring processes (MPI.PROC_NULL at domain boundary)
+        domain.proc_bottom,domain.proc_top=self.cart.Shift(0, 1)
+        domain.proc_left,domain.proc_right=self.cart.Shift(1, 1)
+        
+        # Discretize domain to each process; remainder rows/columns spread
+        # over first processes
+        domain.x_split=self.split_nodes(domain.Nx, dims[1])
+        domain.y_split=self.split_nodes(domain.Ny, dims[0])
+        domain.Nx=domain.x_split[domain.proc_col+1]-domain.x_split[domain.proc_col]
+        domain.Ny=domain.y_split[domain.proc_row+1]-domain.y_split[domain.proc_row]
         
         domain.X=self.split_var(domain.X, domain)
         domain.Y=self.split_var(domain.Y, domain)
@@ -141,372 +193,430 @@ class MPI_comms():
         domain.dY=self.split_var(domain.dY, domain)
         domain.E=self.split_var(domain.E, domain)
         
-        # Designate neighboring processes
-        #for i in range(self.size/maxDim):
-	for i in range(len(ranks[:,0])):
-            # Unique case where there is only one row of processes
-            if self.rank in ranks[i] and maxDim==1:
-                domain.proc_left=-1
-                domain.proc_right=-1
-                # Only one process (serial)
-                if len(ranks)==1:
-                    domain.proc_bottom=-1
-                    domain.proc_top=-1
-                    
-                # Process at y=0
-                elif i==0:
-                    domain.proc_bottom=-1
-                    domain.proc_top=ranks[i+1,0]
-                    
-                # Process at y=y_max
-                elif i==self.size/maxDim-1:
-                    domain.proc_top=-1
-                    domain.proc_bottom=ranks[i-1,0]
-                    
-                # Interior
-                else:
-                    domain.proc_bottom=ranks[i-1,0]
-                    domain.proc_top=ranks[i+1,0]
-                    
-            # Processes at y=0
-            elif self.rank in ranks[i] and i==0:
-                domain.proc_bottom=-1
-                # Corner x=0
-                if self.rank==ranks[i,0]:
-                    domain.proc_top=ranks[i+1,0]
-                    domain.proc_left=-1
-                    domain.proc_right=ranks[i,1]
-                    
-                    
-                # Corner x=x_max
-                elif self.rank==ranks[i,-1]:
-                    domain.proc_top=ranks[i+1,-1]
-                    domain.proc_left=ranks[i,-2]
-                    domain.proc_right=-1
-                    
-                    
-                # Interior processes
-                else:
-                    domain.proc_top=ranks[i+1,self.rank-ranks[i,0]]
-                    domain.proc_left=ranks[i,self.rank-ranks[i,0]-1]
-                    domain.proc_right=ranks[i,self.rank-ranks[i,0]+1]
-                    
-            # Processes at y=y_max
-            elif self.rank in ranks[i] and i==len(ranks[:,0])-1: #self.size/maxDim-1:
-                domain.proc_top=-1
-                # Edge x=0
-                if self.rank==ranks[i,0]:
-                    domain.proc_left=-1
-                    domain.proc_right=ranks[i,1]
-                    domain.proc_bottom=ranks[i-1,0]
-                    
-                # Edge x=x_max
-                elif self.rank==ranks[i,-1]:
-                    domain.proc_left=ranks[i,-2]
-                    domain.proc_right=-1
-                    domain.proc_bottom=ranks[i-1,-1]
-                    
-                # Interior processes
-                else:
-                    domain.proc_left=ranks[i,self.rank-ranks[i,0]-1]
-                    domain.proc_right=ranks[i,self.rank-ranks[i,0]+1]
-                    domain.proc_bottom=ranks[i-1,self.rank-ranks[i,0]]
-            
-            # Interior y values
-            elif self.rank in ranks[i]:
-                domain.proc_top=ranks[i+1,self.rank-ranks[i,0]]
-                domain.proc_bottom=ranks[i-1,self.rank-ranks[i,0]]
-                # Edge x=0
-                if self.rank==ranks[i,0]:
-                    domain.proc_left=-1
-                    domain.proc_right=ranks[i,self.rank-ranks[i,0]+1]
-                    
-                    
-                # Edge x=x_max
-                elif self.rank==ranks[i,-1]:
-                    domain.proc_left=ranks[i,self.rank-ranks[i,0]-1]
-                    domain.proc_right=-1
-                    
-                # Interior processes
-                else:
-                    domain.proc_left=ranks[i,self.rank-ranks[i,0]-1]
-                    domain.proc_right=ranks[i,self.rank-ranks[i,0]+1]
+        # Ghost node exchange buffers and requests; output gather datatypes
+        self.halo_init(domain)
+        self.gather_init(domain)
             
         return 0
     
-    # Update ghost nodes for processes
-    def update_ghosts(self, domain):
-        # Send to the left
-        self.comm.send(len(domain.E[:,1]), dest=domain.proc_left)
-        sen=domain.E[:,1].copy()
-        self.comm.Send(sen, dest=domain.proc_left)
-        # Receive from the right
-        len_arr=len(domain.E[:,-1])
-        len_arr=self.comm.recv(source=domain.proc_right)
-        a=np.ones(len_arr)*domain.E[:,-1]
-        self.comm.Recv(a, source=domain.proc_right)
-        domain.E[:,-1]=a
-        
-        # Send to the right
-        self.comm.send(len(domain.E[:,-2]), dest=domain.proc_right)
-        sen=domain.E[:,-2].copy()
-        self.comm.Send(sen, dest=domain.proc_right)
-        # Receive from the left
-        len_arr=len(domain.E[:,0])
-        len_arr=self.comm.recv(source=domain.proc_left)
-        a=np.ones(len_arr)*domain.E[:,0]
-        self.comm.Recv(a, source=domain.proc_left)
-        domain.E[:,0]=a
-        
-        # Send to the bottom
-        self.comm.send(len(domain.E[1,:]), dest=domain.proc_bottom)
-        sen=domain.E[1,:].copy()
-        self.comm.Send(sen, dest=domain.proc_bottom)
-        # Receive from the top
-        len_arr=len(domain.E[-1,:])
-        len_arr=self.comm.recv(source=domain.proc_top)
-        a=np.ones(len_arr)*domain.E[-1,:]
-        self.comm.Recv(a, source=domain.proc_top)
-        domain.E[-1,:]=a
-        
-        # Send to the top
-        self.comm.send(len(domain.E[-2,:]), dest=domain.proc_top)
-        sen=domain.E[-2,:].copy()
-        self.comm.Send(sen, dest=domain.proc_top)
-        # Receive from the bottom
-        len_arr=len(domain.E[0,:])
-        len_arr=self.comm.recv(source=domain.proc_bottom)
-        a=np.ones(len_arr)*domain.E[0,:]
-        self.comm.Recv(a, source=domain.proc_bottom)
-        domain.E[0,:]=a
-        
+    # Fields with ghost nodes exchanged between processes (C-contiguous);
+    # temperature guess (lagged temperature of properties) only kept on 
+    # ghost nodes over several updates if more than one ghost node layer
+    def halo_fields(self, domain):
+        fields=[domain.E]
         if st.find(self.Sources['Source_Kim'],'True')>=0:
-            # Send to the left
-            self.comm.send(len(domain.eta[:,1]), dest=domain.proc_left)
-            sen=domain.eta[:,1].copy()
-            self.comm.Send(sen, dest=domain.proc_left)
-            # Receive from the right
-            len_arr=len(domain.eta[:,-1])
-            len_arr=self.comm.recv(source=domain.proc_right)
-            a=np.ones(len_arr)*domain.eta[:,-1]
-            self.comm.Recv(a, source=domain.proc_right)
-            domain.eta[:,-1]=a
-            
-            # Send to the right
-            self.comm.send(len(domain.eta[:,-2]), dest=domain.proc_right)
-            sen=domain.eta[:,-2].copy()
-            self.comm.Send(sen, dest=domain.proc_right)
-            # Receive from the left
-            len_arr=len(domain.eta[:,0])
-            len_arr=self.comm.recv(source=domain.proc_left)
-            a=np.ones(len_arr)*domain.eta[:,0]
-            self.comm.Recv(a, source=domain.proc_left)
-            domain.eta[:,0]=a
-            
-            # Send to the bottom
-            self.comm.send(len(domain.eta[1,:]), dest=domain.proc_bottom)
-            sen=domain.eta[1,:].copy()
-            self.comm.Send(sen, dest=domain.proc_bottom)
-            # Receive from the top
-            len_arr=len(domain.eta[-1,:])
-            len_arr=self.comm.recv(source=domain.proc_top)
-            a=np.ones(len_arr)*domain.eta[-1,:]
-            self.comm.Recv(a, source=domain.proc_top)
-            domain.eta[-1,:]=a
-            
-            # Send to the top
-            self.comm.send(len(domain.eta[-2,:]), dest=domain.proc_top)
-            sen=domain.eta[-2,:].copy()
-            self.comm.Send(sen, dest=domain.proc_top)
-            # Receive from the bottom
-            len_arr=len(domain.eta[0,:])
-            len_arr=self.comm.recv(source=domain.proc_bottom)
-            a=np.ones(len_arr)*domain.eta[0,:]
-            self.comm.Recv(a, source=domain.proc_bottom)
-            domain.eta[0,:]=a
-        
+            fields.append(domain.eta)
         if domain.model=='Species':
-            # Send to the left
-            self.comm.send(len(domain.P[:,1]), dest=domain.proc_left)
-            sen=domain.P[:,1].copy()
-            self.comm.Send(sen, dest=domain.proc_left)
-            # Receive from the right
-            len_arr=len(domain.P[:,-1])
-            len_arr=self.comm.recv(source=domain.proc_right)
-            a=np.ones(len_arr)*domain.P[:,-1]
-            self.comm.Recv(a, source=domain.proc_right)
-            domain.P[:,-1]=a
-            
-            # Send to the right
-            self.comm.send(len(domain.P[:,-2]), dest=domain.proc_right)
-            sen=domain.P[:,-2].copy()
-            self.comm.Send(sen, dest=domain.proc_right)
-            # Receive from the left
-            len_arr=len(domain.P[:,0])
-            len_arr=self.comm.recv(source=domain.proc_left)
-            a=np.ones(len_arr)*domain.P[:,0]
-            self.comm.Recv(a, source=domain.proc_left)
-            domain.P[:,0]=a
-            
-            # Send to the bottom
-            self.comm.send(len(domain.P[1,:]), dest=domain.proc_bottom)
-            sen=domain.P[1,:].copy()
-            self.comm.Send(sen, dest=domain.proc_bottom)
-            # Receive from the top
-            len_arr=len(domain.P[-1,:])
-            len_arr=self.comm.recv(source=domain.proc_top)
-            a=np.ones(len_arr)*domain.P[-1,:]
-            self.comm.Recv(a, source=domain.proc_top)
-            domain.P[-1,:]=a
-            
-            # Send to the top
-            self.comm.send(len(domain.P[-2,:]), dest=domain.proc_top)
-            sen=domain.P[-2,:].copy()
-            self.comm.Send(sen, dest=domain.proc_top)
-            # Receive from the bottom
-            len_arr=len(domain.P[0,:])
-            len_arr=self.comm.recv(source=domain.proc_bottom)
-            a=np.ones(len_arr)*domain.P[0,:]
-            self.comm.Recv(a, source=domain.proc_bottom)
-            domain.P[0,:]=a
-            
+            fields.append(domain.P)
             for i in domain.species_keys:
-                # Send to the left
-                self.comm.send(len(domain.rho_species[i][:,1]), dest=domain.proc_left)
-                sen=domain.rho_species[i][:,1].copy()
-                self.comm.Send(sen, dest=domain.proc_left)
-                # Receive from the right
-                len_arr=len(domain.rho_species[i][:,-1])
-                len_arr=self.comm.recv(source=domain.proc_right)
-                a=np.ones(len_arr)*domain.rho_species[i][:,-1]
-                self.comm.Recv(a, source=domain.proc_right)
-                domain.rho_species[i][:,-1]=a
-                
-                # Send to the right
-                self.comm.send(len(domain.rho_species[i][:,-2]), dest=domain.proc_right)
-                sen=domain.rho_species[i][:,-2].copy()
-                self.comm.Send(sen, dest=domain.proc_right)
-                # Receive from the left
-                len_arr=len(domain.rho_species[i][:,0])
-                len_arr=self.comm.recv(source=domain.proc_left)
-                a=np.ones(len_arr)*domain.rho_species[i][:,0]
-                self.comm.Recv(a, source=domain.proc_left)
-                domain.rho_species[i][:,0]=a
-                
-                # Send to the bottom
-                self.comm.send(len(domain.rho_species[i][1,:]), dest=domain.proc_bottom)
-                sen=domain.rho_species[i][1,:].copy()
-                self.comm.Send(sen, dest=domain.proc_bottom)
-                # Receive from the top
-                len_arr=len(domain.rho_species[i][-1,:])
-                len_arr=self.comm.recv(source=domain.proc_top)
-                a=np.ones(len_arr)*domain.rho_species[i][-1,:]
-                self.comm.Recv(a, source=domain.proc_top)
-                domain.rho_species[i][-1,:]=a
-                
-                # Send to the top
-                self.comm.send(len(domain.rho_species[i][-2,:]), dest=domain.proc_top)
-                sen=domain.rho_species[i][-2,:].copy()
-                self.comm.Send(sen, dest=domain.proc_top)
-                # Receive from the bottom
-                len_arr=len(domain.rho_species[i][0,:])
-                len_arr=self.comm.recv(source=domain.proc_bottom)
-                a=np.ones(len_arr)*domain.rho_species[i][0,:]
-                self.comm.Recv(a, source=domain.proc_bottom)
-                domain.rho_species[i][0,:]=a
-                
-    # General function to compile a variable from all processes
+                fields.append(domain.rho_species[i])
+        if domain.ghost>1:
+            fields.append(domain.T_guess)
+        return fields
+    
+    # Number of fields with ghost nodes (same order as halo_fields; known 
+    # before fields are allocated)
+    def halo_count(self, domain):
+        nf=1
+        if st.find(self.Sources['Source_Kim'],'True')>=0:
+            nf+=1
+        if domain.model=='Species':
+            nf+=1+len(domain.species_keys)
+        if domain.ghost>1:
+            nf+=1
+        return nf
+    
+    # Neighbouring processes (8) with nodes sent and ghost nodes received;
+    # [neighbour, owned nodes sent, ghost nodes received] for directions
+    # left, right, bottom, top, bottom-left, bottom-right, top-left, top-right
+    # Ghost corners come from diagonal neighbours so all messages can be
+    # posted at once; w layers of nodes sent/received
+    def halo_regions(self, domain):
+        L,R,B,T=domain.proc_left,domain.proc_right,domain.proc_bottom,domain.proc_top
+        ranks=domain.proc_arrang
+        row,col=domain.proc_row,domain.proc_col
+        diag=lambda i,j: ranks[row+i,col+j] if (0<=row+i<len(ranks[:,0]) and 0<=col+j<len(ranks[0,:])) else -1
+        own_y,own_x=domain.owned()
+        w=domain.ghost
+        first=slice(w, 2*w) # First owned layer(s) (left/bottom)
+        last=slice(-2*w, -w) # Last owned layer(s) (right/top)
+        return [[L, np.s_[own_y,first], np.s_[own_y,:w]],\
+                [R, np.s_[own_y,last], np.s_[own_y,-w:]],\
+                [B, np.s_[first,own_x], np.s_[:w,own_x]],\
+                [T, np.s_[last,own_x], np.s_[-w:,own_x]],\
+                [diag(-1,-1), np.s_[first,first], np.s_[:w,:w]],\
+                [diag(-1,1), np.s_[first,last], np.s_[:w,-w:]],\
+                [diag(1,-1), np.s_[last,first], np.s_[-w:,:w]],\
+                [diag(1,1), np.s_[last,last], np.s_[-w:,-w:]]]
+    
+    # Ghost node exchange set up once after MPI_discretize; one message per
+    # neighbour holding all fields, persistent requests
+    # Sent nodes described by MPI vector datatype (strided rows of local
+    # array), received into contiguous buffer [field, node] per neighbour
+    # Tag is direction message travels
+    def halo_init(self, domain):
+        opposite=[1,0,3,2,7,6,5,4]
+        ny,nx=domain.E.shape
+        nf=self.halo_count(domain)
+        self.halo=[]
+        self.recv_requests=[]
+        for d,(proc,send,recv) in enumerate(self.halo_regions(domain)):
+            if proc<0:
+                continue
+            j0,j1,i0,i1=[sl.indices(n)[m] for sl,n in zip(send,(ny,nx)) for m in (0,1)]
+            vec=MPI.DOUBLE.Create_vector(j1-j0, i1-i0, nx).Commit()
+            offset=8*(j0*nx+i0) # bytes from start of field
+            shape=np.zeros((ny,nx))[recv].shape
+            buf=np.empty((nf,shape[0]*shape[1]))
+            self.recv_requests.append(self.comm.Recv_init(buf, source=proc, tag=opposite[d]))
+            self.halo.append([proc, d, vec, offset, recv, shape, buf])
+        self.send_requests=[]
+        self.send_types=[]
+        self.send_addr=None
+        self.halo_active=False
+        self.ghost_valid=0 # Ghost node layers valid for further updates
+    
+    # Persistent send requests for current field arrays (addresses of 
+    # fields in datatype); rebuilt only if fields are reallocated
+    def halo_send_init(self, fields):
+        addr=[MPI.Get_address(var) for var in fields]
+        if addr==self.send_addr:
+            return
+        for req in self.send_requests:
+            req.Free()
+        for typ in self.send_types:
+            typ.Free()
+        self.send_requests=[]
+        self.send_types=[]
+        for proc,d,vec,offset,recv,shape,buf in self.halo:
+            typ=MPI.Datatype.Create_struct([1]*len(fields), [a+offset for a in addr],\
+                                           [vec]*len(fields)).Commit()
+            self.send_types.append(typ)
+            self.send_requests.append(self.comm.Send_init([MPI.BOTTOM, 1, typ], dest=proc, tag=d))
+        self.send_addr=addr
+    
+    # Start ghost node exchange (non-blocking) for next 'layers' updates of 
+    # fields; each explicit update leaves one less valid ghost node layer,
+    # so exchange only needed once layers from last one are used up
+    # Fields can be read but not modified until finish_ghosts
+    def start_ghosts(self, domain, layers=1):
+        if not self.halo:
+            return
+        if self.ghost_valid>=layers:
+            self.ghost_valid-=layers
+            return
+        self.halo_send_init(self.halo_fields(domain))
+        MPI.Prequest.Startall(self.recv_requests+self.send_requests)
+        self.halo_active=True
+        self.ghost_valid=domain.ghost-layers
+    
+    # Ghost node exchange started and not yet completed
+    def ghosts_pending(self):
+        return self.halo_active
+    
+    # Wait for ghost node exchange and copy received data to ghost nodes
+    def finish_ghosts(self, domain):
+        if not self.halo_active:
+            return
+        t0=MPI.Wtime()
+        MPI.Prequest.Waitall(self.recv_requests+self.send_requests)
+        self.ghost_wait+=MPI.Wtime()-t0
+        fields=self.halo_fields(domain)
+        for proc,d,vec,offset,recv,shape,buf in self.halo:
+            for f in range(len(fields)):
+                fields[f][recv]=buf[f].reshape(shape)
+        self.halo_active=False
+    
+    # Update ghost nodes for processes (blocking)
+    def update_ghosts(self, domain, layers=1):
+        self.start_ghosts(domain, layers)
+        self.finish_ghosts(domain)
+    
+    # Ghost node strips (for recalculation once exchange is finished)
+    def ghost_regions(self, domain):
+        w=domain.ghost
+        regions=[]
+        if domain.proc_left>=0:
+            regions.append(np.s_[:,:w])
+        if domain.proc_right>=0:
+            regions.append(np.s_[:,-w:])
+        if domain.proc_bottom>=0:
+            regions.append(np.s_[:w,:])
+        if domain.proc_top>=0:
+            regions.append(np.s_[-w:,:])
+        return regions
+    
+    # Combine scalars over processes, each entry by minimum, maximum or sum
+    # (kinds), in one Allreduce
+    def reduce(self, values, kinds):
+        send=np.array(values, dtype=float)
+        recv=np.empty_like(send)
+        self.comm.Allreduce(send, recv, op=self.get_op(kinds))
+        return recv
+    
+    # Non-blocking variant of reduce; other work can be done until 
+    # finish_reduce (returns combined scalars)
+    def start_reduce(self, values, kinds):
+        send=np.array(values, dtype=float)
+        recv=np.empty_like(send)
+        return self.comm.Iallreduce(send, recv, op=self.get_op(kinds)), send, recv
+    
+    def finish_reduce(self, pending):
+        pending[0].Wait()
+        return pending[2]
+    
+    def get_op(self, kinds):
+        kinds=tuple(kinds)
+        if kinds not in self.reduce_ops:
+            self.reduce_ops[kinds]=reduce_op(kinds)
+        return self.reduce_ops[kinds]
+    
+    # Column of nodes the combustion front is tracked along (axis if 
+    # axisymmetric, centreline otherwise); local index on this process or 
+    # -1 if column not on this process
+    def front_init(self, domain, geom):
+        self.front_geom=geom
+        if st.find(geom, 'Axisymmetric')>=0:
+            col=0
+        else:
+            col=domain.x_split[-1]/2
+        self.front_col=-1
+        if domain.x_split[domain.proc_col]<=col<domain.x_split[domain.proc_col+1]:
+            self.front_col=col-domain.x_split[domain.proc_col]+domain.owned()[1].start
+        rows=len(domain.proc_arrang[:,0])
+        self.front_kinds=['sum','min']+['sum']*4*rows
+    
+    # Burned length (eta integrated along front column) and location of
+    # front (lowest eta=0.5 crossing, interpolated between nodes); partial 
+    # values of this process (combined with front_kinds, e.g. in per time
+    # step reduction) along with first/last owned node of each process row 
+    # (for front between processes)
+    def front_values(self, domain):
+        rows=len(domain.proc_arrang[:,0])
+        part=np.zeros(2+4*rows)
+        part[1]=np.inf
+        if self.front_col>=0:
+            own=domain.owned()[0]
+            eta=domain.eta[own,self.front_col]
+            y=domain.Y[own,self.front_col]
+            part[0]=np.sum(eta*domain.dY[own,self.front_col])
+            part[1]=self.front_crossing(eta, y)
+            # eta, y of first and last node
+            part[2+4*domain.proc_row:6+4*domain.proc_row]=eta[0],y[0],eta[-1],y[-1]
+        return part
+    
+    # Burned length and front location from combined front_values
+    def front_result(self, front):
+        y_front=front[1]
+        for i in range(len(front)/4-1):
+            # Last node of process row i and first of row i+1
+            y_front=min(y_front, self.front_crossing(front[[4+4*i,6+4*i]], front[[5+4*i,7+4*i]]))
+        return front[0],y_front
+    
+    # Lowest location where eta crosses 0.5 (linear between nodes); inf if none
+    def front_crossing(self, eta, y):
+        cross=np.where(((eta[:-1]-0.5)*(eta[1:]-0.5)<=0) & (eta[:-1]!=eta[1:]))[0]
+        if len(cross)==0:
+            return np.inf
+        i=cross[0]
+        return y[i]+(0.5-eta[i])/(eta[i+1]-eta[i])*(y[i+1]-y[i])
+    
+    # Datatypes to collect owned nodes into global arrays (set up once after
+    # MPI_discretize); owned nodes sent straight from local array and
+    # received straight into global array, each process' block has its own
+    # subarray type (blocks differ with remainder nodes)
+    def gather_init(self, domain):
+        ny,nx=domain.E.shape
+        starts=[sl.start for sl in domain.owned()]
+        self.gather_send=MPI.DOUBLE.Create_subarray([ny,nx], [domain.Ny,domain.Nx], starts).Commit()
+        self.gather_recv=[]
+        for i in range(self.size):
+            row,col=divmod(i, len(domain.proc_arrang[0,:]))
+            sizes=[domain.y_split[row+1]-domain.y_split[row], domain.x_split[col+1]-domain.x_split[col]]
+            starts=[domain.y_split[row], domain.x_split[col]]
+            self.gather_recv.append(MPI.DOUBLE.Create_subarray([domain.y_split[-1],domain.x_split[-1]],\
+                                    sizes, starts).Commit())
+    
+    # Collect variable from all processes into global array on processes in 
+    # 'dest' (None on others); Alltoallw is Gatherv with a datatype per 
+    # process, processes not in 'dest' receive nothing; received into
+    # var_global if given
+    def collect_var(self, var, Domain, dest, var_global=None):
+        var=np.ascontiguousarray(var, dtype=float)
+        zeros=[0]*self.size
+        send_counts=[int(i in dest) for i in range(self.size)]
+        if self.rank in dest:
+            if var_global is None:
+                var_global=np.empty((Domain.y_split[-1], Domain.x_split[-1]))
+            recv=[var_global, ([1]*self.size, zeros), self.gather_recv]
+        else:
+            var_global=None
+            recv=[np.empty(0), (zeros, zeros), [MPI.DOUBLE]*self.size]
+        self.comm.Alltoallw([var, (send_counts, zeros), [self.gather_send]*self.size], recv)
+        
+        return var_global
+    
+    # Gather variable from all processes to process 0 (output); global array
+    # only exists on process 0, None returned on others
+    def gather_var(self, var, Domain):
+        return self.collect_var(var, Domain, [0])
+    
+    # Compile variable from all processes on every process (all-gather); 
+    # use gather_var if only needed for output
+    # Global array held once per node (received by first process of node
+    # into shared window, read by others); valid until next call
     def compile_var(self, var, Domain):
-        var_global=var[1:-1,1:-1].copy()
-        # For one column of processes
-        if Domain.proc_arrang.shape[1]==1:
-            # Start global variable based on which row process is in
-            if Domain.proc_row==0:
-                var_global=var[:-1,:].copy()
-            elif self.rank==Domain.proc_arrang[-1,0]:
-                var_global=var[1:,:].copy()
-            else:
-                var_global=var[1:-1,:].copy()
-            # Send variable to process 0 for final compile
-            if self.rank!=0:
-                self.comm.send(np.shape(var_global), dest=0)
-                self.comm.Send(var_global, dest=0)
-            # Process 0 compiles global variable
-            else:
-                for i in range(len(Domain.proc_arrang[:,0])-1):
-                    len_arr=self.comm.recv(source=Domain.proc_arrang[i+1,0])
-                    a=np.empty(len_arr)
-                    self.comm.Recv(a, source=Domain.proc_arrang[i+1,0])
-                    var_global=np.block([[var_global],[a]])
-        # Collect data from each row of processes at first process of the row
-        elif self.rank in Domain.proc_arrang[:,0]:
-            # Start global variable based on which row process is in
-            if Domain.proc_row==0:
-                var_global=var[:-1,:-1].copy()
-            elif self.rank==Domain.proc_arrang[-1,0]:
-                var_global=var[1:,:-1].copy()
-            else:
-                var_global=var[1:-1,:-1].copy()
-            # Cycle through each process in x (right)
-            for i in range(len(Domain.proc_arrang[0,:])-1):
-                len_arr=self.comm.recv(source=Domain.proc_arrang[Domain.proc_row,i+1])
-                a=np.empty(len_arr)
-                self.comm.Recv(a, source=Domain.proc_arrang[Domain.proc_row,i+1])
-                var_global=np.block([var_global, a])
-            
-            # Send compiled variable to process 0 for final compile
-            if self.rank!=0:
-                self.comm.send(np.shape(var_global), dest=0)
-                self.comm.Send(var_global, dest=0)
-            # Process 0 compiles global variable
-            else:
-                for i in range(len(Domain.proc_arrang[:,0])-1):
-                    len_arr=self.comm.recv(source=Domain.proc_arrang[i+1,0])
-                    a=np.empty(len_arr)
-                    self.comm.Recv(a, source=Domain.proc_arrang[i+1,0])
-                    var_global=np.block([[var_global],[a]])
+        shape=(Domain.y_split[-1], Domain.x_split[-1])
+        if self.size==1:
+            return self.collect_var(var, Domain, [0])
+        if self.compile_buf is None:
+            self.compile_buf=self.node_window(shape)
+        # Last result read by all processes of node before overwritten
+        self.node.Barrier()
+        self.collect_var(var, Domain, self.node_roots, self.compile_buf[0])
+        self.node.Barrier()
+        return self.compile_buf[0]
+    
+    # Move process boundaries so process rows/columns have near equal 
+    # compute time; cost of each process (since last check) spread evenly
+    # over its owned nodes gives cost per global row and column
+    # Returns new x_split, y_split or None if maximum cost is within tol
+    # times the mean or boundaries are unchanged
+    def balance_split(self, domain, cost, tol):
+        costs=np.array(self.comm.allgather(cost)).reshape(domain.proc_arrang.shape)
+        if np.amax(costs)<=tol*np.mean(costs):
+            return None
+        nx=np.diff(domain.x_split)
+        ny=np.diff(domain.y_split)
+        cost_x=np.repeat(np.sum(costs/nx, axis=0), nx)
+        cost_y=np.repeat(np.sum(costs/ny[:,None], axis=1), ny)
+        n=max(2, domain.ghost)
+        x_split=self.split_cost(cost_x, len(nx), n)
+        y_split=self.split_cost(cost_y, len(ny), n)
+        if np.array_equal(x_split, domain.x_split) and np.array_equal(y_split, domain.y_split):
+            return None
+        return x_split,y_split
+    
+    # Global node each of n parts starts at (and number of nodes) so parts
+    # have near equal total cost (cost per node); at least m nodes per part
+    def split_cost(self, cost, n, m):
+        N=len(cost)
+        mid=np.cumsum(cost)-0.5*cost # Cost up to middle of each node
+        nodes=np.zeros(n+1, dtype=int)
+        nodes[1:n]=np.searchsorted(mid, np.sum(cost)*np.arange(1,n)/n)
+        for i in range(1,n):
+            nodes[i]=min(max(nodes[i], nodes[i-1]+m), N-(n-i)*m)
+        nodes[n]=N
+        return nodes
+    
+    # Datatypes moving owned nodes of current decomposition into local arrays
+    # (ghost nodes included) of decomposition with new splits; per process,
+    # overlap of owned nodes of one with local nodes of the other (count 0 
+    # if none); returns send and receive [counts, types] and new local shape
+    def migrate_init(self, domain, x_split, y_split):
+        cols=len(domain.proc_arrang[0,:])
+        ny,nx=domain.E.shape
+        new=self.local_range(domain, domain.proc_row, domain.proc_col, x_split, y_split)
+        shape=[new[1]-new[0], new[3]-new[2]]
+        own_y,own_x=domain.owned()
+        own=[domain.y_split[domain.proc_row], domain.y_split[domain.proc_row+1],\
+             domain.x_split[domain.proc_col], domain.x_split[domain.proc_col+1]]
+        send=[[],[]]
+        recv=[[],[]]
+        for i in range(self.size):
+            row,col=divmod(i, cols)
+            # Owned nodes of this process to new local nodes of process i
+            self.overlap(own, self.local_range(domain, row, col, x_split, y_split),\
+                         [ny,nx], [own[0]-own_y.start, own[2]-own_x.start], send)
+            # Owned nodes of process i to new local nodes of this process
+            other=[domain.y_split[row], domain.y_split[row+1],\
+                   domain.x_split[col], domain.x_split[col+1]]
+            self.overlap(other, new, shape, [new[0], new[2]], recv)
+        return send,recv,shape
+    
+    # Append count and subarray type of nodes in both global ranges a and b
+    # ([j0, j1, i0, i1]) to counts_types; array of given shape starts at 
+    # global node origin
+    def overlap(self, a, b, shape, origin, counts_types):
+        j0,j1=max(a[0], b[0]),min(a[1], b[1])
+        i0,i1=max(a[2], b[2]),min(a[3], b[3])
+        if j0>=j1 or i0>=i1:
+            counts_types[0].append(0)
+            counts_types[1].append(MPI.DOUBLE)
+        else:
+            counts_types[0].append(1)
+            counts_types[1].append(MPI.DOUBLE.Create_subarray(shape, [j1-j0, i1-i0],\
+                                   [j0-origin[0], i0-origin[1]]).Commit())
+    
+    # Local array in new decomposition (migrate_init types) from local array
+    # in current one
+    def migrate_var(self, var, send, recv, shape):
+        var_new=np.empty(shape)
+        zeros=[0]*self.size
+        self.comm.Alltoallw([np.ascontiguousarray(var, dtype=float), (send[0], zeros), send[1]],\
+                            [var_new, (recv[0], zeros), recv[1]])
+        return var_new
+    
+    # Load balancing: move process boundaries by compute time of processes
+    # (balance_split) and migrate domain node arrays (and extra node arrays,
+    # e.g. CV dimensions) to new local arrays, ghost nodes included; ghost 
+    # node exchange, output and combustion front set up again
+    # Returns extra arrays in new decomposition or None if not rebalanced
+    def rebalance(self, domain, cost, tol, extra):
+        splits=self.balance_split(domain, cost, tol)
+        if splits is None:
+            return None
+        send,recv,shape=self.migrate_init(domain, splits[0], splits[1])
+        names=['X','Y','dX','dY','E','eta','P','porosity']
+        if domain.model=='Species':
+            names.append('perm')
+            for key in domain.species_keys:
+                domain.rho_species[key]=self.migrate_var(domain.rho_species[key], send, recv, shape)
+            domain.rho_0=domain.rho_species[domain.species_keys[1]]
+        else:
+            names.append('rho_0')
+        for name in names:
+            setattr(domain, name, self.migrate_var(getattr(domain, name), send, recv, shape))
+        T_guess=self.migrate_var(domain.T_guess, send, recv, shape)
+        extra=[self.migrate_var(var, send, recv, shape) for var in extra]
+        for typ in send[1]+recv[1]:
+            if typ!=MPI.DOUBLE:
+                typ.Free()
         
-        # Processes in each row will send data to first process of row
-        else:# self.rank in Domain.proc_arrang[:,1:]:
-            # First row (y=0)
-            if Domain.proc_row==0:
-                # Corner (x=x_max)
-                if self.rank==Domain.proc_arrang[Domain.proc_row,-1]:
-                    sen=var[:-1,1:].copy()
-                # Interior processes
-                else:
-                    sen=var[:-1,1:-1].copy()
-            # Last row (y=y_max)
-            elif self.rank in Domain.proc_arrang[-1,:]:
-                # Corner (x=x_max)
-                if self.rank==Domain.proc_arrang[Domain.proc_row,-1]:
-                    sen=var[1:,1:].copy()
-                # Interior processes
-                else:
-                    sen=var[1:,1:-1].copy()
-            # Interior row
-            else:
-                # Edge (x=x_max)
-                if self.rank==Domain.proc_arrang[Domain.proc_row,-1]:
-                    sen=var[1:-1,1:].copy()
-                # Interior processes
-                else:
-                    sen=var[1:-1,1:-1].copy()
-            self.comm.send(np.shape(sen), dest=Domain.proc_arrang[Domain.proc_row,0])
-            self.comm.Send(sen, dest=Domain.proc_arrang[Domain.proc_row,0])
-            
-        len_arr=self.comm.bcast(np.shape(var_global), root=0)
-        if self.rank!=0:
-            var_global=np.empty(len_arr)
-        self.comm.Bcast(var_global, root=0)
+        # New decomposition; workspace buffers reallocated at new shape
+        domain.x_split,domain.y_split=splits
+        domain.Nx=domain.x_split[domain.proc_col+1]-domain.x_split[domain.proc_col]
+        domain.Ny=domain.y_split[domain.proc_row+1]-domain.y_split[domain.proc_row]
+        domain.work.resize(domain.E.shape)
+        domain.T_guess=domain.work.get('T_guess')
+        np.copyto(domain.T_guess, T_guess)
+        domain.props_valid=False
         
-        return var_global
+        self.layout_free()
+        self.halo_init(domain)
+        self.gather_init(domain)
+        if self.front_col is not None:
+            self.front_init(domain, self.front_geom)
+        return extra
+    
+    # Free persistent requests and datatypes of ghost node exchange and 
+    # output gather (before set up for new decomposition)
+    def layout_free(self):
+        for req in self.recv_requests+self.send_requests:
+            req.Free()
+        for typ in self.send_types+[h[2] for h in self.halo]+[self.gather_send]+self.gather_recv:
+            typ.Free()
+        self.send_requests=[]
+        self.send_types=[]
     
     # Function to save data to npy files
     def save_data(self, Domain, Sources, Species, time):
+        # One file written by all processes
+        if self.output=='MPI-IO':
+            self.save_snapshot(Domain, time)
         # 1 process (serial)
-        if self.size==1:
-            np.save('T_'+time, Domain.calcProp(Domain.T_guess)[0], False)
+        elif self.size==1:
+            np.save('T_'+time, Domain.temperature(), False)
             # Kim source term
             if st.find(self.Sources['Source_Kim'],'True')>=0:
                 np.save('eta_'+time, Domain.eta, False)
@@ -514,17 +624,69 @@ class MPI_comms():
                 np.save('P_'+time, Domain.P, False)
                 for i in Domain.species_keys:
                     np.save('rho_'+i+'_'+time, Domain.rho_species[i], False)
-        # More than 1 process
+        # More than 1 process (gathered to process 0 which saves)
         else:
-            T=self.compile_var(Domain.calcProp(Domain.T_guess)[0], Domain)
-            np.save('T_'+time, T, False)
+            T=self.gather_var(Domain.temperature(), Domain)
+            if self.rank==0:
+                np.save('T_'+time, T, False)
             # Kim source term
             if st.find(self.Sources['Source_Kim'],'True')>=0:
-                eta=self.compile_var(Domain.eta, Domain)
-                np.save('eta_'+time, eta, False)
+                eta=self.gather_var(Domain.eta, Domain)
+                if self.rank==0:
+                    np.save('eta_'+time, eta, False)
             if Domain.model=='Species':
-                P=self.compile_var(Domain.P, Domain)
-                np.save('P_'+time, P, False)
+                P=self.gather_var(Domain.P, Domain)
+                if self.rank==0:
+                    np.save('P_'+time, P, False)
                 for i in Domain.species_keys:
-                    m_i=self.compile_var(Domain.rho_species[i], Domain)
-                    np.save('rho_'+i+'_'+time, m_i, False)
+                    m_i=self.gather_var(Domain.rho_species[i], Domain)
+                    if self.rank==0:
+                        np.save('rho_'+i+'_'+time, m_i, False)
+    
+    # Save data to one file for this time with MPI-IO; each variable is a 
+    # .npy array (header written by process 0) with owned nodes of each 
+    # process written collectively through subarray file view; names of 
+    # variables saved as last array
+    def save_snapshot(self, Domain, time):
+        names,var=self.snapshot_vars(Domain)
+        header,names_npy=self.snapshot_header(Domain, names)
+        
+        fout=MPI.File.Open(self.comm, 'Data_'+time+'.npy', MPI.MODE_WRONLY|MPI.MODE_CREATE)
+        fout.Set_size(0)
+        offset=0
+        for i in range(len(var)):
+            if self.rank==0:
+                fout.Write_at(offset, np.frombuffer(header, dtype=np.uint8))
+            offset+=len(header)
+            fout.Set_view(offset, MPI.DOUBLE, self.gather_recv[self.rank])
+            fout.Write_at_all(0, [np.ascontiguousarray(var[i], dtype=float), 1, self.gather_send])
+            fout.Set_view(0, MPI.BYTE, MPI.BYTE)
+            offset+=8*Domain.y_split[-1]*Domain.x_split[-1]
+        if self.rank==0:
+            fout.Write_at(offset, np.frombuffer(names_npy, dtype=np.uint8))
+        fout.Close()
+    
+    # Names and local arrays of variables in output file
+    def snapshot_vars(self, Domain):
+        names=['T']
+        var=[Domain.temperature()]
+        # Kim source term
+        if st.find(self.Sources['Source_Kim'],'True')>=0:
+            names.append('eta')
+            var.append(Domain.eta)
+        if Domain.model=='Species':
+            names.append('P')
+            var.append(Domain.P)
+            for i in Domain.species_keys:
+                names.append('rho_'+i)
+                var.append(Domain.rho_species[i])
+        return names,var
+    
+    # .npy header of each global array and names array (.npy) of output file
+    def snapshot_header(self, Domain, names):
+        header=io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(np.dtype(float)),\
+                   'fortran_order': False, 'shape': (Domain.y_split[-1], Domain.x_split[-1])})
+        names_npy=io.BytesIO()
+        np.save(names_npy, np.array(names), False)
+        return header.getvalue(),names_npy.getvalue()
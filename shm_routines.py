@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+######################################################
+#             2D Heat Conduction Solver              #
+#              Created by J. Mark Epps               #
+#          Part of Masters Thesis at UW 2018-2020    #
+######################################################
+
+This file contains the shared memory routines (processes on one node, no
+MPI library needed):
+    -worker processes forked from main.py once input file is read
+    (Shared_processes in input file; run with python, not mpiexec)
+    -same domain decomposition and interface as MPI_comms (mpi_routines.py)
+
+Features:
+    -Fields with ghost nodes of each process are held in a shared memory
+    block (file mapped by all processes, in /dev/shm if available); ghost
+    nodes are copied straight from owned nodes of neighbours' blocks
+    -Processes synchronized with a barrier: before ghost nodes are read
+    (fields final) and after (fields can be modified again)
+    -Scalars combined over processes through a shared table (one barrier
+    per reduction, two alternating tables)
+    -Output gathered through each process' shared block; MPI-IO output
+    format written by all processes into one memory mapped file
+    -ADI/IMEX with several processes and load balancing need MPI
+
+"""
+
+import numpy as np
+import string as st
+import os
+import sys
+import mmap
+import time
+import atexit
+import tempfile
+import multiprocessing
+from mpi_routines import MPI_comms
+
+# Barrier for processes on this node (multiprocessing has none in Python 2);
+# a process failing sets abort so the others exit instead of waiting
+class Barrier():
+    def __init__(self, n):
+        self.n=n
+        self.cond=multiprocessing.Condition()
+        self.count=multiprocessing.RawValue('i', 0)
+        self.generation=multiprocessing.RawValue('i', 0)
+        self.abort=multiprocessing.RawValue('i', 0)
+
+    def wait(self):
+        with self.cond:
+            gen=self.generation.value
+            self.count.value+=1
+            if self.count.value==self.n:
+                self.count.value=0
+                self.generation.value+=1
+                self.cond.notify_all()
+                return
+            while gen==self.generation.value:
+                self.cond.wait(1.0)
+                if self.abort.value:
+                    raise SystemExit('Solver shut down; another process failed')
+
+# Communicator for processes sharing memory; forks n-1 worker processes
+# (ranks 1 to n-1), calling process is rank 0 and waits for workers at exit
+class SHM_comm():
+    def __init__(self, n=1):
+        self.rank=0
+        self.size=n
+        self.name='nanothermite_%i'%(os.getpid()) # Prefix of shared blocks
+        if n==1:
+            return
+        self.barrier=Barrier(n)
+        # Reduction tables [process, entry]; used alternately
+        self.table_len=64+4*n
+        self.tables=[np.frombuffer(multiprocessing.RawArray('d', n*self.table_len))\
+                     .reshape(n, self.table_len) for i in range(2)]
+        self.reductions=0
+        sys.stdout.flush()
+        self.workers=[]
+        for i in range(1, n):
+            pid=os.fork()
+            if pid==0:
+                self.rank=i
+                self.workers=[]
+                break
+            self.workers.append(pid)
+        self.status=0
+        hook=sys.excepthook
+        def failed(*args):
+            self.barrier.abort.value=1
+            self.status=1
+            hook(*args)
+        sys.excepthook=failed
+        if self.rank==0:
+            atexit.register(self.join)
+        else:
+            atexit.register(self.exit_worker)
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.size
+
+    def Barrier(self):
+        if self.size>1:
+            self.barrier.wait()
+
+    # Reduction table for next reduction (same order on all processes)
+    def table(self):
+        self.reductions+=1
+        return self.tables[self.reductions%2]
+
+    # Wait for worker processes to finish (process 0)
+    def join(self):
+        for pid in self.workers:
+            os.waitpid(pid, 0)
+
+    # Worker process ends without exit handlers of process it was forked
+    # from (e.g. MPI finalize if mpi4py was imported)
+    def exit_worker(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(self.status)
+
+    # Shared block of this process (size in doubles); created here, mapped
+    # by all processes once every process has created its own
+    def share(self, size):
+        folder='/dev/shm'
+        if not os.path.isdir(folder):
+            folder=tempfile.gettempdir()
+        path=lambda i: os.path.join(folder, '%s_%i'%(self.name, i))
+        fout=open(path(self.rank), 'w+b')
+        fout.truncate(8*max(size, 1))
+        fout.close()
+        self.Barrier()
+        blocks=[]
+        for i in range(self.size):
+            fin=open(path(i), 'r+b')
+            blocks.append(mmap.mmap(fin.fileno(), 0))
+            fin.close()
+        # Mapped by all; file no longer needed
+        self.Barrier()
+        os.remove(path(self.rank))
+        return blocks
+
+# Same interface as MPI_comms for processes sharing memory
+class SHM_comms(MPI_comms):
+    def __init__(self, comm, rank, size, Sources, Species, output='npy'):
+        MPI_comms.__init__(self, comm, rank, size, Sources, Species, output)
+        self.halo=[]
+        self.fields=[]
+        self.halo_active=False
+        self.ghost_valid=0
+
+    # Decomposition as MPI_discretize; process grid is ranks in row major
+    # order, neighbours from process arrangement (-1 at domain boundary)
+    def MPI_discretize(self, domain, ghost=1):
+        domain.ghost=ghost
+        dims=self.process_grid(domain.Nx, domain.Ny, ghost)
+        if len(dims)==0:
+            return 1
+        domain.proc_arrang=np.arange(self.size).reshape(dims)
+        domain.proc_row,domain.proc_col=divmod(self.rank, dims[1])
+        rank=lambda row,col: domain.proc_arrang[row,col] if (0<=row<dims[0] and 0<=col<dims[1]) else -1
+        domain.proc_bottom=rank(domain.proc_row-1, domain.proc_col)
+        domain.proc_top=rank(domain.proc_row+1, domain.proc_col)
+        domain.proc_left=rank(domain.proc_row, domain.proc_col-1)
+        domain.proc_right=rank(domain.proc_row, domain.proc_col+1)
+
+        domain.x_split=self.split_nodes(domain.Nx, dims[1])
+        domain.y_split=self.split_nodes(domain.Ny, dims[0])
+        domain.Nx=domain.x_split[domain.proc_col+1]-domain.x_split[domain.proc_col]
+        domain.Ny=domain.y_split[domain.proc_row+1]-domain.y_split[domain.proc_row]
+
+        domain.X=self.split_var(domain.X, domain)
+        domain.Y=self.split_var(domain.Y, domain)
+        domain.dX=self.split_var(domain.dX, domain)
+        domain.dY=self.split_var(domain.dY, domain)
+        domain.E=self.split_var(domain.E, domain)
+
+        self.gather_init(domain)
+        self.halo_init(domain)
+        return 0
+
+    # Global nodes [j0, j1, i0, i1] of local arrays of process i
+    def local_nodes(self, domain, i):
+        row,col=divmod(i, len(domain.proc_arrang[0,:]))
+        return self.local_range(domain, row, col, domain.x_split, domain.y_split)
+
+    # Shared block of every process: fields with ghost nodes [field, local
+    # node] then owned nodes (output); ghost nodes read from owned nodes of
+    # neighbour's block ([neighbour, ghost nodes, nodes in neighbour's block])
+    def halo_init(self, domain):
+        nf=self.halo_count(domain)
+        shapes=[]
+        for i in range(self.size):
+            j0,j1,i0,i1=self.local_nodes(domain, i)
+            shapes.append([j1-j0, i1-i0])
+        own=[[g[1]-g[0], g[3]-g[2]] for g in self.gather_nodes]
+        ny,nx=shapes[self.rank]
+        self.blocks=self.comm.share(nf*ny*nx+domain.Ny*domain.Nx)
+        self.block_fields=[]
+        self.block_out=[]
+        for i in range(self.size):
+            n=nf*shapes[i][0]*shapes[i][1]
+            a=np.frombuffer(self.blocks[i], dtype=float)
+            self.block_fields.append(a[:n].reshape([nf]+shapes[i]))
+            self.block_out.append(a[n:n+own[i][0]*own[i][1]].reshape(own[i]))
+        self.fields=list(self.block_fields[self.rank])
+
+        me=self.local_nodes(domain, self.rank)
+        self.halo=[]
+        for proc,send,recv in self.halo_regions(domain):
+            if proc<0:
+                continue
+            other=self.local_nodes(domain, proc)
+            (j0,j1),(i0,i1)=[sl.indices(n)[:2] for sl,n in zip(recv,(ny,nx))]
+            dj,di=me[0]-other[0],me[2]-other[2]
+            self.halo.append([proc, recv, np.s_[j0+dj:j1+dj, i0+di:i1+di]])
+
+    # Domain arrays with ghost nodes (halo_fields order) as [holder, key]
+    def halo_keys(self, domain):
+        keys=[[domain.__dict__, 'E']]
+        if st.find(self.Sources['Source_Kim'],'True')>=0:
+            keys.append([domain.__dict__, 'eta'])
+        if domain.model=='Species':
+            keys.append([domain.__dict__, 'P'])
+            for i in domain.species_keys:
+                keys.append([domain.rho_species, i])
+        if domain.ghost>1:
+            keys.append([domain.__dict__, 'T_guess'])
+        return keys
+
+    # Move fields with ghost nodes into shared block (domain arrays replaced
+    # by views of block); only done when a field has been reallocated
+    def share_fields(self, domain):
+        changed=False
+        for (holder,key),buf in zip(self.halo_keys(domain), self.fields):
+            if holder[key] is not buf:
+                np.copyto(buf, holder[key])
+                holder[key]=buf
+                changed=True
+        if changed and domain.model=='Species':
+            domain.rho_0=domain.rho_species[domain.species_keys[1]]
+        if changed and domain.ghost>1:
+            domain.work.buffers[('T_guess', domain.work.shape)]=domain.T_guess
+
+    # Ghost node exchange started once all processes have final fields;
+    # ghost nodes read in finish_ghosts
+    def start_ghosts(self, domain, layers=1):
+        if not self.halo:
+            return
+        if self.ghost_valid>=layers:
+            self.ghost_valid-=layers
+            return
+        self.share_fields(domain)
+        self.comm.Barrier()
+        self.halo_active=True
+        self.ghost_valid=domain.ghost-layers
+
+    # Copy ghost nodes from neighbours' blocks; wait until all processes
+    # have theirs before fields are modified
+    def finish_ghosts(self, domain):
+        if not self.halo_active:
+            return
+        for proc,recv,src in self.halo:
+            other=self.block_fields[proc]
+            for f in range(len(self.fields)):
+                self.fields[f][recv]=other[f][src]
+        t0=time.time()
+        self.comm.Barrier()
+        self.ghost_wait+=time.time()-t0
+        self.halo_active=False
+
+    # Combine scalars over processes (each entry minimum, maximum or sum)
+    def reduce(self, values, kinds):
+        return self.finish_reduce(self.start_reduce(values, kinds))
+
+    # Values written to table; combined after barrier in finish_reduce
+    def start_reduce(self, values, kinds):
+        if self.size==1:
+            return np.array(values, dtype=float)
+        table=self.comm.table()
+        table[self.rank,:len(values)]=values
+        return table, len(values), np.array(kinds)
+
+    def finish_reduce(self, pending):
+        if self.size==1:
+            return pending
+        table,n,kinds=pending
+        self.comm.Barrier()
+        values=table[:,:n]
+        return np.where(kinds=='min', np.amin(values, axis=0),\
+                        np.where(kinds=='max', np.amax(values, axis=0), np.sum(values, axis=0)))
+
+    # Global nodes [j0, j1, i0, i1] owned by each process
+    def gather_init(self, domain):
+        cols=len(domain.proc_arrang[0,:])
+        self.gather_nodes=[]
+        for i in range(self.size):
+            row,col=divmod(i, cols)
+            self.gather_nodes.append([domain.y_split[row], domain.y_split[row+1],\
+                                      domain.x_split[col], domain.x_split[col+1]])
+
+    # Owned nodes of each process copied to its shared block then read by
+    # processes in 'dest' into global array (None on others)
+    def collect_var(self, var, Domain, dest):
+        np.copyto(self.block_out[self.rank], var[Domain.owned()])
+        self.comm.Barrier()
+        var_global=None
+        if self.rank in dest:
+            var_global=np.empty((Domain.y_split[-1], Domain.x_split[-1]))
+            for i,(j0,j1,i0,i1) in enumerate(self.gather_nodes):
+                var_global[j0:j1,i0:i1]=self.block_out[i]
+        self.comm.Barrier()
+        return var_global
+
+    # Global arrays held by each process (no shared windows)
+    def node_window(self, shape):
+        return np.empty(shape),None
+
+    def compile_var(self, var, Domain):
+        return self.collect_var(var, Domain, range(self.size))
+
+    # Load balancing not available (blocks sized for decomposition)
+    def rebalance(self, domain, cost, tol, extra):
+        return None
+
+    def layout_free(self):
+        pass
+
+    # One file for this time (same layout as MPI-IO); process 0 writes
+    # headers, then every process writes owned nodes through memory map
+    def save_snapshot(self, Domain, time):
+        names,var=self.snapshot_vars(Domain)
+        header,names_npy=self.snapshot_header(Domain, names)
+        shape=(Domain.y_split[-1], Domain.x_split[-1])
+        length=len(header)+8*shape[0]*shape[1]
+        filename='Data_'+time+'.npy'
+        if self.rank==0:
+            fout=open(filename, 'wb')
+            fout.truncate(len(var)*length+len(names_npy))
+            for i in range(len(var)):
+                fout.seek(i*length)
+                fout.write(header)
+            fout.seek(len(var)*length)
+            fout.write(names_npy)
+            fout.close()
+        self.comm.Barrier()
+        j0,j1,i0,i1=self.gather_nodes[self.rank]
+        for i in range(len(var)):
+            out=np.memmap(filename, dtype=float, mode='r+', offset=i*length+len(header), shape=shape)
+            out[j0:j1,i0:i1]=var[i][Domain.owned()]
+            out.flush()
+            del out
+        self.comm.Barrier()
@@ -56,24 +56,36 @@ scheme_data["RK4_CLASSICAL"]["rk_coeff"] = [
                			 ]
 scheme_data["RK4_CLASSICAL"]["information"] = "This is the classical 3/8ths method"
 
-scheme_data["RK4_LOW"]["rk_substep_fraction"] = np.array([1./6., 1./3., 1./3., 1./6.]).astype("float64")
+# Carpenter and Kennedy (1994) 5 stage, 4th order, 2N storage; dq=A*dq+dt*f, q+=B*dq
+scheme_data["RK4_LOW"]["rk_substep_fraction"] = np.array([1432997174477./9575080441755, 2526269341429./6820363962896-1432997174477./9575080441755,\
+				2006345519317./3224310063776-2526269341429./6820363962896, 2802321613138./2924317926251-2006345519317./3224310063776,\
+				1.-2802321613138./2924317926251]).astype("float64")
 scheme_data["RK4_LOW"]["rk_coeff"] = [
-					      [ 0.        ,  0.        ,  0.        ,  0.        ],
-       					[ 0.69631521,  0.        ,  0.        ,  0.        ],
-       					[ 0.07801568,  0.21640084,  0.        ,  0.        ],
-       					[ 0.07801568,  0.0470887 ,  0.69991726,  0.        ]
+					[ 0.                            , -567301805773./1357537059087 , -2404267990393./2016746695238 ,\
+					 -3550918686646./2091501179385 , -1275806237668./842570457699 ],
+					[ 1432997174477./9575080441755 ,  5161836677717./13612068292357,  1720146321549./2090206949498 ,\
+					  3134564353537./4481467310338 ,  2277821191437./14882151754819]
 				    ]
-scheme_data["RK4_LOW"]["information"] = "This is the low storage 4 step method"
+scheme_data["RK4_LOW"]["information"] = "This is the low storage (2N) 5 step 4th order method"
 scheme_data["RK6"]["rk_substep_fraction"] = np.array([1./12., 0., 0., 0., 5./12., 5./12., 1./12.]).astype("float64")
+# Full precision (order conditions to roundoff); nodes c=0, 24/61, 17/28,
+# 38/53, (5-sqrt(5))/10, (5+sqrt(5))/10, 1
 scheme_data["RK6"]["rk_coeff"] = \
 [
- [ 0.         ,  0.         ,  0.         ,  0.         ,  0.         ,  0.         ,  0.        ],
- [ 0.39344262 ,  0.         ,  0.         ,  0.         ,  0.         ,  0.         ,  0.        ],
- [-0.2710704  ,  0.87821326 ,  0.         ,  0.         ,  0.         ,  0.         ,  0.        ],
- [ 0.13937841 ,  0.40771164 ,  0.16989108 ,  0.         ,  0.         ,  0.         ,  0.        ],
- [ 0.15627693 ,  0.12653933 ,  0.06358578 , -0.07000884 ,  0.         ,  0.         ,  0.        ],
- [-0.04816371 , -0.33771295 , -0.17556093 ,  0.33157308 ,  0.9534713  ,  0.         ,  0.        ],
- [ 0.45943389 ,  1.0558681  ,  0.55987576 , -1.30782124 , -1.14932252 ,  1.38196601 ,  0.        ]
+ [                    0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.39344262295081966,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [  -0.27107040114392034,     0.8782132582867775,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.13937840578904787,    0.40771164275240007,    0.16989108353402377,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.15627693288006392,    0.12653932749772054,    0.06358577926118969,   -0.07000883738895311,
+                       0.,                     0.,                     0.],
+ [ -0.048163709972478645,     -0.337712948179736,   -0.17556093042620258,    0.33157308462821344,
+       0.9534713017001828,                     0.,                     0.],
+ [    0.4594338854620735,      1.055868103410076,     0.5598757558250642,     -1.307821236196301,
+      -1.1493225197510175,     1.3819660112501049,                     0.]
 ]
 
 scheme_data["RK6"]["information"] = "This is the 7 step 6th order RUNGE KUTTA method 7th order accuracy "
@@ -96,59 +108,59 @@ scheme_data["RK6"]["information"] = "This is the 7 step 6th order RUNGE KUTTA me
 
 scheme_data["RK8"] = {}
 scheme_data["RK8"]["rk_substep_fraction"] = np.array([1./20. ,0., 0., 0., 0., 13./180., 1./5., 16./45., 1./5., 13./180., 1./20.]).astype("float64")
+# Full precision (order conditions to roundoff); nodes c2=1/192, c5=13/19,
+# c6=c9=(7-sqrt(21))/14, c7=c10=(7+sqrt(21))/14, c8=1/2, c11=1
 scheme_data["RK8"]["rk_coeff"] = \
 [
-       [  0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  5.20833333e-03,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [ -4.62366395e-01,   5.37169580e-01,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  2.80511943e-02,   0.00000000e+00,   8.41535829e-02,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  8.18978670e+00,   0.00000000e+00,  -2.87750723e+01,
-          2.12694961e+01,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  4.03740608e-02,   0.00000000e+00,   0.00000000e+00,
-          1.32188232e-01,   1.10872008e-04,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  2.58739003e-01,   0.00000000e+00,   0.00000000e+00,
-         -1.07897045e+00,   3.49556838e-01,   1.29800144e+00,
-          0.00000000e+00,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  1.95596959e-01,   0.00000000e+00,   0.00000000e+00,
-         -7.71355141e-01,   8.86776408e-02,   1.01696927e+00,
-         -2.98887262e-02,   0.00000000e+00,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [ -5.64537398e-03,   0.00000000e+00,   0.00000000e+00,
-          3.66641509e-01,  -4.76781447e-02,  -2.20463266e-01,
-          1.38999909e-02,   6.59184499e-02,   0.00000000e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [ -1.61869945e+00,   0.00000000e+00,   0.00000000e+00,
-          8.48593620e+00,  -1.60007462e+00,  -1.67069639e+01,
-          5.67072969e-01,   2.68925147e+00,   9.01080414e+00,
-          0.00000000e+00,   0.00000000e+00],
-       [  8.76517117e-01,   0.00000000e+00,   0.00000000e+00,
-         -4.11389408e+00,   4.72947418e-01,   1.37853746e+01,
-          2.85293485e-02,  -5.92592593e-01,  -9.70629863e+00,
-          2.49416793e-01,   0.00000000e+00]
+ [                    0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [  0.005208333333333333,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   -0.4623663949367181,     0.5371695797321767,                     0.,                     0.,
+                       0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.02805119429829051,                     0.,    0.08415358289491078,                     0.,
+                       0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [       8.1897867016422,                     0.,    -28.775072279669033,     21.269496104342622,
+                       0.,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.04037406081525337,                     0.,                     0.,     0.1321882318223191,
+   0.00011087200843896898,                     0.,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [     0.258739003057159,                     0.,                     0.,    -1.0789704485968163,
+       0.3495568381299592,     1.2980014427636868,                     0.,                     0.,
+                       0.,                     0.,                     0.],
+ [   0.19559695938810606,                     0.,                     0.,    -0.7713551407298975,
+      0.08867764084167037,     1.0169692666685455,  -0.029888726168424425,                     0.,
+                       0.,                     0.,                     0.],
+ [  -0.00564537397993401,                     0.,                     0.,    0.36664150851332367,
+      -0.0476781447329655,   -0.22046326596200055,   0.013899990926682997,    0.06591844988090483,
+                       0.,                     0.,                     0.],
+ [   -1.6186994529881893,                     0.,                     0.,      8.485936199312691,
+      -1.6000746209745065,    -16.706963865871593,     0.5670729686398551,     2.6892514721246816,
+         9.01080413511105,                     0.,                     0.],
+ [    0.8765171167365806,                     0.,                     0.,     -4.113894083892859,
+      0.47294741782224475,      13.78537463158721,   0.028529348484096297,     -0.592592592592603,
+       -9.706298631522243,    0.24941679337757222,                     0.]
 ]
 
-
 scheme_data["RK8"]["information"] = "This is the 11 step 8th order RUNGE KUTTA method 9th order accuracy "
 
 
 
+# Storage form of each scheme:
+#   "Butcher": rk_coeff is the Butcher matrix, rk_substep_fraction the weights
+#   "2R": q_(i+1)=q_i+dt*sum_j(rk_coeff[i][j]*f_j), only f_i and f_(i-1) 
+#   nonzero; rk_substep_fraction is the time increment of each stage
+#   "2N": rk_coeff=[A,B] Williamson form; rk_substep_fraction as in "2R"
+for key in scheme_data.keys():
+    scheme_data[key]["storage"] = "Butcher"
+scheme_data["RK3"]["storage"] = "2R"
+scheme_data["RK4_LOW"]["storage"] = "2N"
+
 class runge_kutta():
     ''' Pass scheme name as a string '''
     def __init__(self, scheme):
@@ -162,6 +174,7 @@ class runge_kutta():
         self.rk_substep_fraction =   scheme_data[self.scheme]["rk_substep_fraction"]
         self.Nk			 =   self.rk_substep_fraction.size	# Total number of steps
         self.rk_coeff 		 =   scheme_data[self.scheme]["rk_coeff"]
+        self.storage		 =   scheme_data[self.scheme]["storage"]
 
     def listSupportedSchemes(self):
         return scheme_data.keys()